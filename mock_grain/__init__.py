@@ -1,14 +1,96 @@
 """A module containing methods involving mock grains, used for parametrization in
-evolutionary algorithms."""
-from grains import *
-from convert_units import *
-from net_to_mesh import *
-
-__all__ = [
-    "Grain2D",
-    "Grain3D",
-    "net_to_2D_mesh",
-    "net_to_3D_mesh",
-    "mm_net_to_inch_net",
-    "mm_mesh_to_inch_mesh",
-]
+evolutionary algorithms.
+
+Names are imported lazily, from the module defining them, the first time they are used,
+so importing mock_grain, as every spawned worker process does, costs next to nothing, and
+using Grain2D only costs the modules it depends on."""
+import importlib
+
+# the module defining each name of the public API
+_MODULES = {
+    "Grain": "grains",
+    "Grain2D": "grains",
+    "Grain3D": "grains",
+    "SymmetricGrain2D": "grains",
+    "IncrementalNet": "incremental_net",
+    "intern_points": "interning",
+    "weld_labels": "interning",
+    "SpatialIndex": "spatial",
+    "net_to_2D_mesh": "net_to_mesh",
+    "net_to_3D_mesh": "net_to_mesh",
+    "mm_net_to_inch_net": "convert_units",
+    "mm_mesh_to_inch_mesh": "convert_units",
+    "convert": "convert_units",
+    "Grain2DBatch": "population",
+    "signed_area": "nets",
+    "is_simple": "nets",
+    "is_valid_net": "nets",
+    "check_nets": "nets",
+    "star_net": "nets",
+    "slot_net": "nets",
+    "finocyl_net": "nets",
+    "douglas_peucker": "simplify",
+    "visvalingam": "simplify",
+    "limit_points": "simplify",
+    "resample": "simplify",
+    "douglas_peucker_batch": "simplify",
+    "visvalingam_batch": "simplify",
+    "limit_points_batch": "simplify",
+    "resample_batch": "simplify",
+    "Regression": "burnback",
+    "Voxels": "voxels",
+    "voxelize": "voxels",
+    "iter_voxels": "voxels",
+    "grid_regression": "burnback",
+    "exact_regression": "burnback",
+    "Regression3D": "burnback3d",
+    "extruded_regression": "burnback3d",
+    "voxel_regression": "burnback3d",
+    "regression_3d": "burnback3d",
+    "PopulationEvaluator": "evaluation",
+    "Tier": "multifidelity",
+    "BurnbackFitness": "multifidelity",
+    "MultiFidelityEvaluator": "multifidelity",
+    "FitnessCache": "cache",
+    "canonical_key": "cache",
+    "Pipeline": "pipeline",
+    "Scored": "pipeline",
+    "StageStats": "pipeline",
+    "OpenMotorExporter": "openmotor",
+    "openmotor_maps": "openmotor",
+    "Archive": "archive",
+    "ArchiveWriter": "archive",
+    "Checkpoint": "checkpoint",
+    "Checkpointer": "checkpoint",
+    "resume": "checkpoint",
+    "Propellant": "ballistics",
+    "Nozzle": "ballistics",
+    "BallisticsResult": "ballistics",
+    "characteristic_velocity": "ballistics",
+    "burn_curve": "ballistics",
+    "simulate": "ballistics",
+    # exposed since the package star-imported grains
+    "InhibitedEnds": "constants",
+    "INCHES_PER_MM": "constants",
+    "Mesh": "mesh",
+    "Net": "typedefs",
+    "Point": "typedefs",
+    "Point2D": "typedefs",
+    "Point3D": "typedefs",
+    "Polygon": "typedefs",
+}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name: str):
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module("." + _MODULES[name], __name__), name)
+    # later lookups find the name directly, without calling __getattr__ again
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULES))
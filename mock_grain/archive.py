@@ -0,0 +1,438 @@
+"""
+A compact, append-only binary archive of evaluated grains, read back through a memory map.
+
+An archive is a file header followed by blocks, each appended whole by one write: a block
+header, then the flat arrays of a run of 2D or of 3D grains, each aligned to 8 bytes. The
+points of 2D grains form one ragged buffer with per grain offsets, as in Grain2DBatch; the
+meshes of 3D grains are ragged vertex and CSR buffers. Every block also has columns for the
+outer diameter, length, inhibited ends and fitness of its grains. A block cut short by a
+crash while it was written is ignored when the archive is read.
+
+Grains are checked when they are appended, so a float64 archive reads them back without
+checking them again. Storing coordinates as float32 rounds them, which can move a point
+beyond the outer radius or the top of a mesh off its length, so grains read from a float32
+archive are snapped back and checked again.
+"""
+import os
+import struct
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .constants import InhibitedEnds
+from .evaluation import concat_ragged
+from .grains import Grain, Grain2D, Grain3D
+from .mesh import Mesh
+from .population import Grain2DBatch
+
+_MAGIC = b"MGRAIN\x00\x01"
+_BLOCK_MAGIC = b"BLK\x00"
+# magic, format version, dtype of coordinates, e.g. b"<f8\x00"
+_HEADER = struct.Struct("<8sI4s")
+# magic, 2 or 3 for the dimension of the grains, number of grains, number of points or
+# vertices, number of mesh indices
+_BLOCK = struct.Struct("<4sB3xQQQ")
+_VERSION = 1
+
+Population = Union[Grain2DBatch, Sequence[Grain]]
+
+
+def _layout(
+    kind: int, count: int, points: int, indices: int, dtype: np.dtype
+) -> List[Tuple[str, Tuple[int, ...], np.dtype]]:
+    """The name, shape and dtype of each array of a block, in order"""
+    i8, f8 = np.dtype("<i8"), np.dtype("<f8")
+    if kind == 2:
+        arrays = [("points", (points, 2), dtype), ("offsets", (count + 1,), i8)]
+    else:
+        arrays = [
+            ("vertices", (points, 3), dtype),
+            ("offsets", (count + 1,), i8),
+            ("indptr", (points + count,), i8),
+            ("indices", (indices,), i8),
+            ("index_offsets", (count + 1,), i8),
+            ("dims", (count,), np.dtype("i1")),
+        ]
+    return arrays + [
+        ("outer", (count,), f8),
+        ("length", (count,), f8),
+        ("inhibited", (count,), np.dtype("i1")),
+        ("fitness", (count,), f8),
+    ]
+
+
+def _padded(nbytes: int) -> int:
+    return -(-nbytes // 8) * 8
+
+
+def _columns(grains: Sequence[Grain], fitness: np.ndarray) -> dict:
+    return {
+        "outer": np.array([g.outer_diameter for g in grains], dtype=np.float64),
+        "length": np.array([g.length for g in grains], dtype=np.float64),
+        "inhibited": np.array([g.inhibited_ends.value for g in grains], dtype=np.int8),
+        "fitness": fitness,
+    }
+
+
+def _runs(population: Sequence[Grain]) -> Iterator[Tuple[int, int, int]]:
+    """The start, stop and dimension of each run of consecutive 2D or 3D grains"""
+    kinds = [3 if isinstance(grain, Grain3D) else 2 for grain in population]
+    start = 0
+    for i in range(1, len(kinds) + 1):
+        if i == len(kinds) or kinds[i] != kinds[start]:
+            yield start, i, kinds[start]
+            start = i
+
+
+def _snapped(points: np.ndarray, outer_rad: np.ndarray) -> np.ndarray:
+    """
+    Points rounded to float32, moved back within their outer radius where rounding moved
+    them beyond it
+
+    :param points: an (N, 2) or (N, 3) float64 array, which is modified
+    :param outer_rad: the outer radius of each point, or of all of them
+    :return: points
+    """
+    radii = np.hypot(points[:, 0], points[:, 1])
+    outer_rad = np.broadcast_to(outer_rad, radii.shape)
+    beyond = radii > outer_rad
+    # a margin of a few ulps keeps the radius computed by the checks of grains within too
+    scale = outer_rad[beyond] / radii[beyond] * (1 - 2**-48)
+    points[beyond, :2] *= scale[:, None]
+    return points
+
+
+def _read_header(path: str) -> np.dtype:
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ValueError(f"{path} is not a grain archive")
+    magic, version, dtype = _HEADER.unpack(header)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"{path} is not a grain archive of version {_VERSION}")
+    return np.dtype(dtype.rstrip(b"\0").decode())
+
+
+class _Block(NamedTuple):
+    kind: int
+    start: int  # index of the first grain of the block in the archive
+    arrays: dict
+
+
+def _scan(
+    path: str, data: np.ndarray, dtype: np.dtype
+) -> Tuple[List[_Block], int, int]:
+    """The complete blocks of an archive, with views of their arrays into data, the bytes
+    of the archive, the number of grains in them and the byte at which the last one ends
+    """
+    blocks: List[_Block] = []
+    position, count = _HEADER.size, 0
+    while position + _BLOCK.size <= len(data):
+        header = data[position : position + _BLOCK.size].tobytes()
+        magic, kind, n, points, indices = _BLOCK.unpack(header)
+        if magic != _BLOCK_MAGIC or kind not in (2, 3):
+            raise ValueError(f"{path} has a corrupt block at byte {position}")
+        offset = position + _BLOCK.size
+        arrays = {}
+        for name, shape, array_dtype in _layout(kind, n, points, indices, dtype):
+            size = int(np.prod(shape)) * array_dtype.itemsize
+            if offset + size > len(data):
+                return blocks, count, position  # the last block was cut short
+            arrays[name] = np.frombuffer(
+                data, array_dtype, int(np.prod(shape)), offset
+            ).reshape(shape)
+            offset += _padded(size)
+        blocks.append(_Block(kind, count, arrays))
+        position, count = offset, count + n
+    return blocks, count, position
+
+
+class ArchiveWriter:
+    """
+    Appends evaluated grains to an archive, creating it if needed; each append is written
+    and flushed as whole blocks, so a reader only ever misses appends still in progress
+    """
+
+    __slots__ = ["__file", "__dtype"]
+
+    def __init__(self, path: str, dtype: Union[str, np.dtype] = np.float64):
+        """
+        Open an archive for appending; an existing archive keeps the type its coordinates
+        were stored as
+
+        :param path: path of the archive
+        :param dtype: float32 or float64, the type coordinates are stored as
+        :raises ValueError: if dtype is neither float32 nor float64, or if the file at path
+                            is not an archive
+        """
+        dtype = np.dtype(dtype).newbyteorder("<")
+        if dtype.kind != "f" or dtype.itemsize not in (4, 8):
+            raise ValueError("Coordinates must be stored as float32 or float64")
+        if os.path.exists(path) and os.path.getsize(path):
+            dtype = _read_header(path)
+            # drop a block cut short by a crash, which appends would otherwise follow
+            data = np.memmap(path, dtype=np.uint8, mode="r")
+            _, _, end = _scan(path, data, dtype)
+            del data
+            if end < os.path.getsize(path):
+                os.truncate(path, end)
+        else:
+            with open(path, "wb") as f:
+                f.write(
+                    _HEADER.pack(_MAGIC, _VERSION, dtype.str.encode().ljust(4, b"\0"))
+                )
+        self.__dtype = dtype
+        self.__file = open(path, "ab")
+
+    def append(self, population: Population, fitness: Optional[Sequence[float]] = None):
+        """
+        Append a population of grains to the archive
+
+        :param population: a population of 2D grains, or a sequence of 2D and 3D grains
+        :param fitness: the fitness of each grain, if known; nan otherwise
+        :raises ValueError: if a member of population is not a Grain2D or Grain3D, if a
+                            grain of a Grain2DBatch violates a constraint of Grain2D, or if
+                            there is not one fitness per grain
+        """
+        count = len(population)
+        if fitness is None:
+            fitness = np.full(count, np.nan)
+        fitness = np.asarray(fitness, dtype=np.float64).ravel()
+        if fitness.size != count:
+            raise ValueError(f"Expected one fitness per grain, got {fitness.size}")
+        if isinstance(population, Grain2DBatch):
+            invalid = np.flatnonzero(~population.valid_mask())
+            if len(invalid):
+                raise ValueError(f"Grain {invalid[0]} violates a constraint of Grain2D")
+            self.__write(
+                2,
+                count,
+                {
+                    "points": population.points,
+                    "offsets": population.offsets,
+                    "outer": population.outer_diameters,
+                    "length": population.lengths,
+                    "inhibited": population.inhibited_ends,
+                    "fitness": fitness,
+                },
+            )
+            self.__file.flush()
+            return
+        if not all(isinstance(g, (Grain2D, Grain3D)) for g in population):
+            raise ValueError(
+                "Every member of the population must be a Grain2D or Grain3D"
+            )
+        for start, stop, kind in _runs(population):
+            grains = population[start:stop]
+            columns = _columns(grains, fitness[start:stop])
+            if kind == 2:
+                points, offsets = concat_ragged(
+                    [
+                        np.asarray(g.net, dtype=np.float64).reshape(-1, 2)
+                        for g in grains
+                    ],
+                    np.float64,
+                    2,
+                )
+                arrays = {"points": points, "offsets": offsets}
+            else:
+                meshes = [g.mesh for g in grains]
+                vertices, offsets = concat_ragged(
+                    [m.vertices for m in meshes], np.float64, 3
+                )
+                indices, index_offsets = concat_ragged(
+                    [m.indices for m in meshes], np.int64
+                )
+                arrays = {
+                    "vertices": vertices,
+                    "offsets": offsets,
+                    "indptr": concat_ragged([m.indptr for m in meshes], np.int64)[0],
+                    "indices": indices,
+                    "index_offsets": index_offsets,
+                    "dims": np.array([m.dim for m in meshes], dtype=np.int8),
+                }
+            self.__write(kind, stop - start, {**arrays, **columns})
+        self.__file.flush()
+
+    def __write(self, kind: int, count: int, arrays: dict):
+        points = len(arrays["points" if kind == 2 else "vertices"])
+        indices = len(arrays["indices"]) if kind == 3 else 0
+        parts = [_BLOCK.pack(_BLOCK_MAGIC, kind, count, points, indices)]
+        for name, shape, dtype in _layout(kind, count, points, indices, self.__dtype):
+            data = np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+            parts.append(data + bytes(_padded(len(data)) - len(data)))
+        self.__file.write(b"".join(parts))
+
+    def close(self):
+        """
+        Close the archive
+        """
+        self.__file.close()
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Archive(Sequence[Grain]):
+    """
+    Reads an archive through a memory map: indexing constructs a single grain from views
+    into the file, and the columns of all grains are read without touching their geometry.
+    Appends made after an archive was opened are seen once it is reopened
+    """
+
+    __slots__ = ["__map", "__blocks", "__starts", "__dtype"]
+
+    def __init__(self, path: str):
+        """
+        Open an archive for reading
+
+        :param path: path of the archive
+        :raises ValueError: if the file at path is not an archive
+        """
+        self.__dtype = _read_header(path)
+        self.__map = np.memmap(path, dtype=np.uint8, mode="r")
+        self.__blocks, count, _ = _scan(path, self.__map, self.__dtype)
+        self.__starts = np.array(
+            [block.start for block in self.__blocks] + [count], dtype=np.int64
+        )
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        :return: the type coordinates are stored as
+        """
+        return self.__dtype
+
+    def __column(self, name: str) -> np.ndarray:
+        if not self.__blocks:
+            return np.empty(0, dtype=np.int8 if name == "inhibited" else np.float64)
+        return np.concatenate([block.arrays[name] for block in self.__blocks])
+
+    @property
+    def fitness(self) -> np.ndarray:
+        """
+        :return: the fitness of every grain, nan where it was not recorded
+        """
+        return self.__column("fitness")
+
+    @property
+    def outer_diameters(self) -> np.ndarray:
+        """
+        :return: the outer diameter of every grain
+        """
+        return self.__column("outer")
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        :return: the length of every grain
+        """
+        return self.__column("length")
+
+    @property
+    def inhibited_ends(self) -> np.ndarray:
+        """
+        :return: the InhibitedEnds value of every grain
+        """
+        return self.__column("inhibited")
+
+    @property
+    def dims(self) -> np.ndarray:
+        """
+        :return: 2 for every 2D grain and 3 for every 3D grain
+        """
+        return np.repeat(
+            [block.kind for block in self.__blocks], np.diff(self.__starts)
+        ).astype(np.int8)
+
+    def __locate(self, i: int) -> Tuple[_Block, int]:
+        if not -len(self) <= i < len(self):
+            raise IndexError("Grain index out of range")
+        i %= len(self)
+        block = self.__blocks[int(np.searchsorted(self.__starts, i, side="right")) - 1]
+        return block, i - block.start
+
+    def net(self, i: int) -> np.ndarray:
+        """
+        :param i: index of a 2D grain in the archive
+        :return: a read-only (N, 2) view of the points of its net, into the file
+        :raises ValueError: if the grain is not a 2D grain
+        """
+        block, j = self.__locate(i)
+        if block.kind != 2:
+            raise ValueError(f"Grain {i} is not a 2D grain")
+        start, stop = block.arrays["offsets"][j : j + 2]
+        return block.arrays["points"][start:stop]
+
+    def __getitem__(self, i: int) -> Grain:
+        """
+        :param i: index of a grain in the archive
+        :return: that grain, constructed from views into the file, without validation if
+                 the archive is float64; the mesh of a 3D grain stored as float64 shares
+                 the memory of the file
+        :raises ValueError: if rounding to float32 left the grain invalid
+        """
+        block, j = self.__locate(i)
+        arrays = block.arrays
+        outer = float(arrays["outer"][j])
+        length = float(arrays["length"][j])
+        inhibited = InhibitedEnds(int(arrays["inhibited"][j]))
+        start, stop = arrays["offsets"][j : j + 2]
+        rounded = self.__dtype.itemsize < 8
+        if block.kind == 2:
+            points = arrays["points"][start:stop].astype(np.float64, copy=False)
+            if rounded:
+                points = _snapped(points, outer / 2)
+            net = list(map(tuple, points.tolist()))
+            if rounded:
+                return Grain2D(outer, length, inhibited, net)
+            return Grain2D.from_trusted(outer, length, inhibited, net)
+        vertices = arrays["vertices"][start:stop].astype(np.float64, copy=False)
+        indptr = arrays["indptr"][start + j : stop + j + 1]
+        index_start, index_stop = arrays["index_offsets"][j : j + 2]
+        indices = arrays["indices"][index_start:index_stop]
+        dim = int(arrays["dims"][j])
+        if not rounded:
+            mesh = Mesh.from_trusted(vertices, indptr, indices, dim)
+            return Grain3D.from_trusted(outer, length, inhibited, mesh)
+        vertices = _snapped(vertices, outer / 2)
+        if dim == 3:
+            top = vertices[:, 2] == np.float32(length)
+            vertices[top, 2] = length
+        mesh = Mesh.from_arrays(vertices[:, :dim], indptr, indices)
+        return Grain3D(outer, length, inhibited, mesh)
+
+    def __len__(self) -> int:
+        return int(self.__starts[-1])
+
+    def batch(self, which: Optional[Sequence[int]] = None) -> Grain2DBatch:
+        """
+        Gather 2D grains of the archive into a population
+
+        :param which: indices of the grains to gather, by default every 2D grain
+        :return: the population of those grains, in order
+        :raises ValueError: if a selected grain is not a 2D grain
+        """
+        if which is None:
+            which = np.flatnonzero(self.dims == 2)
+        nets = [self.net(int(i)) for i in which]
+        counts = [len(net) for net in nets]
+        offsets = np.zeros(len(nets) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        points = np.concatenate(nets) if nets else np.empty((0, 2))
+        points = points.astype(np.float64)
+        which = np.asarray(which, dtype=np.int64)
+        if self.__dtype.itemsize < 8:
+            points = _snapped(
+                points, np.repeat(self.outer_diameters[which] / 2, counts)
+            )
+        return Grain2DBatch.from_arrays(
+            points,
+            offsets,
+            self.outer_diameters[which],
+            self.lengths[which],
+            self.inhibited_ends[which],
+        )
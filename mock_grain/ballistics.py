@@ -0,0 +1,260 @@
+"""
+A lumped-parameter internal ballistics simulator, for thrust curves of whole populations.
+
+Every motor is a stack of grains burning in one chamber at one pressure, so every grain of
+a stack regresses by the same web. The chamber pressure is quasi-steady: at each instant the
+propellant burnt balances the flow through the throat, which gives the pressure from the
+ratio of the burning area to the throat area, Kn, as
+
+    P = (Kn * a * density * c*) ** (1 / (1 - n))
+
+for a burn rate r = a * P ** n. The web each motor has burnt is integrated through time by
+a single loop of fixed time steps, vectorized across every motor, with the burning area of
+each interpolated from the regression of its grains at the web it has reached. Grains are
+only burnt back once per distinct geometry, however many stacks or motors they are part
+of, by their canonical_key.
+"""
+import math
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from . import instrumentation
+from .burnback3d import Regression3D, extrude, regression_3d
+from .cache import canonical_key
+from .convert_units import scale_factor
+from .grains import Grain, Grain2D
+from .population import Grain2DBatch
+
+# the unit of the geometry of grains and nozzles; the simulation itself is in SI units
+_UNIT = "in"
+_GAS_CONSTANT = 8.314462618  # J/(mol K)
+
+Stack = Union[Grain, Sequence[Grain]]
+Motors = Union[Grain2DBatch, Sequence[Stack]]
+
+
+class Propellant(NamedTuple):
+    """The properties of a propellant, in SI units"""
+
+    density: float  # kg/m^3
+    a: float  # burn rate coefficient, in m/s at 1 Pa
+    n: float  # burn rate exponent, less than 1
+    gamma: float  # ratio of specific heats of the exhaust
+    temperature: float  # combustion temperature, in K
+    molar_mass: float  # molar mass of the exhaust, in kg/mol
+
+
+class Nozzle(NamedTuple):
+    """A nozzle, with diameters in the units of grains"""
+
+    throat_diameter: float
+    exit_diameter: float
+    efficiency: float = 1.0  # fraction of the ideal thrust delivered
+
+
+class BallisticsResult(NamedTuple):
+    """The simulated performance of each of a set of motors"""
+
+    time: np.ndarray  # (T,) time at each step, in s
+    pressure: np.ndarray  # (M, T) chamber pressure of each motor at each step, in Pa
+    thrust: np.ndarray  # (M, T) thrust of each motor at each step, in N
+    burn_time: np.ndarray  # (M,) time at which each motor burnt out, or nan if it did not
+    total_impulse: np.ndarray  # (M,) impulse of each motor, in N s
+    peak_pressure: np.ndarray  # (M,) greatest chamber pressure of each motor, in Pa
+
+
+def characteristic_velocity(propellant: Propellant) -> float:
+    """
+    :param propellant: the propellant
+    :return: the ideal characteristic velocity c* of its exhaust, in m/s
+    """
+    k = propellant.gamma
+    gas = _GAS_CONSTANT / propellant.molar_mass
+    return math.sqrt(gas * propellant.temperature / k) / (2 / (k + 1)) ** (
+        (k + 1) / (2 * (k - 1))
+    )
+
+
+def _exit_pressure_ratio(expansion: np.ndarray, k: float) -> np.ndarray:
+    """The ratio of exit to chamber pressure of ideal nozzles of given expansion ratios"""
+    # the supersonic Mach number whose area ratio is the expansion ratio, by bisection,
+    # as the area ratio increases with the Mach number above 1
+    low = np.ones_like(expansion)
+    high = np.full_like(expansion, 100.0)
+    for _ in range(60):
+        mach = (low + high) / 2
+        ratio = ((2 + (k - 1) * mach**2) / (k + 1)) ** (
+            (k + 1) / (2 * (k - 1))
+        ) / mach
+        below = ratio < expansion
+        low = np.where(below, mach, low)
+        high = np.where(below, high, mach)
+    mach = (low + high) / 2
+    return (1 + (k - 1) / 2 * mach**2) ** (-k / (k - 1))
+
+
+def burn_curve(
+    grain: Grain, resolution: int = 256, web_steps: int = 100, method: str = "grid"
+) -> Regression3D:
+    """
+    Compute the burning area of a grain as its surface regresses, in the units of the grain
+
+    :param grain: the grain
+    :param resolution: number of cells along the outer diameter
+    :param web_steps: number of evenly spaced web distances, from 0 to burnout, to sample
+    :param method: "grid" for a 2D grain, which is always rasterized; for a 3D grain, as
+                   for regression_3d, with "grid" meaning "auto"
+    :return: the port volume and burning area at each sampled web distance
+    :raises ValueError: if method is unknown
+    """
+    if isinstance(grain, Grain2D):
+        if method != "grid":
+            raise ValueError(f"Unknown burnback method for a 2D grain: {method}")
+        flat = grain.burnback(resolution, web_steps)
+        return extrude(
+            flat, grain.outer_diameter, grain.length, grain.inhibited_ends, web_steps
+        )
+    if method == "grid":
+        method = "auto"
+    return regression_3d(grain, resolution, web_steps, method)
+
+
+def _stacks(motors: Motors) -> List[List[Grain]]:
+    if isinstance(motors, Grain2DBatch):
+        return [[motors[i]] for i in range(len(motors))]
+    return [[motor] if isinstance(motor, Grain) else list(motor) for motor in motors]
+
+
+def _nozzles(nozzle: Union[Nozzle, Sequence[Nozzle]], count: int) -> np.ndarray:
+    """The throat diameter, exit diameter and efficiency of the nozzle of every motor"""
+    if isinstance(nozzle, Nozzle):
+        nozzle = [nozzle] * count
+    nozzles = np.array(nozzle, dtype=np.float64).reshape(-1, 3)
+    if len(nozzles) != count:
+        raise ValueError(f"Expected one nozzle per motor, got {len(nozzles)}")
+    if np.any(nozzles[:, 0] <= 0) or np.any(nozzles[:, 1] < nozzles[:, 0]):
+        raise ValueError("Nozzles must have a positive throat no wider than their exit")
+    return nozzles
+
+
+@instrumentation.timed()
+def simulate(
+    motors: Motors,
+    propellant: Propellant,
+    nozzle: Union[Nozzle, Sequence[Nozzle]],
+    dt: float = 1e-3,
+    max_time: float = 30.0,
+    ambient_pressure: float = 101325.0,
+    resolution: int = 256,
+    web_steps: int = 100,
+    method: str = "grid",
+    curves: Optional[Dict[str, Regression3D]] = None,
+) -> BallisticsResult:
+    """
+    Simulate the chamber pressure and thrust of a set of motors through time, all at once
+
+    :param motors: the motors, each a grain or a stack of grains burning in one chamber;
+                   a Grain2DBatch is a set of motors of one grain each
+    :param propellant: the propellant of every grain
+    :param nozzle: the nozzle of every motor, or of each motor in order
+    :param dt: the time step, in s
+    :param max_time: the time after which motors which have not burnt out are cut off
+    :param ambient_pressure: the pressure outside the nozzle, in Pa
+    :param resolution: number of cells along the outer diameter, as for burn_curve
+    :param web_steps: number of web distances at which each grain is burnt back, and each
+                      stack sampled
+    :param method: the burnback method, as for burn_curve
+    :param curves: if provided, the burn curves of grains by canonical_key, read from and
+                   added to, so that grains simulated again are not burnt back again
+    :return: the simulated performance of every motor
+    :raises ValueError: if a motor has no grains, there is not one nozzle per motor, a
+                        nozzle is invalid, the burn rate exponent is not less than 1, or
+                        dt or max_time is not positive
+    """
+    stacks = _stacks(motors)
+    if any(not stack for stack in stacks):
+        raise ValueError("Every motor must have at least one grain")
+    if not propellant.n < 1:
+        raise ValueError("Must have a burn rate exponent less than 1")
+    if dt <= 0 or max_time <= 0:
+        raise ValueError("Must have a positive time step and maximum time")
+    nozzles = _nozzles(nozzle, len(stacks))
+    if curves is None:
+        curves = {}
+    factor = scale_factor(_UNIT, "m")
+
+    # the burning area of every stack, in m^2, at web_steps webs from 0 to its burnout
+    areas = np.zeros((len(stacks), web_steps))
+    burnout = np.zeros(len(stacks))
+    for m, stack in enumerate(stacks):
+        regressions = []
+        for grain in stack:
+            key = canonical_key(grain)
+            if key not in curves:
+                curves[key] = burn_curve(grain, resolution, web_steps, method)
+                instrumentation.count("burn_curves")
+            regressions.append(curves[key])
+        burnout[m] = max(r.web[-1] for r in regressions) * factor
+        web = np.linspace(0, burnout[m], web_steps)
+        for r in regressions:
+            # a grain which has burnt out before the rest of its stack has no area left
+            areas[m] += np.interp(web, r.web * factor, r.burning_area, right=0)
+        areas[m] *= factor**2
+    if np.any(burnout <= 0):
+        raise ValueError("Every motor must have propellant to burn")
+
+    k = propellant.gamma
+    c_star = characteristic_velocity(propellant)
+    throat = np.pi * (nozzles[:, 0] * factor) ** 2 / 4
+    expansion = (nozzles[:, 1] / nozzles[:, 0]) ** 2
+    exit_ratio = _exit_pressure_ratio(expansion, k)
+    # the momentum thrust coefficient, and the pressure thrust coefficient per unit of
+    # chamber pressure, which do not depend on the chamber pressure
+    momentum = np.sqrt(
+        2
+        * k**2
+        / (k - 1)
+        * (2 / (k + 1)) ** ((k + 1) / (k - 1))
+        * (1 - exit_ratio ** ((k - 1) / k))
+    )
+    pressure_coefficient = (momentum + exit_ratio * expansion) * throat * nozzles[:, 2]
+    ambient_thrust = ambient_pressure * expansion * throat * nozzles[:, 2]
+    gain = propellant.a * propellant.density * c_star / throat
+    exponent = 1 / (1 - propellant.n)
+
+    steps = int(math.ceil(max_time / dt))
+    rows = np.arange(len(stacks))
+    scale = (web_steps - 1) / burnout
+    pressure = np.full((len(stacks), steps), float(ambient_pressure))
+    thrust = np.zeros((len(stacks), steps))
+    burn_time = np.full(len(stacks), np.nan)
+    web = np.zeros(len(stacks))
+    burning = np.ones(len(stacks), dtype=bool)
+    step = 0
+    while step < steps and burning.any():
+        position = np.minimum(web * scale, web_steps - 1)
+        i = np.minimum(position.astype(np.intp), web_steps - 2)
+        area = areas[rows, i] + (position - i) * (areas[rows, i + 1] - areas[rows, i])
+        p = np.maximum((gain * area) ** exponent, ambient_pressure)
+        p = np.where(burning, p, ambient_pressure)
+        pressure[:, step] = p
+        thrust[:, step] = np.where(
+            burning, np.maximum(pressure_coefficient * p - ambient_thrust, 0), 0
+        )
+        web += np.where(burning, propellant.a * p**propellant.n * dt, 0)
+        step += 1
+        done = burning & (web >= burnout)
+        burn_time[done] = step * dt
+        burning &= ~done
+
+    pressure, thrust = pressure[:, :step], thrust[:, :step]
+    instrumentation.count("ballistics_steps", step)
+    return BallisticsResult(
+        time=np.arange(step) * dt,
+        pressure=pressure,
+        thrust=thrust,
+        burn_time=burn_time,
+        total_impulse=thrust.sum(axis=1) * dt,
+        peak_pressure=pressure.max(axis=1, initial=ambient_pressure),
+    )
@@ -0,0 +1,307 @@
+"""
+Benchmarks of the hot paths of mock_grain, from constructing single meshes and grains to
+evaluating whole populations, written to JSON so results can be compared across releases.
+
+Import times are measured on request, with --imports, as the cold start of a fresh
+interpreter importing mock_grain, as a worker spawned by a PopulationEvaluator does.
+
+Run from the root of the repository:
+
+    python -m mock_grain.benchmarks run --out results.json [--sizes 10 100] [--repeat 5]
+    python -m mock_grain.benchmarks compare old.json new.json [--threshold 0.1]
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from . import convert_units
+from . import net_to_mesh
+from . import nets
+from .burnback import grid_regression
+from .constants import InhibitedEnds
+from .evaluation import PopulationEvaluator
+from .grains import Grain, Grain2D, Grain3D
+from .mesh import Mesh
+from .population import Grain2DBatch
+
+SIZES = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+SHAPES: Dict[str, Callable[..., list]] = {
+    "star": nets.star_net,
+    "slot": nets.slot_net,
+    "finocyl": nets.finocyl_net,
+}
+SEED = 0
+# population evaluation is benchmarked on this many grains of at most this many points
+POPULATION = 64
+POPULATION_MAX_SIZE = 1_000
+# the code run by each import time benchmark, in a fresh interpreter
+IMPORTS = {
+    "import_python": "pass",
+    "import_package": "import mock_grain",
+    "import_grain2d": "from mock_grain import Grain2D",
+    "import_all": "import mock_grain\nfor name in mock_grain.__all__:\n"
+    "    getattr(mock_grain, name)",
+    "spawn_workers": "from mock_grain import Grain2D, PopulationEvaluator, star_net\n"
+    "from mock_grain import InhibitedEnds, benchmarks\n"
+    "grain = Grain2D(4, 10, InhibitedEnds.BOTH, star_net(10))\n"
+    "with PopulationEvaluator(benchmarks.population_fitness, 2, 1, 'spawn') as e:\n"
+    "    e.evaluate([grain, grain])",
+}
+
+
+class Result(NamedTuple):
+    """The best time of a benchmark over several repeats"""
+
+    name: str
+    shape: str
+    size: int  # number of vertices of each net or mesh
+    seconds: float  # best time of a single run
+    repeat: int  # number of runs the best time was taken over
+
+
+def _time(run: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def population_fitness(grain: Grain) -> float:
+    """A fitness representative of real use: the mean burning perimeter of a 2D grain"""
+    regression = grid_regression(grain.net, grain.outer_diameter, 100, 20)
+    return float(np.mean(regression.perimeter))
+
+
+def _cases(
+    shape: str, size: int, evaluator: PopulationEvaluator
+) -> Dict[str, Callable[[], Callable]]:
+    """
+    The benchmarks of one net shape and size, each as a function building its inputs,
+    outside of timing, and returning the function to time. Inputs are only built for the
+    benchmarks which are run, and those shared between benchmarks only once
+    """
+
+    @functools.lru_cache(maxsize=None)
+    def net():
+        return SHAPES[shape](size, jitter=0.01, seed=SEED)
+
+    @functools.lru_cache(maxsize=None)
+    def mesh_3d():
+        return net_to_mesh.net_to_3D_mesh(net(), 10)
+
+    def mesh_init():
+        n = net()
+        mapping = {n[i]: {n[i - 1], n[(i + 1) % size]} for i in range(size)}
+        return functools.partial(Mesh, mapping)
+
+    def population_evaluate():
+        population = Grain2DBatch(
+            [
+                SHAPES[shape](size, jitter=0.05, seed=SEED + i)
+                for i in range(POPULATION)
+            ],
+            4,
+            10,
+            InhibitedEnds.BOTH,
+        )
+        return functools.partial(evaluator.evaluate, population)
+
+    cases = {
+        "mesh_init": mesh_init,
+        "net_to_2D_mesh": lambda: functools.partial(net_to_mesh.net_to_2D_mesh, net()),
+        "net_to_3D_mesh": lambda: functools.partial(
+            net_to_mesh.net_to_3D_mesh, net(), 10
+        ),
+        "mm_mesh_to_inch_mesh": lambda: functools.partial(
+            convert_units.mm_mesh_to_inch_mesh, mesh_3d()
+        ),
+        "grain2d_init": lambda: functools.partial(
+            Grain2D, 4, 10, InhibitedEnds.BOTH, net()
+        ),
+        "grain3d_init": lambda: functools.partial(
+            Grain3D, 4, 10, InhibitedEnds.BOTH, mesh_3d()
+        ),
+        "is_simple": lambda: functools.partial(nets.is_simple, net()),
+    }
+    if size <= POPULATION_MAX_SIZE:
+        cases["population_evaluate"] = population_evaluate
+    return cases
+
+
+def _cold_start(code: str, repeat: int) -> float:
+    """The best time of a fresh interpreter running code, with mock_grain importable"""
+    parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return _time(
+        lambda: subprocess.run(
+            [sys.executable, "-c", code], cwd=parent, check=True, capture_output=True
+        ),
+        repeat,
+    )
+
+
+def import_times(
+    repeat: int = 5, names: Optional[Sequence[str]] = None
+) -> List[Result]:
+    """
+    Run the import time benchmarks
+
+    :param repeat: number of runs of each benchmark to take the best time of
+    :param names: names of the benchmarks to run, from IMPORTS, by default all of them
+    :return: the result of every benchmark, with the shape "import" and size 0
+    """
+    return [
+        Result(name, "import", 0, _cold_start(code, repeat), repeat)
+        for name, code in IMPORTS.items()
+        if names is None or name in names
+    ]
+
+
+def run(
+    sizes: Iterable[int] = SIZES,
+    shapes: Iterable[str] = tuple(SHAPES),
+    repeat: int = 5,
+    names: Optional[Sequence[str]] = None,
+    workers: Optional[int] = None,
+    imports: bool = False,
+) -> List[Result]:
+    """
+    Run the benchmarks
+
+    :param sizes: numbers of vertices of the benchmarked nets
+    :param shapes: shapes of the benchmarked nets, from SHAPES
+    :param repeat: number of runs of each benchmark to take the best time of
+    :param names: names of the benchmarks to run, by default all of them
+    :param workers: number of worker processes evaluating populations, by default one
+                    per CPU
+    :param imports: whether to also run the import time benchmarks, which start fresh
+                    interpreters and are not affected by sizes and shapes
+    :return: the result of every benchmark
+    :raises ValueError: if a shape is unknown
+    """
+    for shape in shapes:
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown shape {shape!r}, expected one of {list(SHAPES)}")
+    results = []
+    with PopulationEvaluator(population_fitness, workers) as evaluator:
+        for shape in shapes:
+            for size in sizes:
+                for name, build in _cases(shape, size, evaluator).items():
+                    if names is None or name in names:
+                        seconds = _time(build(), repeat)
+                        results.append(Result(name, shape, size, seconds, repeat))
+    if imports:
+        results += import_times(repeat, names)
+    return results
+
+
+def to_json(results: Sequence[Result]) -> dict:
+    """
+    :param results: results of run
+    :return: the results, with a description of the machine they were measured on
+    """
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": SEED,
+        },
+        "results": [result._asdict() for result in results],
+    }
+
+
+class Change(NamedTuple):
+    """The change in time of one benchmark between two sets of results"""
+
+    name: str
+    shape: str
+    size: int
+    old: float
+    new: float
+    ratio: float  # new time / old time
+    regression: bool  # whether the benchmark got slower by more than the threshold
+
+
+def compare(old: dict, new: dict, threshold: float = 0.1) -> List[Change]:
+    """
+    Compare two sets of results, as produced by to_json
+
+    :param old: the results to compare against
+    :param new: the results to compare
+    :param threshold: the relative slowdown past which a benchmark is a regression
+    :return: the change of every benchmark present in both sets of results
+    """
+
+    def keyed(results):
+        return {(r["name"], r["shape"], r["size"]): r["seconds"] for r in results}
+
+    before, after = keyed(old["results"]), keyed(new["results"])
+    changes = []
+    for key in sorted(before.keys() & after.keys()):
+        ratio = after[key] / before[key] if before[key] else float("inf")
+        changes.append(
+            Change(*key, before[key], after[key], ratio, ratio > 1 + threshold)
+        )
+    return changes
+
+
+def _main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--out", help="file to write results to, else stdout")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    run_parser.add_argument("--shapes", nargs="+", default=list(SHAPES))
+    run_parser.add_argument("--names", nargs="+", help="benchmarks to run")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--workers", type=int)
+    run_parser.add_argument(
+        "--imports", action="store_true", help="also run the import time benchmarks"
+    )
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(
+            args.sizes, args.shapes, args.repeat, args.names, args.workers, args.imports
+        )
+        for r in results:
+            print(
+                f"{r.name:>22} {r.shape:>8} {r.size:>8} {r.seconds:12.6f}s",
+                file=sys.stderr,
+            )
+        output = json.dumps(to_json(results), indent=2)
+        if args.out:
+            with open(args.out, "w") as f:
+                f.write(output)
+        else:
+            print(output)
+        return 0
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    changes = compare(old, new, args.threshold)
+    for c in changes:
+        flag = "REGRESSION" if c.regression else ""
+        print(f"{c.name:>22} {c.shape:>8} {c.size:>8} {c.ratio:8.2f}x {flag}")
+    return 1 if any(c.regression for c in changes) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,802 @@
+"""Functions for simulating the burnback (regression) of the burning surface of 2D grains"""
+from typing import NamedTuple
+
+import numpy as np
+
+from .typedefs import Net
+
+# pieces of a burning surface shorter than this fraction of the outer radius are left by
+# rounding, not burning
+_SLIVER = 1e-7
+
+
+class RegressionMap(NamedTuple):
+    """A rasterized cross-section of a grain and its distance-to-burning-surface field"""
+
+    cell_size: float  # side length of a grid cell, in the units of the net
+    port: np.ndarray  # (res, res) boolean mask of the cells inside the net
+    inside: np.ndarray  # (res, res) boolean mask of the cells inside the outer diameter
+    distance: np.ndarray  # (res, res) web at which each cell starts burning; 0 in the port
+
+
+class Regression(NamedTuple):
+    """The port area and burning perimeter of a 2D grain as its burning surface regresses"""
+
+    web: np.ndarray  # distance regressed by the burning surface
+    port_area: np.ndarray  # area of the port at each web distance
+    perimeter: np.ndarray  # length of the burning surface at each web distance
+
+
+def rasterize_port(net: Net, outer_diameter: float, resolution: int) -> np.ndarray:
+    """
+    Rasterize a net onto a square grid spanning the outer diameter of a grain
+
+    :param net: the net to rasterize, centered at (0, 0)
+    :param outer_diameter: outer diameter of the grain, in the units of the net
+    :param resolution: number of cells along each side of the grid
+    :return: a (resolution, resolution) boolean mask, indexed [row (y), column (x)], of the
+             cells whose centers are inside the net, by the even-odd rule
+    """
+    outer_rad = outer_diameter / 2
+    cell = outer_diameter / resolution
+    toggles = np.zeros((resolution, resolution + 1), dtype=np.int8)
+    pts = np.asarray(net, dtype=np.float64).reshape(-1, 2)
+    if len(pts) >= 3:
+        a, b = pts, np.roll(pts, -1, axis=0)
+        lo, hi = np.minimum(a[:, 1], b[:, 1]), np.maximum(a[:, 1], b[:, 1])
+        # an edge crosses rows whose centers y satisfy lo <= y < hi
+        first = np.ceil((lo + outer_rad) / cell - 0.5).astype(np.int64)
+        last = np.ceil((hi + outer_rad) / cell - 0.5).astype(np.int64)
+        first, last = np.clip(first, 0, resolution), np.clip(last, 0, resolution)
+        counts = np.maximum(last - first, 0)
+        edge = np.repeat(np.arange(len(pts)), counts)
+        start = np.repeat(np.cumsum(counts) - counts, counts)
+        rows = np.repeat(first, counts) + np.arange(counts.sum()) - start
+        y = (rows + 0.5) * cell - outer_rad
+        ea, eb = a[edge], b[edge]
+        x = ea[:, 0] + (y - ea[:, 1]) * (eb[:, 0] - ea[:, 0]) / (eb[:, 1] - ea[:, 1])
+        # toggle every cell whose center is right of the crossing
+        cols = np.floor((x + outer_rad) / cell - 0.5).astype(np.int64) + 1
+        np.add.at(toggles, (rows, np.clip(cols, 0, resolution)), 1)
+    return (np.cumsum(toggles[:, :-1], axis=1) & 1).astype(bool)
+
+
+def lower_envelope(f: np.ndarray) -> np.ndarray:
+    """
+    Compute min over q of f[:, q] + (x - q) ** 2 for every x along each row of f: the 1D
+    squared distance transform of Felzenszwalb and Huttenlocher, run on all rows in lockstep
+
+    :param f: (rows, n) squared distances, in cells, along each row
+    :return: (rows, n) the squared distance transform of each row
+    """
+    n_rows, n = f.shape
+    r = np.arange(n_rows)
+    # entry k of the envelope of row i is stored at k * n_rows + i
+    h = np.ascontiguousarray((f + np.arange(n) ** 2.0).T)
+    v = np.zeros(n * n_rows)  # abscissae of the envelope's parabolas
+    hv = np.empty(n * n_rows)  # heights at x = 0 of the envelope's parabolas
+    hv[:n_rows] = h[0]
+    bnd = np.empty(n * n_rows)  # abscissae where the envelope's parabolas become lowest
+    bnd[:n_rows] = -np.inf
+    top = r.copy()
+    for q in range(1, n):
+        hq = h[q]
+        s = (hq - hv[top]) / (2 * (q - v[top]))
+        rows = r[s <= bnd[top]]
+        while len(rows):  # pop parabolas hidden by the one at q
+            top[rows] -= n_rows
+            i = top[rows]
+            s_pop = (hq[rows] - hv[i]) / (2 * (q - v[i]))
+            s[rows] = s_pop
+            rows = rows[s_pop <= bnd[i]]
+        top += n_rows
+        v[top] = q
+        hv[top] = hq
+        bnd[top] = s
+    # count the boundaries left of each x to find the parabola lowest there
+    first = np.floor(bnd[n_rows:].reshape(n - 1, n_rows)) + 1
+    first[np.arange(1, n)[:, None] > top // n_rows] = n
+    first = np.clip(first, 0, n).astype(np.int64) + r * (n + 1)
+    marks = np.bincount(first.ravel(), minlength=n_rows * (n + 1))
+    slots = np.cumsum(marks.reshape(n_rows, n + 1)[:, :n], axis=1) * n_rows + r[:, None]
+    vs = v[slots]
+    return (np.arange(n) - vs) ** 2 + hv[slots] - vs * vs
+
+
+def squared_distance_transform(features: np.ndarray) -> np.ndarray:
+    """
+    Compute the exact squared Euclidean distance transform of a 2D boolean mask
+
+    :param features: a 2D boolean mask of feature cells
+    :return: the squared distance, in cells, from every cell to the nearest feature cell;
+             inf everywhere if there are no feature cells
+    """
+    n_rows, n_cols = features.shape
+    if not features.any():
+        return np.full(features.shape, np.inf)
+    # vertical distance to the nearest feature within each column
+    i = np.arange(n_rows)[:, None]
+    above = np.maximum.accumulate(np.where(features, i, -2 * n_rows), axis=0)
+    below = np.minimum.accumulate(np.where(features, i, 3 * n_rows)[::-1], axis=0)[::-1]
+    g = np.minimum(i - above, below - i).astype(np.float64)
+    # columns without features are finite but further than any real feature
+    return lower_envelope(g**2)
+
+
+def regression_map(net: Net, outer_diameter: float, resolution: int) -> RegressionMap:
+    """
+    Rasterize the cross-section of a grain and compute the web at which each cell of
+    propellant starts burning
+
+    :param net: the net representing the port of the grain, centered at (0, 0)
+    :param outer_diameter: outer diameter of the grain, in the units of the net
+    :param resolution: number of cells along each side of the grid
+    :return: the regression map of the grain; cells outside the outer diameter are inf
+    """
+    cell = outer_diameter / resolution
+    centers = (np.arange(resolution) + 0.5) * cell - outer_diameter / 2
+    inside = centers[:, None] ** 2 + centers[None, :] ** 2 <= (outer_diameter / 2) ** 2
+    port = rasterize_port(net, outer_diameter, resolution) & inside
+    # the burning surface lies on the boundary between port and propellant cells: half a
+    # cell short of the center of the nearest port cell
+    distance = np.sqrt(squared_distance_transform(port))
+    distance = np.maximum(distance - 0.5, 0) * cell
+    distance[port] = 0
+    distance[~inside] = np.inf
+    return RegressionMap(cell, port, inside, distance)
+
+
+def regression_from_map(regression: RegressionMap, web_steps: int = 100) -> Regression:
+    """
+    Compute the port area and burning perimeter of a rasterized grain as it regresses
+
+    :param regression: the regression map of the grain
+    :param web_steps: number of evenly spaced web distances, from 0 to burnout, to sample
+    :return: the port area and burning perimeter at each sampled web distance; the
+             perimeter is the derivative of port area with respect to web, taken over a
+             window a few cells wide
+    """
+    cell_area = regression.cell_size**2
+    webs = np.sort(regression.distance[regression.inside & ~regression.port])
+    webs = webs[np.isfinite(webs)]
+    burnout = webs[-1] if len(webs) else 0.0
+    initial = np.count_nonzero(regression.port)
+
+    def area(w):
+        return (initial + np.searchsorted(webs, w, side="right")) * cell_area
+
+    web = np.linspace(0, burnout, web_steps)
+    port_area = area(web)
+    # differentiate over a window of a few cells to smooth out rasterization noise
+    half_width = max(2 * regression.cell_size, burnout / max(web_steps - 1, 1) / 2)
+    lo = np.maximum(web - half_width, 0)
+    hi = np.minimum(web + half_width, burnout)
+    perimeter = np.zeros(web_steps)
+    span = hi > lo
+    perimeter[span] = (area(hi[span]) - area(lo[span])) / (hi[span] - lo[span])
+    return Regression(web, port_area, perimeter)
+
+
+def grid_regression(
+    net: Net, outer_diameter: float, resolution: int = 500, web_steps: int = 100
+) -> Regression:
+    """
+    Compute the port area and burning perimeter of a 2D grain as it regresses, by
+    rasterizing its cross-section and computing a distance-to-burning-surface field
+
+    :param net: the net representing the port of the grain, centered at (0, 0)
+    :param outer_diameter: outer diameter of the grain, in the units of the net
+    :param resolution: number of cells along each side of the grid
+    :param web_steps: number of evenly spaced web distances, from 0 to burnout, to sample
+    :return: the port area and burning perimeter at each sampled web distance
+    """
+    return regression_from_map(
+        regression_map(net, outer_diameter, resolution), web_steps
+    )
+
+
+class _Polygon(NamedTuple):
+    """A counterclockwise polygon, with the convex vertices its offsets round off"""
+
+    a: np.ndarray  # (n, 2) start of each edge
+    d: np.ndarray  # (n, 2) direction of each edge, end minus start
+    length: np.ndarray  # (n,) length of each edge
+    normal: np.ndarray  # (n, 2) outward unit normal of each edge
+    corner: np.ndarray  # (m, 2) convex vertices
+    vertex: np.ndarray  # (m,) index of each convex vertex among the points
+    start: np.ndarray  # (m,) angle of the outward normal of the edge entering each corner
+    span: np.ndarray  # (m,) exterior angle turned through at each corner
+
+
+def _shoelace(pts: np.ndarray) -> float:
+    """Find the signed area of a polygon, positive if it is counterclockwise"""
+    x, y = pts[:, 0], pts[:, 1]
+    return float(np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)) / 2
+
+
+def _polygon(net: Net) -> _Polygon:
+    """Orient a net counterclockwise, dropping repeated points, and find its corners"""
+    pts = np.asarray(net, dtype=np.float64).reshape(-1, 2)
+    pts = pts[np.any(pts != np.roll(pts, 1, axis=0), axis=1)]
+    if _shoelace(pts) < 0:
+        pts = pts[::-1]
+    d = np.roll(pts, -1, axis=0) - pts
+    length = np.hypot(d[:, 0], d[:, 1])
+    normal = np.stack([d[:, 1], -d[:, 0]], axis=1) / length[:, None]
+    d_in = np.roll(d, 1, axis=0)
+    cross = d_in[:, 0] * d[:, 1] - d_in[:, 1] * d[:, 0]
+    dot = np.sum(d_in * d, axis=1)
+    convex = cross > 0
+    n_in = np.roll(normal, 1, axis=0)[convex]
+    return _Polygon(
+        pts,
+        d,
+        length,
+        normal,
+        pts[convex],
+        np.flatnonzero(convex),
+        np.arctan2(n_in[:, 1], n_in[:, 0]),
+        np.arctan2(cross, dot)[convex],
+    )
+
+
+def _symmetric(net: Net, order: int) -> bool:
+    """
+    Whether a net is made of order copies of its first len(net) / order points, each
+    rotated by 1 / order of a turn about (0, 0) from the last
+    """
+    pts = np.asarray(net, dtype=np.float64).reshape(-1, 2)
+    if order < 1 or len(pts) % order:
+        return False
+    turn = 2 * np.pi / order
+    rotation = np.array([[np.cos(turn), np.sin(turn)], [-np.sin(turn), np.cos(turn)]])
+    scale = np.max(np.abs(pts), initial=0)
+    return np.allclose(
+        pts @ rotation,
+        np.roll(pts, -len(pts) // order, axis=0),
+        rtol=0,
+        atol=1e-9 * scale,
+    )
+
+
+def _quadratic_roots(a, b, c):
+    disc = np.sqrt(np.where(b * b >= 4 * a * c, b * b - 4 * a * c, np.nan))
+    return (-b - disc) / (2 * a), (-b + disc) / (2 * a)
+
+
+def _cos_roots(phase, c):
+    """Solve cos(theta - phase) == c for theta, giving nan where there is no solution"""
+    offset = np.arccos(np.where(np.abs(c) <= 1, c, np.nan))
+    return phase - offset, phase + offset
+
+
+def _unit(angle: np.ndarray) -> np.ndarray:
+    return np.stack([np.cos(angle), np.sin(angle)], -1)
+
+
+def _to_segments(p: np.ndarray, a: np.ndarray, d: np.ndarray) -> np.ndarray:
+    """Find the squared distance from every point of p to the segment from a to a + d"""
+    rel = p - a
+    length = np.maximum(np.sum(d * d, -1), np.finfo(np.float64).tiny)
+    t = np.clip(np.sum(rel * d, -1) / length, 0, 1)
+    off = rel - t[..., None] * d
+    return np.sum(off * off, -1)
+
+
+def _between_segments(a0, d0, a1, d1) -> np.ndarray:
+    """Find the distance between every segment from a0 to a0 + d0 and from a1 to a1 + d1"""
+    ends = np.minimum.reduce(
+        [
+            _to_segments(a0, a1, d1),
+            _to_segments(a0 + d0, a1, d1),
+            _to_segments(a1, a0, d0),
+            _to_segments(a1 + d1, a0, d0),
+        ]
+    )
+
+    def cross(u, v):
+        return u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]
+
+    rel = a1 - a0
+    crossing = (cross(d0, rel) * cross(d0, rel + d1) < 0) & (
+        cross(d1, rel) * cross(d1, rel - d0) < 0
+    )
+    return np.where(crossing, 0, np.sqrt(ends))
+
+
+def _runs(poly: _Polygon):
+    """
+    Group the edges of poly into runs of consecutive edges, each within a capsule about
+    the chord from its first point to its last
+
+    :return: the number of edges of each run, but the last, and the start, direction and
+             radius of the capsule about each run
+    """
+    n = len(poly.a)
+    run = max(4, int(np.sqrt(n)))
+    first = np.arange(0, n, run)
+    start = poly.a[first]
+    d = poly.a[np.minimum(first + run, n) % n] - start
+    owner = np.arange(n) // run
+    radius = np.zeros(len(first))
+    # every edge is within the capsule of its run if both of its ends are
+    np.maximum.at(radius, owner, _to_segments(poly.a, start[owner], d[owner]))
+    np.maximum.at(radius, owner, _to_segments(poly.a + poly.d, start[owner], d[owner]))
+    return run, start, d, np.sqrt(radius)
+
+
+def _segment_distance(p: np.ndarray, poly: _Polygon) -> np.ndarray:
+    """Find the distance from every point of p to the nearest edge of poly, in chunks"""
+    out = np.empty(len(p))
+    chunk = max(1, 2**20 // max(len(poly.a), 1))
+    for i in range(0, len(p), chunk):
+        rel = p[i : i + chunk, None, :] - poly.a
+        t = np.clip(np.sum(rel * poly.d, axis=2) / poly.length**2, 0, 1)
+        off = rel - t[..., None] * poly.d
+        out[i : i + chunk] = np.sqrt(np.min(np.sum(off * off, axis=2), axis=1))
+    return out
+
+
+def _contains(p: np.ndarray, poly: _Polygon) -> np.ndarray:
+    """Find whether every point of p is inside poly, by the even-odd rule"""
+    y = p[:, 1, None]
+    b = poly.a + poly.d
+    crosses = (poly.a[:, 1] > y) != (b[:, 1] > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = poly.a[:, 0] + (y - poly.a[:, 1]) * poly.d[:, 0] / poly.d[:, 1]
+    return np.count_nonzero(crosses & (p[:, 0, None] < x), axis=1) % 2 == 1
+
+
+def _burnout(poly: _Polygon, outer_rad: float, tolerance: float = 1e-5) -> float:
+    """
+    Find the web at which a grain burns out, the greatest distance from any point of the
+    propellant to the port, to within tolerance of the outer radius, by branch and bound
+    over square cells: the distance from a point of a cell to the port is at most that from
+    its center, moved into the outer wall, plus the distance it was moved and half the
+    diagonal of the cell, and at least that from any point of propellant
+
+    :return: an upper bound on the web at which the grain burns out
+    """
+    side = 16
+    half = outer_rad / side
+    steps = (np.arange(side) * 2 + 1 - side) * half
+    centers = np.stack(np.meshgrid(steps, steps), -1).reshape(-1, 2)
+    lo, hi = 0.0, 2 * outer_rad
+    while len(centers):
+        diagonal = half * np.sqrt(2)  # half the diagonal of each cell
+        rad = np.hypot(*centers.T)
+        # the point of the grain nearest each center, or the center itself in the port
+        points = centers * np.minimum(outer_rad / np.maximum(rad, 1e-300), 1)[:, None]
+        distance = _segment_distance(points, poly)
+        in_port = _contains(points, poly)
+        if np.any(~in_port):
+            lo = max(lo, distance[~in_port].max())
+        # every point of each cell inside the wall is within spread of its point
+        spread = diagonal + np.maximum(rad - outer_rad, 0)
+        bound = distance + spread
+        # cells wholly past the wall, or wholly inside the port, have no propellant
+        alive = (rad - diagonal < outer_rad) & ~(in_port & (distance > spread))
+        alive &= bound >= lo
+        hi = min(hi, bound[alive].max(initial=lo))
+        if hi - lo <= tolerance * outer_rad or len(centers) > 2**16:
+            break
+        half /= 2
+        corners = np.array([[-1, -1], [-1, 1], [1, -1], [1, 1]]) * half
+        centers = (centers[alive, None] + corners).reshape(-1, 2)
+    return hi
+
+
+def _covered(breaks, end, inside):
+    """
+    Split pieces at sorted breakpoints and find the sub-intervals satisfying a predicate
+
+    :param breaks: (k, b) breakpoints of k pieces; values outside [0, end] are ignored
+    :param end: (k,) end of the parameter range of each piece
+    :param inside: maps (k, b + 1) midpoints to whether they are in the desired set
+    :return: the row, start and stop of every sub-interval whose midpoint satisfies inside
+    """
+    breaks = np.where((breaks >= 0) & (breaks <= end[:, None]), breaks, end[:, None])
+    breaks = np.sort(np.concatenate([np.zeros((len(end), 1)), breaks], axis=1), axis=1)
+    breaks = np.concatenate([breaks, end[:, None]], axis=1)
+    lo, hi = breaks[:, :-1], breaks[:, 1:]
+    hit = (hi > lo) & inside((lo + hi) / 2)
+    rows = np.nonzero(hit)[0]
+    return rows, lo[hit], hi[hit]
+
+
+def _offset_fronts(poly: _Polygon, webs: np.ndarray, outer_rad: float, order: int = 1):
+    """
+    Find the burning surface of a polygonal port after regressing each positive web in
+    webs, in increasing order: the pieces of the curve at that distance from the port inside
+    the outer radius. If the port is order-fold symmetric about (0, 0), only the pieces of
+    the edges and corners of its first len(poly.a) / order points are found, and the rest
+    follow by symmetry: x dy - y dx, integrated for the area, does not change under rotation
+
+    :return: the length of the burning surface and the area of the port it encloses, for
+             each web
+    """
+    n = len(poly.a)
+    sector = n // order
+    # the pieces which are found: the offsets of the edges and corners of one sector
+    pieces = np.concatenate(
+        [np.arange(sector), n + np.flatnonzero(poly.vertex < sector)]
+    )
+    # every point of a piece moves straight away from its edge or corner as the web grows,
+    # by as much as the web, so once it is burnt by an edge it stays burnt, and once it is
+    # past the wall it stays past it if it started inside; pieces which have burnt out
+    # are not found again
+    inside = np.hypot(*poly.a.T) <= outer_rad
+    lasting = np.concatenate(
+        [
+            (inside & np.roll(inside, -1))[:sector],
+            inside[poly.vertex[pieces[sector:] - n]],
+        ]
+    )
+    alive = np.ones(len(pieces), dtype=bool)
+    # webs are found a few at a time, so that pieces burnt out by the end of a chunk are not
+    # found in the next, each piece being compared with about 2 sqrt(n) edges
+    chunk = max(1, min(16, 2**22 // (len(pieces) * int(np.sqrt(n) + 1))))
+    parts = []
+    for i in range(0, len(webs), chunk):
+        perimeter, area, burning = _fronts(
+            poly, webs[i : i + chunk], outer_rad, order, pieces[alive]
+        )
+        parts.append((perimeter, area))
+        alive[np.flatnonzero(alive)[~burning & lasting[alive]]] = False
+    return tuple(np.concatenate(part) for part in zip(*parts))
+
+
+def _fronts(
+    poly: _Polygon, webs: np.ndarray, outer_rad: float, order: int, pieces: np.ndarray
+):
+    """
+    Find the burning surface for _offset_fronts, of the given pieces only
+
+    :return: the length of the burning surface and the area of the port it encloses, for
+             each web, and whether each piece is still burning after the last web
+    """
+    n, m = len(poly.a), len(poly.corner)
+    n_pieces = n + m
+    segs = pieces[pieces < n]
+    corners = pieces[pieces >= n] - n
+    n_segs = len(segs)
+    end = np.concatenate([np.ones(n), poly.span])
+    # offset edges run from p0 to p0 + d, parametrized on [0, 1]; offset corners are arcs
+    # about corners, parametrized by angle on [0, span]
+    w = webs[:, None]
+    start, span = poly.start[corners], poly.span[corners]
+    p0 = poly.a[segs] + w[..., None] * poly.normal[segs]
+    # the bounding circle of every piece found, after regressing each web
+    center = np.concatenate(
+        [
+            p0 + poly.d[segs] / 2,
+            poly.corner[corners] + w[..., None] * _unit(start + span / 2),
+        ],
+        axis=1,
+    )
+    radius = np.concatenate(
+        [np.broadcast_to(poly.length[segs] / 2, (len(webs), n_segs)), w * span / 2],
+        axis=1,
+    )
+    # and the chord of every piece, and how far it bulges out of its chord
+    chord0 = np.concatenate([p0, poly.corner[corners] + w[..., None] * _unit(start)], 1)
+    chord1 = np.concatenate(
+        [
+            p0 + poly.d[segs],
+            poly.corner[corners] + w[..., None] * _unit(start + span),
+        ],
+        axis=1,
+    )
+    sagitta = np.concatenate(
+        [np.zeros((len(webs), n_segs)), w * (1 - np.cos(span / 2))], axis=1
+    )
+    # pieces wholly past the outer wall are burnt out however the edges cover them
+    t = np.clip(-np.sum(p0 * poly.d[segs], -1) / poly.length[segs] ** 2, 0, 1)
+    seg_min = np.hypot(*np.moveaxis(p0 + t[..., None] * poly.d[segs], -1, 0))
+    arc_min = w - np.hypot(*poly.corner[corners].T)
+    wi, index = np.nonzero(np.concatenate([seg_min, arc_min], axis=1) < outer_rad)
+    # the others can only be burnt by edges whose capsules, of radius w, meet their
+    # bounding circles, and are burnt out if their bounding circle is within one capsule;
+    # edges are bounded by runs of consecutive edges first, so that pieces are only
+    # compared with the edges of runs nearby
+    run, run_start, run_d, run_radius = _runs(poly)
+    center, spread, w = center[wi, index], radius[wi, index], webs[wi]
+    w_in = w * (1 - 1e-9)
+    gap = np.sqrt(_to_segments(center[:, None], run_start, run_d))
+    burnt_out = np.any(gap + run_radius + spread[:, None] < w_in[:, None], axis=1)
+    row, first = np.nonzero(
+        (gap - run_radius < (w + spread)[:, None]) & ~burnt_out[:, None]
+    )
+    first *= run
+    count = np.minimum(run, n - first)
+    row = np.repeat(row, count)
+    k = np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())
+    distance = np.sqrt(_to_segments(center[row], poly.a[k], poly.d[k]))
+    inside = distance + spread[row] < w_in[row]
+    burnt_out |= np.bincount(row[inside], minlength=len(center)) > 0
+    near = (distance < w[row] + spread[row]) & ~burnt_out[row]
+    # an offset edge never enters its capsule, nor the capsules of the edges it meets at
+    # convex corners, and neither does the arc about a corner those of its edges
+    convex = np.zeros(n, dtype=bool)
+    convex[poly.vertex] = True
+    edge = pieces[index[row]]
+    is_arc = edge >= n
+    edge[is_arc] = poly.vertex[edge[is_arc] - n]
+    after = (edge + 1) % n
+    near &= np.where(
+        is_arc,
+        (k != edge) & (k != (edge - 1) % n),
+        (k != edge)
+        & ~((k == (edge - 1) % n) & convex[edge])
+        & ~((k == after) & convex[after]),
+    )
+    # and pieces are only split by the edges their chords, bulged out by their sagitta,
+    # come closer to than w
+    pair = np.flatnonzero(near)
+    chord = chord0[wi[row[pair]], index[row[pair]]]
+    near[pair] = (
+        _between_segments(
+            chord,
+            chord1[wi[row[pair]], index[row[pair]]] - chord,
+            poly.a[k[pair]],
+            poly.d[k[pair]],
+        )
+        < (w + sagitta[wi, index])[row[pair]]
+    )
+    # the web and index among pieces of every piece which may still be burning
+    live_web, live = wi[~burnt_out], index[~burnt_out]
+    wi, piece, k = wi[row[near]], index[row[near]], k[near]
+    piece = pieces[piece]
+    w = webs[wi]
+    w_in = w * (1 - 1e-9)  # points closer than this to an edge are strictly burnt
+
+    def seg_point(s, w, t):
+        p0 = poly.a[s] + w[:, None] * poly.normal[s]
+        return p0[:, None] + t[..., None] * poly.d[s, None]
+
+    def arc_point(c, w, t):
+        theta = poly.start[c, None] + t
+        unit = np.stack([np.cos(theta), np.sin(theta)], -1)
+        return poly.corner[c, None] + w[:, None, None] * unit
+
+    def in_capsule(points, k, w_in):
+        rel = points - poly.a[k, None]
+        d = poly.d[k, None]
+        t = np.clip(np.sum(rel * d, -1) / poly.length[k, None] ** 2, 0, 1)
+        off = rel - t[..., None] * d
+        return np.sum(off * off, -1) < w_in[:, None] ** 2
+
+    # break each piece where it could enter or leave each nearby edge's capsule: where it
+    # crosses the circles about the edge's ends or the lines along its sides
+    is_seg = piece < n
+    s, ks, ws, ws_in = piece[is_seg], k[is_seg], w[is_seg], w_in[is_seg]
+    c, kc, wc, wc_in = piece[~is_seg] - n, k[~is_seg], w[~is_seg], w_in[~is_seg]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ds = poly.d[s]
+        rel = poly.a[s] + ws[:, None] * poly.normal[s] - poly.a[ks]
+        rel_b = rel - poly.d[ks]
+        dd = np.sum(ds * ds, 1)
+        n_rel, n_dot = np.sum(poly.normal[ks] * rel, 1), np.sum(poly.normal[ks] * ds, 1)
+        seg_breaks = np.stack(
+            [
+                *_quadratic_roots(
+                    dd, 2 * np.sum(ds * rel, 1), np.sum(rel**2, 1) - ws_in**2
+                ),
+                *_quadratic_roots(
+                    dd, 2 * np.sum(ds * rel_b, 1), np.sum(rel_b**2, 1) - ws_in**2
+                ),
+                (ws_in - n_rel) / n_dot,
+                (-ws_in - n_rel) / n_dot,
+            ],
+            axis=1,
+        )
+        rel = poly.corner[c] - poly.a[kc]
+        rel_b = rel - poly.d[kc]
+        rho, rho_b = np.hypot(*rel.T), np.hypot(*rel_b.T)
+        n_rel = np.sum(poly.normal[kc] * rel, 1)
+        n_phase = np.arctan2(poly.normal[kc, 1], poly.normal[kc, 0])
+        arc_breaks = np.stack(
+            [
+                *_cos_roots(
+                    np.arctan2(rel[:, 1], rel[:, 0]),
+                    (wc_in**2 - wc * wc - rho**2) / (2 * wc * rho),
+                ),
+                *_cos_roots(
+                    np.arctan2(rel_b[:, 1], rel_b[:, 0]),
+                    (wc_in**2 - wc * wc - rho_b**2) / (2 * wc * rho_b),
+                ),
+                *_cos_roots(n_phase, (wc_in - n_rel) / wc),
+                *_cos_roots(n_phase, (-wc_in - n_rel) / wc),
+            ],
+            axis=1,
+        )
+        arc_breaks = np.mod(arc_breaks - poly.start[c, None], 2 * np.pi)
+        # and where each piece crosses the outer wall
+        live_seg = live < n_segs
+        seg_web, all_s = live_web[live_seg], segs[live[live_seg]]
+        all_w = webs[seg_web]
+        p0 = poly.a[all_s] + all_w[:, None] * poly.normal[all_s]
+        seg_wall = np.stack(
+            _quadratic_roots(
+                np.sum(poly.d[all_s] ** 2, 1),
+                2 * np.sum(poly.d[all_s] * p0, 1),
+                np.sum(p0**2, 1) - outer_rad**2,
+            ),
+            axis=1,
+        )
+        arc_web, all_c = live_web[~live_seg], corners[live[~live_seg] - n_segs]
+        arc_w = webs[arc_web]
+        rho = np.hypot(*poly.corner[all_c].T)
+        arc_wall = np.stack(
+            _cos_roots(
+                np.arctan2(poly.corner[all_c, 1], poly.corner[all_c, 0]),
+                (outer_rad**2 - rho**2 - arc_w**2) / (2 * arc_w * rho),
+            ),
+            axis=1,
+        )
+        arc_wall = np.mod(arc_wall - poly.start[all_c, None], 2 * np.pi)
+    # the burnt out parts of each piece: inside another edge's capsule or past the wall
+    seg_in = _covered(
+        seg_breaks, end[s], lambda t: in_capsule(seg_point(s, ws, t), ks, ws_in)
+    )
+    arc_in = _covered(
+        arc_breaks, end[n + c], lambda t: in_capsule(arc_point(c, wc, t), kc, wc_in)
+    )
+    seg_out = _covered(
+        seg_wall,
+        np.ones(len(all_s)),
+        lambda t: np.sum(seg_point(all_s, all_w, t) ** 2, -1) > outer_rad**2,
+    )
+    arc_out = _covered(
+        arc_wall,
+        end[n + all_c],
+        lambda t: np.sum(arc_point(all_c, arc_w, t) ** 2, -1) > outer_rad**2,
+    )
+    # rows identify a piece after regressing a web: web index * n_pieces + piece
+    seg_row = wi[is_seg] * n_pieces + s
+    arc_row = wi[~is_seg] * n_pieces + n + c
+    wall_seg_row = seg_web * n_pieces + all_s
+    wall_arc_row = arc_web * n_pieces + n + all_c
+    rows = np.concatenate(
+        [
+            seg_row[seg_in[0]],
+            arc_row[arc_in[0]],
+            wall_seg_row[seg_out[0]],
+            wall_arc_row[arc_out[0]],
+        ]
+    )
+    start = np.concatenate([seg_in[1], arc_in[1], seg_out[1], arc_out[1]])
+    stop = np.concatenate([seg_in[2], arc_in[2], seg_out[2], arc_out[2]])
+    n_rows = len(webs) * n_pieces
+    found = live_web * n_pieces + pieces[live]
+    # the burning surface is what remains of each piece outside its burnt intervals
+    by_row = np.lexsort((start, rows))
+    rows, start, stop = rows[by_row], start[by_row], stop[by_row]
+    key = 4.0 * rows  # every parameter is in [0, pi], so this separates rows
+    reach = np.maximum.accumulate(stop + key) - key
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = rows[1:] != rows[:-1]
+    last = np.ones(len(rows), dtype=bool)
+    last[:-1] = first[1:]
+    row_end = np.tile(end, len(webs))
+    gap_lo = np.zeros(n_rows)
+    gap_lo[rows[last]] = reach[last]
+    gap_row = np.concatenate([rows, found])
+    gap_lo = np.concatenate([np.where(first, 0, np.roll(reach, 1)), gap_lo[found]])
+    gap_hi = np.concatenate([start, row_end[found]])
+    gap_web, gap_piece = np.divmod(gap_row, n_pieces)
+    on_seg = gap_piece < n
+    lengths = (gap_hi - gap_lo) * webs[gap_web]
+    lengths[on_seg] = (gap_hi - gap_lo)[on_seg] * poly.length[gap_piece[on_seg]]
+    # ignore slivers left by rounding
+    keep = lengths > _SLIVER * outer_rad
+    gap_web, gap_piece, lengths = gap_web[keep], gap_piece[keep], lengths[keep]
+    gap_lo, gap_hi, on_seg = gap_lo[keep], gap_hi[keep], on_seg[keep]
+    span = gap_hi - gap_lo
+    w = webs[gap_web]
+    sp, cp = gap_piece[on_seg], gap_piece[~on_seg] - n
+    ws, wc = w[on_seg], w[~on_seg]
+    perimeter = order * np.bincount(gap_web, lengths, len(webs)).astype(np.float64)
+    # by Green's theorem, the enclosed area is half the integral of x dy - y dx around the
+    # burning surface and the burnt through parts of the outer wall
+    green = np.zeros(len(gap_web))
+    p0 = poly.a[sp] + ws[:, None] * poly.normal[sp]
+    green[on_seg] = (p0[:, 0] * poly.d[sp, 1] - p0[:, 1] * poly.d[sp, 0]) * span[on_seg]
+    t0 = poly.start[cp] + gap_lo[~on_seg]
+    t1 = poly.start[cp] + gap_hi[~on_seg]
+    green[~on_seg] = (
+        wc * poly.corner[cp, 0] * (np.sin(t1) - np.sin(t0))
+        - wc * poly.corner[cp, 1] * (np.cos(t1) - np.cos(t0))
+        + wc * wc * (t1 - t0)
+    )
+    area = order * np.bincount(gap_web, green, len(webs)).astype(np.float64)
+    seg_hit = (seg_wall >= 0) & (seg_wall <= 1)
+    arc_hit = arc_wall <= poly.span[all_c, None]
+    hits = np.concatenate(
+        [
+            seg_point(all_s, all_w, seg_wall)[seg_hit],
+            arc_point(all_c, arc_w, arc_wall)[arc_hit],
+        ]
+    )
+    hit_web = np.concatenate(
+        [
+            np.repeat(seg_web, 2)[seg_hit.ravel()],
+            np.repeat(arc_web, 2)[arc_hit.ravel()],
+        ]
+    )
+    crossing = _segment_distance(hits, poly) >= webs[hit_web] * (1 - 1e-9)
+    hits, hit_web = hits[crossing], hit_web[crossing]
+    if order > 1:
+        # the burning surface of every other sector meets the wall at rotated points
+        turn = 2 * np.pi * np.arange(order) / order
+        cos, sin = np.cos(turn)[:, None], np.sin(turn)[:, None]
+        x, y = hits[:, 0], hits[:, 1]
+        hits = np.stack([cos * x - sin * y, sin * x + cos * y], -1).reshape(-1, 2)
+        hit_web = np.tile(hit_web, order)
+    angle = np.arctan2(hits[:, 1], hits[:, 0])
+    # webs where the burning surface never meets the wall get a single arc, all the way
+    # round, starting at angle 0
+    lone = np.setdiff1d(np.arange(len(webs)), hit_web)
+    angle = np.concatenate([angle, np.zeros(len(lone))])
+    hit_web = np.concatenate([hit_web, lone])
+    by_angle = np.lexsort((angle, hit_web))
+    angle, hit_web = angle[by_angle], hit_web[by_angle]
+    head = np.ones(len(angle), dtype=bool)
+    head[1:] = hit_web[1:] != hit_web[:-1]
+    tail = np.ones(len(angle), dtype=bool)
+    tail[:-1] = head[1:]
+    following = np.roll(angle, -1)
+    following[tail] = angle[head] + 2 * np.pi
+    gaps = following - angle
+    mids = angle + gaps / 2
+    wall = outer_rad * np.stack([np.cos(mids), np.sin(mids)], 1)
+    burnt = _segment_distance(wall, poly) < webs[hit_web]
+    area += outer_rad**2 * np.bincount(
+        hit_web, weights=gaps * burnt, minlength=len(webs)
+    )
+    burning = np.isin(pieces, gap_piece[gap_web == len(webs) - 1])
+    return perimeter, area / 2, burning
+
+
+def exact_regression(
+    net: Net, outer_diameter: float, web_steps: int = 100, order: int = 1
+) -> Regression:
+    """
+    Compute the port area and burning perimeter of a 2D grain as it regresses, exactly, from
+    the inward offsets of the polygon formed by its net clipped by the outer diameter. The
+    burning surface is the set of points at the web distance from the port, so it is made
+    of offset edges and of circular arcs about the convex vertices of the net.
+
+    This is a slow reference implementation, for checking grid_regression and choosing its
+    resolution, not for screening populations: every piece of the burning surface is
+    clipped by the edges near it, which approaches O(n^2) in the number of points of the
+    net, so a net of a few hundred points takes seconds where grid_regression takes
+    hundredths of a second
+
+    :param net: the net representing the port of the grain, centered at (0, 0); it must be
+                a simple polygon, in either orientation
+    :param outer_diameter: outer diameter of the grain, in the units of the net
+    :param web_steps: number of evenly spaced web distances, from 0 to burnout, to sample
+    :param order: if net is made of order copies of its first len(net) / order points,
+                  each rotated by 1 / order of a turn about (0, 0) from the last, the
+                  burning surface is only found for one of those copies; its burnout is
+                  still found from the full net
+    :return: the port area and burning perimeter at each sampled web distance
+    :raises ValueError: if net is not made of order rotated copies of its first points
+    """
+    if order != 1 and not _symmetric(net, order):
+        raise ValueError(f"Net is not {order}-fold rotationally symmetric")
+    poly = _polygon(net)
+    if len(poly.a) < 3:
+        return Regression(np.zeros(web_steps), np.zeros(web_steps), np.zeros(web_steps))
+    if len(poly.a) % order:
+        order = 1  # dropping repeated points broke the symmetry of the net
+    outer_rad = outer_diameter / 2
+    web = np.linspace(0, _burnout(poly, outer_rad), web_steps)
+    port_area = np.empty(web_steps)
+    perimeter = np.empty(web_steps)
+    if web_steps:
+        port_area[0] = _shoelace(poly.a)
+        perimeter[0] = np.sum(poly.length)
+        perimeter[1:], port_area[1:] = _offset_fronts(poly, web[1:], outer_rad, order)
+    return Regression(web, port_area, perimeter)
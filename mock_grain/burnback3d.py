@@ -0,0 +1,248 @@
+"""
+Functions for simulating the burnback of 3D grains, from the port surface of their meshes
+and their uninhibited ends, on their voxelized propellant
+"""
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from . import instrumentation
+from .burnback import Regression, grid_regression, lower_envelope
+from .constants import InhibitedEnds
+from .grains import Grain3D
+from .voxels import is_prismatic, read_loft, voxelize
+
+# the greatest number of cells processed at once by each pass of the distance transform
+_CHUNK_CELLS = 2**22
+
+
+class Regression3D(NamedTuple):
+    """The port volume and burning surface area of a 3D grain as its surface regresses"""
+
+    web: np.ndarray  # distance regressed by the burning surface
+    port_volume: np.ndarray  # volume of the port, inside the outer diameter, at each web
+    burning_area: np.ndarray  # area of the burning surface at each web distance
+
+
+def _burning_ends(inhibited: InhibitedEnds):
+    """Whether the bottom (z = 0) and top (z = length) ends of a grain burn"""
+    return (
+        inhibited in (InhibitedEnds.NEITHER, InhibitedEnds.TOP),
+        inhibited in (InhibitedEnds.NEITHER, InhibitedEnds.BOTTOM),
+    )
+
+
+def extruded_net(grain: Grain3D) -> Optional[np.ndarray]:
+    """
+    Find the net a grain is extruded from, as by net_to_3D_mesh
+
+    :param grain: the grain
+    :return: the (N, 2) points of the net, or None if the mesh of grain is not extruded
+             from a single net
+    """
+    loft = read_loft(grain.mesh)
+    if len(loft.levels) != 2 or len(loft.rings[0]) != 1 or len(loft.rings[1]) != 1:
+        return None
+    ring = loft.rings[0][0]
+    if np.any(loft.up[ring] == ring) or not is_prismatic(loft, 0):
+        return None
+    return loft.xy[ring]
+
+
+def extruded_regression(
+    grain: Grain3D,
+    resolution: int = 256,
+    web_steps: int = 100,
+) -> Regression3D:
+    """
+    Compute the regression of a 3D grain extruded from a net, as by net_to_3D_mesh, from
+    the 2D regression of that net: its burning area is the perimeter of the net times the
+    remaining length of the grain, plus the propellant left on its uninhibited ends, which
+    each regress by the web
+
+    :param grain: the grain
+    :param resolution: number of cells along the outer diameter
+    :param web_steps: number of evenly spaced web distances, from 0 to burnout, to sample
+    :return: the port volume and burning area at each sampled web distance
+    :raises ValueError: if the mesh of grain is not extruded from a net
+    """
+    net = extruded_net(grain)
+    if net is None:
+        raise ValueError("The mesh of the grain is not extruded from a net")
+    outer = grain.outer_diameter
+    flat = grid_regression(net, outer, resolution, web_steps)
+    return extrude(flat, outer, grain.length, grain.inhibited_ends, web_steps)
+
+
+def extrude(
+    flat: Regression,
+    outer_diameter: float,
+    length: float,
+    inhibited: InhibitedEnds,
+    web_steps: int,
+) -> Regression3D:
+    """
+    Compute the regression of a grain of constant cross-section from that of its net
+
+    :param flat: the regression of the net
+    :param outer_diameter: outer diameter of the grain
+    :param length: length of the grain
+    :param inhibited: which ends of the grain are inhibited
+    :param web_steps: number of evenly spaced web distances, from 0 to burnout, to sample
+    :return: the port volume and burning area at each sampled web distance
+    """
+    ends = sum(_burning_ends(inhibited))
+    burnout = flat.web[-1]
+    if ends:
+        burnout = min(burnout, length / ends)
+    web = np.linspace(0, burnout, web_steps)
+    port_area = np.interp(web, flat.web, flat.port_area)
+    perimeter = np.interp(web, flat.web, flat.perimeter)
+    remaining = length - ends * web
+    cross_section = np.pi * outer_diameter**2 / 4
+    port_volume = port_area * remaining + cross_section * (length - remaining)
+    burning_area = perimeter * remaining + ends * (cross_section - port_area)
+    return Regression3D(web, port_volume, burning_area)
+
+
+def _column_distance(port: np.ndarray, height: float, far: float, bottom, top):
+    """
+    The distance along z, in the units of the grain, from each cell of columns of cells to
+    the nearest port cell or burning end in its column; far where there is neither
+    """
+    slices = port.shape[0]
+    k = np.arange(slices).reshape(-1, *([1] * (port.ndim - 1)))
+    above = np.maximum.accumulate(np.where(port, k, -slices), axis=0)
+    below = np.minimum.accumulate(np.where(port, k, 2 * slices)[::-1], axis=0)[::-1]
+    g = np.minimum(k - above, below - k) * height
+    g = np.minimum(g, far).astype(np.float64)
+    if bottom is not None:
+        g = np.minimum(g, (k + 0.5) * height + bottom)
+    if top is not None:
+        g = np.minimum(g, (slices - k - 0.5) * height + top)
+    return g
+
+
+@instrumentation.timed()
+def voxel_regression(
+    grain: Grain3D,
+    resolution: int = 128,
+    slices: Optional[int] = None,
+    web_steps: int = 100,
+    scratch: Optional[str] = None,
+) -> Regression3D:
+    """
+    Compute the regression of a 3D grain on its voxelized propellant, from the distance of
+    every cell of propellant to the nearest cell of port or uninhibited end. The distance
+    transform is separable: a pass along z over blocks of columns, then passes along y and
+    x over chunks of slices, so only a chunk of cells is ever processed at once
+
+    :param grain: the grain
+    :param resolution: number of cells along each side of every slice, spanning the outer
+                       diameter
+    :param slices: number of slices along the length of the grain, by default enough for
+                   cells about as tall as they are wide
+    :param web_steps: number of evenly spaced web distances, from 0 to burnout, to sample
+    :param scratch: if provided, the occupancy grid and the intermediate distances are
+                    memory-mapped to files with this path as a prefix, rather than held in
+                    memory
+    :return: the port volume and burning area at each sampled web distance; the area is
+             the derivative of port volume with respect to web, taken over a window a few
+             cells wide
+    :raises ValueError: if resolution or slices is not positive
+    """
+    voxels = voxelize(
+        grain, resolution, slices, path=None if scratch is None else scratch + ".npy"
+    )
+    occupancy, cell, height = voxels
+    slices = len(occupancy)
+    centers = (np.arange(resolution) + 0.5) * cell - grain.outer_diameter / 2
+    inside = (
+        centers[:, None] ** 2 + centers[None, :] ** 2 <= (grain.outer_diameter / 2) ** 2
+    )
+    # burning surfaces lie half a cell short of the centers of port cells, so the distance
+    # from each end is offset by as much, and every distance shortened by it at the end
+    bottom, top = _burning_ends(grain.inhibited_ends)
+    bottom = cell / 2 if bottom else None
+    top = cell / 2 if top else None
+    far = 2 * (grain.outer_diameter + grain.length) + cell
+    shape = occupancy.shape
+    if scratch is None:
+        squared = np.empty(shape, dtype=np.float32)
+    else:
+        squared = np.lib.format.open_memmap(
+            scratch + ".distance.npy", mode="w+", dtype=np.float32, shape=shape
+        )
+    rows = max(1, _CHUNK_CELLS // (slices * resolution))
+    for y in range(0, resolution, rows):
+        port = ~occupancy[:, y : y + rows] & inside[y : y + rows]
+        g = _column_distance(port, height, far, bottom, top)
+        squared[:, y : y + rows] = (g / cell) ** 2
+    # the squared distances, in cells, are then spread across each slice; webs are counted
+    # into bins a fraction of a cell wide
+    width = min(cell, height) / 4
+    bins = np.zeros(int(np.ceil(far / width)) + 2, dtype=np.int64)
+    chunk = max(1, _CHUNK_CELLS // (resolution * resolution))
+    port_cells = 0
+    for z in range(0, slices, chunk):
+        f = np.asarray(squared[z : z + chunk], dtype=np.float64)
+        n = len(f)
+        f = lower_envelope(f.transpose(0, 2, 1).reshape(-1, resolution))
+        f = f.reshape(n, resolution, resolution).transpose(0, 2, 1)
+        f = lower_envelope(f.reshape(-1, resolution)).reshape(n, resolution, resolution)
+        distance = np.maximum(np.sqrt(f) * cell - cell / 2, 0)
+        solid = np.asarray(occupancy[z : z + chunk])
+        port_cells += np.count_nonzero(inside & ~solid)
+        webs = distance[solid & (distance < far / 2)]
+        bins += np.bincount(
+            np.floor(webs / width).astype(np.int64) + 1, minlength=len(bins)
+        )
+    cell_volume = cell * cell * height
+    # the volume burnt by each web, at the edges of the bins, assuming the webs of each bin
+    # are spread evenly across it
+    edges = np.arange(len(bins)) * width
+    volume = (port_cells + np.cumsum(bins)) * cell_volume
+    nonempty = np.flatnonzero(bins)
+    burnout = edges[nonempty[-1]] if len(nonempty) else 0.0
+
+    def burnt(w):
+        return np.interp(w, edges, volume)
+
+    web = np.linspace(0, burnout, web_steps)
+    port_volume = burnt(web)
+    port_volume[0] = port_cells * cell_volume
+    half_width = max(2 * max(cell, height), burnout / max(web_steps - 1, 1) / 2)
+    lo = np.maximum(web - half_width, 0)
+    hi = np.minimum(web + half_width, burnout)
+    burning_area = np.zeros(web_steps)
+    span = hi > lo
+    burning_area[span] = (burnt(hi[span]) - burnt(lo[span])) / (hi[span] - lo[span])
+    return Regression3D(web, port_volume, burning_area)
+
+
+def regression_3d(
+    grain: Grain3D,
+    resolution: int = 128,
+    web_steps: int = 100,
+    method: str = "auto",
+    **options,
+) -> Regression3D:
+    """
+    Compute the regression of a 3D grain, taking the fast path of extruded_regression for
+    grains extruded from a net and voxel_regression otherwise
+
+    :param grain: the grain
+    :param resolution: number of cells along the outer diameter
+    :param web_steps: number of evenly spaced web distances, from 0 to burnout, to sample
+    :param method: "auto", "extruded" or "voxel"
+    :param options: other options of the function computing the regression
+    :return: the port volume and burning area at each sampled web distance
+    :raises ValueError: if method is unknown, or "extruded" for a grain which is not
+    """
+    if method == "auto":
+        method = "extruded" if extruded_net(grain) is not None else "voxel"
+    if method == "extruded":
+        return extruded_regression(grain, resolution, web_steps, **options)
+    if method == "voxel":
+        return voxel_regression(grain, resolution, web_steps=web_steps, **options)
+    raise ValueError(f"Unknown regression method: {method}")
@@ -0,0 +1,281 @@
+"""Memoizing the fitness of grains by their canonicalized geometry"""
+import hashlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .evaluation import Fitness, PopulationEvaluator
+from .grains import Grain, Grain2D, Grain3D
+from .population import Grain2DBatch
+
+
+def _quantize(values: np.ndarray, decimals: int) -> np.ndarray:
+    # adding 0.0 turns -0.0 into 0.0, so both hash the same
+    return np.round(np.asarray(values, dtype=np.float64), decimals) + 0.0
+
+
+def _header(
+    kind: bytes, outer_diameter: float, length: float, inhibited: int, decimals: int
+) -> bytes:
+    scalars = _quantize([outer_diameter, length], decimals)
+    return kind + scalars.tobytes() + bytes([inhibited])
+
+
+def _net_key(
+    points: np.ndarray,
+    outer_diameter: float,
+    length: float,
+    inhibited: int,
+    decimals: int,
+) -> str:
+    points = _quantize(points, decimals).reshape(-1, 2)
+    # repeated consecutive points, including a closing repeat of the first, add nothing
+    points = points[np.any(points != np.roll(points, 1, axis=0), axis=1)]
+    x, y = points[:, 0], points[:, 1]
+    if np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y) < 0:
+        points = points[::-1]
+    # start from the lexicographically least rotation of the points
+    if len(points):
+        candidates = np.flatnonzero(np.all(points == min(map(tuple, points)), axis=1))
+        start = min(
+            candidates, key=lambda i: np.roll(points, -i, axis=0).ravel().tolist()
+        )
+        points = np.roll(points, -start, axis=0)
+    header = _header(b"2", outer_diameter, length, inhibited, decimals)
+    return hashlib.blake2b(header + points.tobytes(), digest_size=16).hexdigest()
+
+
+def canonical_key(grain: Grain, decimals: int = 9) -> str:
+    """
+    Hash the geometry and parameters of a grain, such that grains which only differ by the
+    start point or orientation of their net, or by less than the quantization of their
+    coordinates, hash the same
+
+    :param grain: the grain to hash
+    :param decimals: number of decimal places coordinates and parameters are rounded to
+    :return: a hexadecimal digest of the grain
+    :raises ValueError: if grain is neither a Grain2D nor a Grain3D
+    """
+    inhibited = grain.inhibited_ends.value
+    if isinstance(grain, Grain2D):
+        return _net_key(
+            grain.net, grain.outer_diameter, grain.length, inhibited, decimals
+        )
+    if isinstance(grain, Grain3D):
+        mesh = grain.mesh
+        vertices = _quantize(mesh.vertices, decimals)
+        # number vertices in sorted order, and list edges by those numbers
+        order = np.lexsort(vertices.T[::-1])
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        rows = np.repeat(rank, np.diff(mesh.indptr))
+        edges = np.unique(rows * len(rank) + rank[mesh.indices])
+        header = _header(b"3", grain.outer_diameter, grain.length, inhibited, decimals)
+        data = header + vertices[order].tobytes() + edges.tobytes()
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+    raise ValueError("Can only hash a Grain2D or Grain3D")
+
+
+class FitnessCache:
+    """
+    A bounded, least recently used cache of the fitness of grains, keyed by canonical_key.
+    Results can also be persisted to an SQLite database, which is consulted on a miss in
+    memory and outlives the cache
+    """
+
+    __slots__ = ["__maxsize", "__decimals", "__entries", "__db", "__hits", "__misses"]
+
+    def __init__(
+        self, maxsize: int = 4096, path: Optional[str] = None, decimals: int = 9
+    ):
+        """
+        Construct an empty cache
+
+        :param maxsize: maximum number of results held in memory
+        :param path: path of an SQLite database to persist results to, if any
+        :param decimals: number of decimal places grains are quantized to
+        :raises ValueError: if maxsize is negative
+        """
+        if maxsize < 0:
+            raise ValueError("Must have a non-negative maximum size")
+        self.__maxsize = maxsize
+        self.__decimals = decimals
+        self.__entries: "OrderedDict[str, float]" = OrderedDict()
+        self.__db: "Optional[sqlite3.Connection]" = None
+        if path is not None:
+            # imported here, so that only caches persisted to disk pay for it
+            import sqlite3
+
+            # a cache may be used by a thread other than the one which made it, such as
+            # the evaluation stage of a Pipeline, though only by one thread at a time
+            self.__db = sqlite3.connect(path, check_same_thread=False)
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS fitness (key TEXT PRIMARY KEY, value REAL)"
+            )
+            self.__db.commit()
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def hits(self) -> int:
+        """
+        :return: the number of lookups answered from memory or disk
+        """
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        """
+        :return: the number of lookups which had to be computed
+        """
+        return self.__misses
+
+    def key(self, grain: Grain) -> str:
+        """
+        :param grain: a grain
+        :return: the key the fitness of that grain is cached under
+        """
+        return canonical_key(grain, self.__decimals)
+
+    def __lookup(self, key: str) -> Optional[float]:
+        if key in self.__entries:
+            self.__entries.move_to_end(key)
+            return self.__entries[key]
+        if self.__db is not None:
+            row = self.__db.execute(
+                "SELECT value FROM fitness WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.__remember(key, row[0])
+                return row[0]
+        return None
+
+    def __remember(self, key: str, value: float):
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__maxsize:
+            self.__entries.popitem(last=False)
+
+    def __store(self, items: Dict[str, float]):
+        for key, value in items.items():
+            self.__remember(key, value)
+        if self.__db is not None and items:
+            self.__db.executemany(
+                "INSERT OR REPLACE INTO fitness VALUES (?, ?)", items.items()
+            )
+            self.__db.commit()
+
+    def items(self) -> Dict[str, float]:
+        """
+        :return: a copy of the results held in memory, by key
+        """
+        return dict(self.__entries)
+
+    def update(self, items: Dict[str, float]):
+        """
+        Cache results by key, such as those of items of another cache
+
+        :param items: fitness by key
+        """
+        self.__store(items)
+
+    def put(self, grain: Grain, value: float):
+        """
+        Cache the fitness of a grain
+
+        :param grain: the grain
+        :param value: its fitness
+        """
+        self.__store({self.key(grain): value})
+
+    def get_or_compute(self, grain: Grain, fitness: Fitness) -> float:
+        """
+        :param grain: a grain
+        :param fitness: computes the fitness of the grain on a miss
+        :return: the cached fitness of the grain, computing and caching it if needed
+        """
+        key = self.key(grain)
+        value = self.__lookup(key)
+        if value is not None:
+            self.__hits += 1
+            return value
+        self.__misses += 1
+        value = fitness(grain)
+        self.__store({key: value})
+        return value
+
+    def evaluate(
+        self,
+        population: Union[Grain2DBatch, Sequence[Grain]],
+        fitness: Union[Fitness, PopulationEvaluator],
+    ) -> np.ndarray:
+        """
+        Score every grain of a population, computing each distinct uncached grain once
+
+        :param population: a population of 2D grains, or a sequence of 2D and 3D grains
+        :param fitness: a fitness function, or an evaluator to score the misses with
+        :return: the score of every grain, in the order of the population
+        """
+        if isinstance(population, Grain2DBatch):
+            points, offsets = population.points, population.offsets
+            keys = [
+                _net_key(
+                    points[offsets[i] : offsets[i + 1]],
+                    population.outer_diameters[i],
+                    population.lengths[i],
+                    int(population.inhibited_ends[i]),
+                    self.__decimals,
+                )
+                for i in range(len(population))
+            ]
+        else:
+            keys = [self.key(grain) for grain in population]
+        scores = np.empty(len(keys), dtype=np.float64)
+        missing: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            if key in missing:
+                missing[key].append(i)
+                continue
+            value = self.__lookup(key)
+            if value is None:
+                missing[key] = [i]
+            else:
+                scores[i] = value
+        self.__misses += len(missing)
+        self.__hits += len(keys) - len(missing)
+        firsts = [positions[0] for positions in missing.values()]
+        if isinstance(population, Grain2DBatch):
+            misses = population.select(firsts)
+        else:
+            misses = [population[i] for i in firsts]
+        if isinstance(fitness, PopulationEvaluator):
+            computed = fitness.evaluate(misses)
+        else:
+            computed = [fitness(misses[i]) for i in range(len(firsts))]
+        for positions, value in zip(missing.values(), computed):
+            scores[positions] = value
+        self.__store(dict(zip(missing, map(float, computed))))
+        return scores
+
+    def clear(self):
+        """
+        Empty the in-memory tier of this cache and reset its counters
+        """
+        self.__entries.clear()
+        self.__hits = 0
+        self.__misses = 0
+
+    def close(self):
+        """
+        Close the database results are persisted to, if any
+        """
+        if self.__db is not None:
+            self.__db.close()
+            self.__db = None
+
+    def __contains__(self, grain) -> bool:
+        return isinstance(grain, Grain) and self.key(grain) in self.__entries
+
+    def __len__(self) -> int:
+        return len(self.__entries)
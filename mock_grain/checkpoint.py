@@ -0,0 +1,343 @@
+"""
+Checkpointing evolutionary runs, so that they can be resumed after a crash.
+
+A checkpoint directory holds an archive of every distinct grain checkpointed so far, a
+binary file of the archive index and fitness of the members of each checkpointed
+population, and a journal with one line per checkpoint: where its population is, the state
+of the random number generator, the keys of the grains it added to the archive and the
+fitness cache results which changed since the checkpoint before. Checkpoints are therefore
+incremental: a grain is archived once however many generations it survives, and a cache
+result is journaled once unless it changes. Every file is only ever appended to, the journal
+last, so a crash while a checkpoint is written loses that checkpoint and no other.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from . import instrumentation
+from .archive import Archive, ArchiveWriter
+from .cache import FitnessCache
+from .grains import Grain, Grain2D
+from .population import Grain2DBatch
+
+_ARCHIVE = "grains.arc"
+_POPULATIONS = "populations.bin"
+_JOURNAL = "journal.jsonl"
+
+Population = Union[Grain2DBatch, Sequence[Grain]]
+
+
+class Checkpoint(NamedTuple):
+    """The state of a run at a checkpoint"""
+
+    generation: int
+    # the population, as a Grain2DBatch if it was checkpointed as one, else a list
+    population: Union[Grain2DBatch, List[Grain]]
+    fitness: np.ndarray  # the fitness of each member of the population
+    rng: Optional[np.random.Generator]  # the random number generator, if checkpointed
+
+
+def _jsonable(value):
+    """
+    A copy of the state of a bit generator with each of its arrays turned into a list
+    tagged with its dtype
+    """
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, np.ndarray):
+        return {"dtype": value.dtype.str, "array": value.tolist()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _arrays(value):
+    """The inverse of _jsonable"""
+    if isinstance(value, dict):
+        if value.keys() == {"dtype", "array"}:
+            return np.array(value["array"], dtype=value["dtype"])
+        return {key: _arrays(item) for key, item in value.items()}
+    return value
+
+
+def _generator(state: dict) -> np.random.Generator:
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    bit_generator.state = _arrays(state)
+    return np.random.Generator(bit_generator)
+
+
+def _identity(header: bytes, *arrays: np.ndarray) -> str:
+    digest = hashlib.blake2b(header, digest_size=16)
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def _identities(population: Population) -> List[str]:
+    """
+    A digest of every grain of a population, exactly as it is; unlike canonical_key, it
+    only needs to recognize the grains which survive from one generation to the next
+    """
+    if isinstance(population, Grain2DBatch):
+        points, offsets = population.points, population.offsets
+        columns = zip(
+            population.outer_diameters.tolist(),
+            population.lengths.tolist(),
+            population.inhibited_ends.tolist(),
+        )
+        return [
+            _identity(repr((2, *column)).encode(), points[offsets[i] : offsets[i + 1]])
+            for i, column in enumerate(columns)
+        ]
+    identities = []
+    for grain in population:
+        header = (grain.outer_diameter, grain.length, grain.inhibited_ends.value)
+        if isinstance(grain, Grain2D):
+            net = np.asarray(grain.net, dtype=np.float64)
+            identities.append(_identity(repr((2, *header)).encode(), net))
+        else:
+            mesh = grain.mesh
+            identities.append(
+                _identity(
+                    repr((3, *header)).encode(),
+                    mesh.vertices,
+                    mesh.indptr,
+                    mesh.indices,
+                )
+            )
+    return identities
+
+
+def _read_journal(directory: str) -> Tuple[List[dict], int]:
+    """
+    The complete lines of the journal of a checkpoint directory, in order, and the byte at
+    which the last of them ends
+    """
+    path = os.path.join(directory, _JOURNAL)
+    entries, end = [], 0
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # cut short by a crash
+                entries.append(json.loads(line))
+                end += len(line)
+    return entries, end
+
+
+class Checkpointer:
+    """
+    Writes incremental checkpoints of a run to a directory, on a background thread so that
+    a generation never waits for its checkpoint to be written. Checkpoints are written one
+    at a time, in the order they were taken
+    """
+
+    __slots__ = [
+        "__archive",
+        "__populations",
+        "__journal",
+        "__indices",
+        "__count",
+        "__fitness",
+        "__executor",
+        "__pending",
+    ]
+
+    def __init__(
+        self,
+        directory: str,
+        dtype: Union[str, np.dtype] = np.float64,
+    ):
+        """
+        Open a checkpoint directory, creating it if needed; checkpoints are added after
+        any already in it
+
+        :param directory: path of the directory
+        :param dtype: float32 or float64, the type coordinates are archived as
+        :raises ValueError: if dtype is neither float32 nor float64
+        """
+        os.makedirs(directory, exist_ok=True)
+        entries, end = _read_journal(directory)
+        self.__indices: Dict[str, int] = {}
+        self.__fitness: Dict[str, float] = {}
+        for entry in entries:
+            first = entry["first"]
+            self.__indices.update(
+                (key, first + i) for i, key in enumerate(entry["keys"])
+            )
+            self.__fitness.update(entry["fitness"])
+        # drop a line cut short by a crash, which the next line would otherwise follow
+        path = os.path.join(directory, _JOURNAL)
+        if os.path.exists(path):
+            os.truncate(path, end)
+        self.__archive = ArchiveWriter(os.path.join(directory, _ARCHIVE), dtype)
+        # grains archived by a checkpoint which was never journaled are not reused, but
+        # still count towards the indices of those after them
+        self.__count = len(Archive(os.path.join(directory, _ARCHIVE)))
+        self.__populations = open(os.path.join(directory, _POPULATIONS), "ab")
+        self.__journal = open(path, "ab")
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__pending: Optional[Future] = None
+
+    def checkpoint(
+        self,
+        generation: int,
+        population: Population,
+        fitness: Sequence[float],
+        rng: Optional[np.random.Generator] = None,
+        cache: Optional[FitnessCache] = None,
+    ) -> Future:
+        """
+        Take a checkpoint of a run, to be written in the background. The state of rng and
+        the results of cache are copied before this returns; population must not be
+        modified in place until the checkpoint is written
+
+        :param generation: the number of the generation
+        :param population: the population of the generation
+        :param fitness: the fitness of each member of the population
+        :param rng: the random number generator of the run, if any
+        :param cache: the fitness cache of the run, if any
+        :return: a future which is done once the checkpoint is written
+        :raises ValueError: if there is not one fitness per member of the population
+        :raises Exception: whatever prevented the previous checkpoint from being written
+        """
+        fitness = np.array(fitness, dtype=np.float64).ravel()
+        if fitness.size != len(population):
+            raise ValueError(f"Expected one fitness per grain, got {fitness.size}")
+        if self.__pending is not None and self.__pending.done():
+            self.__pending.result()
+        state = None if rng is None else _jsonable(rng.bit_generator.state)
+        items = {} if cache is None else cache.items()
+        self.__pending = self.__executor.submit(
+            self.__write, generation, population, fitness, state, items
+        )
+        return self.__pending
+
+    @instrumentation.timed()
+    def __write(
+        self,
+        generation: int,
+        population: Population,
+        fitness: np.ndarray,
+        state: Optional[dict],
+        items: Dict[str, float],
+    ):
+        keys = _identities(population)
+        new: Dict[str, int] = {}
+        for i, key in enumerate(keys):
+            if key not in self.__indices and key not in new:
+                new[key] = i
+        first = self.__count
+        if new:
+            firsts = list(new.values())
+            if isinstance(population, Grain2DBatch):
+                grains = population.select(firsts)
+            else:
+                grains = [population[i] for i in firsts]
+            self.__archive.append(grains, fitness[firsts])
+            self.__indices.update((key, first + i) for i, key in enumerate(new))
+            self.__count += len(new)
+        indices = np.array([self.__indices[key] for key in keys], dtype="<i8")
+        offset = self.__populations.tell()
+        self.__populations.write(indices.tobytes() + fitness.astype("<f8").tobytes())
+        changed = {
+            key: value
+            for key, value in items.items()
+            if self.__fitness.get(key) != value
+        }
+        self.__fitness.update(changed)
+        entry = {
+            "generation": generation,
+            "batch": isinstance(population, Grain2DBatch),
+            "offset": offset,
+            "count": len(keys),
+            "first": first,
+            "keys": list(new),
+            "rng": state,
+            "fitness": changed,
+        }
+        # the population is on disk before the line of the journal which refers to it
+        self.__populations.flush()
+        os.fsync(self.__populations.fileno())
+        self.__journal.write(json.dumps(entry).encode() + b"\n")
+        self.__journal.flush()
+        os.fsync(self.__journal.fileno())
+        instrumentation.count("grains_archived", len(new))
+
+    def wait(self):
+        """
+        Wait for the last checkpoint taken to be written
+
+        :raises Exception: whatever prevented it from being written
+        """
+        if self.__pending is not None:
+            self.__pending.result()
+
+    def close(self):
+        """
+        Wait for the last checkpoint taken to be written, then close the directory
+        """
+        try:
+            self.wait()
+        finally:
+            self.__executor.shutdown()
+            self.__archive.close()
+            self.__populations.close()
+            self.__journal.close()
+
+    def __enter__(self) -> "Checkpointer":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def resume(
+    directory: str,
+    cache: Optional[FitnessCache] = None,
+    generation: Optional[int] = None,
+) -> Optional[Checkpoint]:
+    """
+    Read a checkpoint back from a directory
+
+    :param directory: path of the checkpoint directory
+    :param cache: if provided, the fitness cache results journaled up to the checkpoint are
+                  put into it
+    :param generation: the generation of the checkpoint, by default the last one written
+    :return: the checkpoint, or None if there is none
+    :raises ValueError: if there is no checkpoint of the requested generation
+    """
+    entries, _ = _read_journal(directory)
+    if generation is not None:
+        matching = [i for i, e in enumerate(entries) if e["generation"] == generation]
+        if not matching:
+            raise ValueError(f"No checkpoint of generation {generation}")
+        entries = entries[: matching[-1] + 1]
+    if not entries:
+        return None
+    if cache is not None:
+        items: Dict[str, float] = {}
+        for entry in entries:
+            items.update(entry["fitness"])
+        cache.update(items)
+    entry = entries[-1]
+    count = entry["count"]
+    data = np.fromfile(
+        os.path.join(directory, _POPULATIONS),
+        dtype=np.uint8,
+        count=16 * count,
+        offset=entry["offset"],
+    )
+    indices = data[: 8 * count].view("<i8")
+    fitness = data[8 * count :].view("<f8").astype(np.float64)
+    archive = Archive(os.path.join(directory, _ARCHIVE))
+    if entry["batch"]:
+        population = archive.batch(indices)
+    else:
+        population = [archive[int(i)] for i in indices]
+    rng = None if entry["rng"] is None else _generator(entry["rng"])
+    return Checkpoint(entry["generation"], population, fitness, rng)
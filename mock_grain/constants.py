@@ -1,5 +1,6 @@
 """Stores constants used elsewhere in mock_grain"""
 import enum
+import os
 
 
 class InhibitedEnds(enum.Enum):
@@ -12,3 +13,12 @@ class InhibitedEnds(enum.Enum):
 
 
 INCHES_PER_MM = 1 / 25.4
+METERS_PER_UNIT = {"mm": 0.001, "in": 0.0254, "m": 1.0}
+
+# when set, constructors taking the trusted fast path, such as Mesh.from_trusted, validate
+# their input anyway; read as constants.VALIDATE_TRUSTED, so it can be toggled at runtime
+VALIDATE_TRUSTED = os.environ.get("MOCK_GRAIN_VALIDATE", "") not in ("", "0")
+
+# the default greatest distance, in the units of the mesh, between points welded into one
+# vertex when interning them; read as constants.WELD_TOLERANCE, so it can be set at runtime
+WELD_TOLERANCE = 1e-9
@@ -1,9 +1,110 @@
 """Functions for converting nets and meshes from one unit to another"""
-from constants import INCHES_PER_MM
-from mesh import Mesh
-from mock_grain.typedefs import Net
+from typing import Optional, TypeVar
 
+import numpy as np
 
+from . import instrumentation
+from .constants import INCHES_PER_MM, METERS_PER_UNIT
+from .grains import Grain2D, Grain3D, SymmetricGrain2D
+from .mesh import Mesh
+from .population import Grain2DBatch
+from .typedefs import Net
+
+T = TypeVar("T")
+
+
+def scale_factor(from_unit: str, to_unit: str) -> float:
+    """
+    :param from_unit: a unit of length: "mm", "in" or "m"
+    :param to_unit: a unit of length: "mm", "in" or "m"
+    :return: the factor converting lengths in from_unit to lengths in to_unit
+    :raises ValueError: if either unit is unknown
+    """
+    for unit in (from_unit, to_unit):
+        if unit not in METERS_PER_UNIT:
+            raise ValueError(
+                f"Unknown unit {unit!r}, expected one of {list(METERS_PER_UNIT)}"
+            )
+    if (from_unit, to_unit) == ("mm", "in"):
+        return INCHES_PER_MM
+    return METERS_PER_UNIT[from_unit] / METERS_PER_UNIT[to_unit]
+
+
+def _scale(obj, factor: float, out: Optional[np.ndarray]):
+    if isinstance(obj, np.ndarray):
+        return np.multiply(obj, factor, out=out)
+    if out is not None:
+        raise ValueError("Only arrays can be converted into an output buffer")
+    if isinstance(obj, Mesh):
+        # scaling never changes topology, so the adjacency arrays are shared
+        return Mesh.from_trusted(
+            obj.vertices * factor, obj.indptr, obj.indices, obj.dim
+        )
+    if isinstance(obj, Grain2DBatch):
+        return Grain2DBatch.from_arrays(
+            obj.points * factor,
+            obj.offsets,
+            obj.outer_diameters * factor,
+            obj.lengths * factor,
+            obj.inhibited_ends,
+        )
+    if isinstance(obj, SymmetricGrain2D):
+        # only the sector is scaled, and the grain stays symmetric
+        return SymmetricGrain2D.from_trusted(
+            obj.outer_diameter * factor,
+            obj.length * factor,
+            obj.inhibited_ends,
+            _scale(obj.sector, factor, None),
+            obj.order,
+        )
+    if isinstance(obj, Grain2D):
+        net = _scale(obj.net, factor, None)
+        return Grain2D.from_trusted(
+            obj.outer_diameter * factor, obj.length * factor, obj.inhibited_ends, net
+        )
+    if isinstance(obj, Grain3D):
+        return Grain3D.from_trusted(
+            obj.outer_diameter * factor,
+            obj.length * factor,
+            obj.inhibited_ends,
+            _scale(obj.mesh, factor, None),
+        )
+    if isinstance(obj, (int, float)):
+        return obj * factor
+    # the items of a net are points, of one dimension and two coordinates; items of two
+    # dimensions, or empty, are nets, whatever sequences they are made of
+    if len(obj) and (np.ndim(obj[0]) == 2 or np.size(obj[0]) == 0):
+        # a population of nets: scale all of their points in one multiply
+        stops = np.cumsum([len(net) for net in obj]).tolist()
+        points = np.array([p for net in obj for p in net], dtype=np.float64) * factor
+        points = list(map(tuple, points.reshape(-1, 2).tolist()))
+        return [points[stop - len(net) : stop] for net, stop in zip(obj, stops)]
+    points = np.asarray(obj, dtype=np.float64).reshape(-1, 2) * factor
+    return list(map(tuple, points.tolist()))
+
+
+@instrumentation.timed()
+def convert(
+    obj: T, from_unit: str, to_unit: str, out: Optional[np.ndarray] = None
+) -> T:
+    """
+    Convert lengths from one unit to another in a single NumPy multiply, sharing whatever
+    scaling does not change: mesh topology, net offsets and inhibited ends
+
+    :param obj: a length, an array of coordinates, a net, a list of nets, a mesh, a grain
+                or a population of grains
+    :param from_unit: the unit of obj: "mm", "in" or "m"
+    :param to_unit: the unit to convert to: "mm", "in" or "m"
+    :param out: for arrays, a buffer to write the result to, which may be obj itself to
+                convert in place
+    :return: obj, converted to to_unit
+    :raises ValueError: if either unit is unknown, or if out is provided for anything but
+                        an array
+    """
+    return _scale(obj, scale_factor(from_unit, to_unit), out)
+
+
+@instrumentation.timed()
 def mm_net_to_inch_net(net: Net):
     """
     Convert a net where units of points are millimeters to a net where units of points are
@@ -12,9 +113,10 @@ def mm_net_to_inch_net(net: Net):
     :param net: a net where units of points are millimeters
     :return: the same net scaled to where units of points are inches
     """
-    return [(point[0] * INCHES_PER_MM, point[1] * INCHES_PER_MM) for point in net]
+    return _scale(net, INCHES_PER_MM, None)
 
 
+@instrumentation.timed()
 def mm_mesh_to_inch_mesh(mesh: Mesh) -> Mesh:
     """
     Convert a mesh where units of points are millimeters to a mesh where units of points are
@@ -23,8 +125,4 @@ def mm_mesh_to_inch_mesh(mesh: Mesh) -> Mesh:
     :param mesh: a mesh where units of points are millimeters
     :return: the same mesh scaled to where units of points are inches
     """
-
-    def scale(pt):
-        return tuple(v * INCHES_PER_MM for v in pt)
-
-    return Mesh({scale(k): {scale(v) for v in vs} for k, vs in mesh.items()})
+    return _scale(mesh, INCHES_PER_MM, None)
@@ -0,0 +1,352 @@
+"""Scoring whole populations of grains in parallel, in a pool of worker processes"""
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from . import instrumentation
+from .constants import InhibitedEnds
+from .grains import Grain, Grain2D, Grain3D, SymmetricGrain2D
+from .mesh import Mesh
+from .population import Grain2DBatch
+
+Fitness = Callable[[Grain], float]
+# maps the name of each array packed in a shared memory block to its byte offset into the
+# block, its shape and its dtype
+Layout = Dict[str, Tuple[int, Tuple[int, ...], str]]
+
+
+def _pack(arrays: Dict[str, np.ndarray]) -> Tuple[shared_memory.SharedMemory, Layout]:
+    """Copy arrays into a new shared memory block, each aligned to 8 bytes"""
+    layout: Layout = {}
+    size = 0
+    for name, array in arrays.items():
+        layout[name] = (size, array.shape, array.dtype.str)
+        size += -(-array.nbytes // 8) * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for name, array in arrays.items():
+        _view(shm, layout, name)[...] = array
+    return shm, layout
+
+
+def _view(shm: shared_memory.SharedMemory, layout: Layout, name: str) -> np.ndarray:
+    offset, shape, dtype = layout[name]
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+
+
+def _columns(prefix: str, grains: Sequence[Grain]) -> Dict[str, np.ndarray]:
+    return {
+        f"{prefix}outer": np.array(
+            [g.outer_diameter for g in grains], dtype=np.float64
+        ),
+        f"{prefix}length": np.array([g.length for g in grains], dtype=np.float64),
+        f"{prefix}inhibited": np.array(
+            [g.inhibited_ends.value for g in grains], dtype=np.int8
+        ),
+    }
+
+
+def concat_ragged(
+    parts: List[np.ndarray], dtype, width: int = 0
+) -> Tuple[np.ndarray, ...]:
+    """
+    Concatenate arrays into one ragged array
+
+    :param parts: the arrays, each of shape (n,), or (n, width) if width is given
+    :param dtype: dtype of the result
+    :param width: number of columns of each array, or 0 for one-dimensional arrays
+    :return: the concatenated array, and len(parts) + 1 offsets such that part i is
+             [offsets[i]:offsets[i + 1]]
+    """
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    np.cumsum([len(part) for part in parts], out=offsets[1:], dtype=np.int64)
+    shape = (int(offsets[-1]), width) if width else (int(offsets[-1]),)
+    flat = np.concatenate(parts).astype(dtype) if parts else np.empty(shape, dtype)
+    return flat.reshape(shape), offsets
+
+
+def _pack_population(
+    grains: Union[Grain2DBatch, Sequence[Grain]]
+) -> Dict[str, np.ndarray]:
+    """
+    Flatten a population into arrays: the nets of 2D grains as one ragged array of points,
+    the meshes of 3D grains as ragged vertex and CSR arrays, and a position for every grain.
+    Symmetric 2D grains are packed as one sector and their order
+    """
+    if isinstance(grains, Grain2DBatch):
+        return {
+            "2d_position": np.arange(len(grains), dtype=np.int64),
+            "2d_points": grains.points,
+            "2d_offsets": grains.offsets,
+            "2d_outer": grains.outer_diameters,
+            "2d_length": grains.lengths,
+            "2d_inhibited": grains.inhibited_ends,
+        }
+    flat2d = [(i, g) for i, g in enumerate(grains) if isinstance(g, Grain2D)]
+    flat3d = [(i, g) for i, g in enumerate(grains) if isinstance(g, Grain3D)]
+    if len(flat2d) + len(flat3d) != len(grains):
+        raise ValueError("Every member of the population must be a Grain2D or Grain3D")
+    arrays = {}
+    if flat2d:
+        positions, grains2d = zip(*flat2d)
+        symmetric = [isinstance(g, SymmetricGrain2D) for g in grains2d]
+        points, offsets = concat_ragged(
+            [
+                np.asarray(g.sector if sym else g.net, dtype=np.float64).reshape(-1, 2)
+                for g, sym in zip(grains2d, symmetric)
+            ],
+            np.float64,
+            2,
+        )
+        if any(symmetric):
+            arrays["2d_order"] = np.array(
+                [g.order if sym else 0 for g, sym in zip(grains2d, symmetric)],
+                dtype=np.int64,
+            )
+        arrays.update(
+            {
+                "2d_position": np.array(positions, dtype=np.int64),
+                "2d_points": points,
+                "2d_offsets": offsets,
+                **_columns("2d_", grains2d),
+            }
+        )
+    if flat3d:
+        positions, grains3d = zip(*flat3d)
+        meshes = [g.mesh for g in grains3d]
+        vertices, vertex_offsets = concat_ragged(
+            [m.vertices for m in meshes], np.float64, 3
+        )
+        indptr, indptr_offsets = concat_ragged([m.indptr for m in meshes], np.int64)
+        indices, indices_offsets = concat_ragged([m.indices for m in meshes], np.int64)
+        arrays.update(
+            {
+                "3d_position": np.array(positions, dtype=np.int64),
+                "3d_vertex": vertices,
+                "3d_dims": np.array([m.dim for m in meshes], dtype=np.int8),
+                "3d_vertex_offsets": vertex_offsets,
+                "3d_indptr": indptr,
+                "3d_indptr_offsets": indptr_offsets,
+                "3d_indices": indices,
+                "3d_indices_offsets": indices_offsets,
+                **_columns("3d_", grains3d),
+            }
+        )
+    return arrays
+
+
+def _grain(arrays: Dict[str, np.ndarray], prefix: str, i: int, trusted: bool) -> Grain:
+    """
+    Reconstruct grain i of the 2D or 3D grains of a packed population, skipping validation
+    if the population was packed from grains which were already validated
+    """
+    outer = float(arrays[f"{prefix}outer"][i])
+    length = float(arrays[f"{prefix}length"][i])
+    inhibited = InhibitedEnds(int(arrays[f"{prefix}inhibited"][i]))
+    if prefix == "2d_":
+        start, stop = arrays["2d_offsets"][i : i + 2]
+        net = list(map(tuple, arrays["2d_points"][start:stop].tolist()))
+        # an order of 0 marks a grain which is not symmetric
+        order = int(arrays["2d_order"][i]) if "2d_order" in arrays else 0
+        if order:
+            if trusted:
+                return SymmetricGrain2D.from_trusted(
+                    outer, length, inhibited, net, order
+                )
+            return SymmetricGrain2D(outer, length, inhibited, net, order)
+        if trusted:
+            return Grain2D.from_trusted(outer, length, inhibited, net)
+        return Grain2D(outer, length, inhibited, net)
+
+    def part(name):
+        start, stop = arrays[f"3d_{name}_offsets"][i : i + 2]
+        return arrays[f"3d_{name}"][start:stop].copy()
+
+    # 3D grains are only ever packed from Grain3D objects
+    mesh = Mesh.from_trusted(
+        part("vertex"), part("indptr"), part("indices"), int(arrays["3d_dims"][i])
+    )
+    return Grain3D.from_trusted(outer, length, inhibited, mesh)
+
+
+# the fitness functions of the pool this worker process belongs to, set by _init_worker
+_worker_fitness: Tuple[Fitness, ...] = ()
+# the shared memory block of the population this worker process is scoring, by name
+_worker_blocks: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _init_worker(fitness: Tuple[Fitness, ...]):
+    global _worker_fitness
+    _worker_fitness = fitness
+    instrumentation.reset()  # forked workers start with a copy of their parent's
+
+
+def _score(fitness: Fitness, grain: Grain) -> float:
+    with instrumentation.timer("fitness"):
+        return fitness(grain)
+
+
+def _evaluate_chunk(
+    task: Tuple[str, Layout, str, int, int, bool, int, Tuple[bool, bool]]
+) -> Optional[instrumentation.Snapshot]:
+    """
+    Score the grains of one chunk of a packed population, writing each score into the
+    shared array of scores at the grain's position in the population
+
+    :return: the instrumentation statistics of the chunk, if the evaluating process has
+             instrumentation enabled
+    """
+    name, layout, prefix, start, stop, trusted, which, (profile, trace) = task
+    if profile:
+        instrumentation.enable(trace)
+    else:
+        instrumentation.disable()
+    if name not in _worker_blocks:
+        # the previous population has been scored: its block can be released
+        for shm in _worker_blocks.values():
+            shm.close()
+        _worker_blocks.clear()
+        _worker_blocks[name] = shared_memory.SharedMemory(name=name)
+    arrays = {key: _view(_worker_blocks[name], layout, key) for key in layout}
+    scores, positions = arrays["score"], arrays[f"{prefix}position"]
+    for i in range(start, stop):
+        grain = _grain(arrays, prefix, i, trusted)
+        scores[positions[i]] = _score(_worker_fitness[which], grain)
+    return instrumentation.collect() if profile else None
+
+
+class PopulationEvaluator:
+    """
+    Scores populations of grains with a fitness function, across a persistent pool of
+    worker processes. Each population is packed once into a shared memory block, so tasks
+    only carry the name of the block and the range of grains to score; workers reconstruct
+    their grains from the shared arrays and write their scores back into it. Scores are
+    always returned in the order of the population. When instrumentation is enabled, the
+    statistics of the workers are added to those of this process after each population.
+    One pool can serve several fitness functions, each population being scored with one
+    of them.
+    """
+
+    __slots__ = ["__fitness", "__workers", "__chunk_size", "__context", "__pool"]
+
+    def __init__(
+        self,
+        fitness: Union[Fitness, Sequence[Fitness]],
+        workers: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        mp_context: Optional[Union[str, multiprocessing.context.BaseContext]] = None,
+    ):
+        """
+        Construct an evaluator; its worker processes are started on first use
+
+        :param fitness: maps a grain to its score, or a sequence of such functions, which
+                        evaluate chooses between; each must be picklable, e.g. a function
+                        defined at the top level of a module
+        :param workers: number of worker processes, by default one per CPU; with a single
+                        worker, populations are scored in this process
+        :param chunk_size: number of grains per task, by default enough for about four
+                           tasks per worker
+        :param mp_context: the multiprocessing context, or the name of the start method,
+                           of the worker processes
+        :raises ValueError: if workers or chunk_size is not positive
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("Must have at least one worker")
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("Must have a positive chunk size")
+        if mp_context is None or isinstance(mp_context, str):
+            mp_context = multiprocessing.get_context(mp_context)
+        self.__fitness = (fitness,) if callable(fitness) else tuple(fitness)
+        self.__workers = workers
+        self.__chunk_size = chunk_size
+        self.__context = mp_context
+        self.__pool = None
+
+    @property
+    def workers(self) -> int:
+        """
+        :return: the number of worker processes
+        """
+        return self.__workers
+
+    @instrumentation.timed()
+    def evaluate(
+        self, population: Union[Grain2DBatch, Sequence[Grain]], which: int = 0
+    ) -> np.ndarray:
+        """
+        Score every grain of a population
+
+        :param population: a population of 2D grains, or a sequence of 2D and 3D grains
+        :param which: the index of the fitness function to score it with
+        :return: the score of every grain, in the order of the population
+        :raises ValueError: if a member of population is not a Grain2D or Grain3D, if a
+                            grain of a Grain2DBatch is invalid, or if there is no fitness
+                            function at which
+        """
+        if not 0 <= which < len(self.__fitness):
+            raise ValueError(f"No fitness function at index {which}")
+        instrumentation.count("grains_evaluated", len(population))
+        if self.__workers == 1:
+            fitness = self.__fitness[which]
+            return np.array(
+                [_score(fitness, population[i]) for i in range(len(population))],
+                dtype=np.float64,
+            )
+        arrays = _pack_population(population)
+        # the grains of a batch are only validated when they are constructed
+        trusted = not isinstance(population, Grain2DBatch)
+        profile = (instrumentation.is_enabled(), instrumentation.is_tracing())
+        arrays["score"] = np.zeros(len(population), dtype=np.float64)
+        shm, layout = _pack(arrays)
+        try:
+            tasks = []
+            for prefix in ("2d_", "3d_"):
+                count = len(arrays.get(f"{prefix}position", ()))
+                chunk = self.__chunk_size or -(-count // (4 * self.__workers))
+                tasks += [
+                    (
+                        shm.name,
+                        layout,
+                        prefix,
+                        start,
+                        min(start + chunk, count),
+                        trusted,
+                        which,
+                        profile,
+                    )
+                    for start in range(0, count, chunk or 1)
+                ]
+            if tasks:
+                for stats in self.__start().map(_evaluate_chunk, tasks, chunksize=1):
+                    if stats is not None:
+                        instrumentation.absorb(stats)
+            return _view(shm, layout, "score").copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def __start(self):
+        if self.__pool is None:
+            self.__pool = self.__context.Pool(
+                self.__workers, initializer=_init_worker, initargs=(self.__fitness,)
+            )
+        return self.__pool
+
+    def close(self):
+        """
+        Stop the worker processes; they are restarted if this evaluator is used again
+        """
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+    def __enter__(self) -> "PopulationEvaluator":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
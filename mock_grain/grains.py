@@ -1,9 +1,37 @@
 """Classes used to represent grains when interfacing with Open3D"""
 from abc import ABCMeta, abstractmethod
+from typing import Iterable, Optional
 
-from constants import *
-from mesh import Mesh
-from typedefs import *
+import numpy as np
+
+from . import constants
+from . import instrumentation
+from .burnback import Regression, grid_regression
+from .constants import *
+from .incremental_net import IncrementalNet
+from .mesh import Mesh
+from .net_to_mesh import net_to_2D_mesh
+from .typedefs import *
+
+
+def _apply_edits(net: IncrementalNet, edits: Iterable[Edit], outer_rad: float):
+    """Apply the edits of a mutation to a net, checking the points they place"""
+    for edit in edits:
+        if edit[0] == "delete":
+            net.delete(edit[1])
+            continue
+        kind, i, point = edit
+        if sum(dist**2 for dist in point) ** 0.5 > outer_rad:
+            raise ValueError(
+                f"At least one point, {point} in the mutation is further "
+                f"from center than the outer radius, {outer_rad}"
+            )
+        if kind == "move":
+            net.move(i, point)
+        elif kind == "insert":
+            net.insert(i, point)
+        else:
+            raise ValueError(f"Unknown edit: {kind}")
 
 
 class Grain(metaclass=ABCMeta):
@@ -27,6 +55,15 @@ class Grain(metaclass=ABCMeta):
             raise ValueError("Must have positive length")
         if outer_diameter <= 0:
             raise ValueError("Must have positive diameter")
+        self._set_trusted(outer_diameter, length, inhibited_ends)
+
+    def _set_trusted(
+        self, outer_diameter: float, length: float, inhibited_ends: InhibitedEnds
+    ):
+        """
+        Set the parameters of this grain without checking them, for subclasses constructing
+        grains known to be valid
+        """
         self.__outer = outer_diameter
         self.__length = length
         self.__inhibited = inhibited_ends
@@ -69,8 +106,9 @@ class Grain2D(Grain):
 
     # TODO: once Grain3D is implemented, this could inherit from it
 
-    __slots__ = ["__outer", "__length", "__inhibited", "__net"]
+    __slots__ = ["__outer", "__length", "__inhibited", "__net", "__geometry"]
 
+    @instrumentation.timed()
     def __init__(
         self,
         outer_diameter: float,
@@ -99,23 +137,97 @@ class Grain2D(Grain):
             raise ValueError("Must have positive diameter")
         outer_rad = outer_diameter / 2
         for point in net:
-            d = sum(dist ** 2 for dist in point) ** 0.5
+            d = sum(dist**2 for dist in point) ** 0.5
             if d > outer_rad:
                 raise ValueError(
                     f"At least one point, {point} in the provided net is further "
                     f"from center than the outer radius, {outer_rad}"
                 )
         self.__net: Net = net.copy()
+        self.__geometry: Optional[IncrementalNet] = None
+
+    @classmethod
+    def from_trusted(
+        cls,
+        outer_diameter: float,
+        length: float,
+        inhibited_ends: InhibitedEnds,
+        net: Net,
+    ) -> "Grain2D":
+        """
+        Construct a 2D grain from parameters already known to be valid, such as those of
+        another grain, without checking or copying them; the grain takes ownership of net.
+        If constants.VALIDATE_TRUSTED is set, they are checked as by the constructor instead
+
+        :param outer_diameter: outer diameter of motor
+        :param length: length of the grain
+        :param inhibited_ends: which ends, if any, are inhibited
+        :param net: a net representing the internal geometry of this grain
+        :return: the resulting grain
+        """
+        if constants.VALIDATE_TRUSTED:
+            return cls(outer_diameter, length, inhibited_ends, net)
+        grain = cls.__new__(cls)
+        grain._set_trusted(outer_diameter, length, inhibited_ends)
+        grain._set_net(net)
+        return grain
+
+    def _set_net(self, net: Optional[Net]):
+        """
+        Set the net of this grain without checking or copying it, for subclasses
+        constructing grains known to be valid
+        """
+        self.__net = net
+        self.__geometry = None
 
     # noinspection PyPep8Naming
-    def to_openMotor_grain(self):
+    def to_openMotor_grain(self, map_dim: Optional[int] = None):
         """
         Convert this grain to an openMotor grain with corresponding dimensions and geometry
 
+        :param map_dim: if provided, the maps of the grain at this map size are computed now
         :return: the resulting openMotor grain
+        :raises ValueError: if this grain has no port
+        :raises ImportError: if openMotor is not installed
+        """
+        # imported here, as openmotor depends on this module
+        from .openmotor import to_openMotor_grain
+
+        return to_openMotor_grain(self, map_dim)
+
+    @instrumentation.timed()
+    def burnback(self, resolution: int = 500, web_steps: int = 100) -> Regression:
+        """
+        Simulate the regression of the burning surface of this grain on a square grid
+        spanning its outer diameter
+
+        :param resolution: number of grid cells along the outer diameter
+        :param web_steps: number of evenly spaced web distances, from 0 to burnout, to sample
+        :return: the port area and burning perimeter of the grain at each web distance
+        """
+        return grid_regression(self.net, self.outer_diameter, resolution, web_steps)
+
+    def apply_mutation(self, edits: Iterable[Edit]) -> "Grain2D":
+        """
+        Construct a child of this grain by editing a few points of its net, in order.
+        Only the edited points are checked against the outer radius, and the child shares
+        the derived geometry of this grain, updated by the edits, rather than recomputing it.
+        The child still has a net of its own: its list of points is copied from this grain's
+        by the first edit, in O(n), sharing the points themselves
+
+        :param edits: ("move", i, point) to move the point at i, ("insert", i, point) to
+                      insert a point at i and ("delete", i) to delete the point at i
+        :return: the child grain, with the same outer diameter, length and inhibited ends
+        :raises ValueError: if an edit is unknown, or if it places a point further from
+                            center than the outer radius
         """
-        # TODO
-        raise NotImplementedError("Unimplemented!")
+        geometry = self.__incremental().copy()
+        _apply_edits(geometry, edits, self.outer_diameter / 2)
+        child = Grain2D.from_trusted(
+            self.outer_diameter, self.length, self.inhibited_ends, geometry.freeze()
+        )
+        child.__geometry = geometry
+        return child
 
     @property
     def net(self) -> Net:
@@ -124,6 +236,196 @@ class Grain2D(Grain):
         """
         return self.__net
 
+    @property
+    def geometry(self) -> IncrementalNet:
+        """
+        :return: a copy of the net of the grain, with its area, perimeter, centroid,
+                 bounding radius and web thickness, computed on first access; editing it
+                 leaves the grain unchanged
+        """
+        return self.__incremental().copy()
+
+    def __incremental(self) -> IncrementalNet:
+        if self.__geometry is None:
+            self.__geometry = IncrementalNet(self.net)
+        return self.__geometry
+
+
+class SymmetricGrain2D(Grain2D):
+    """
+    Represents a 2D grain whose net is order-fold rotationally symmetric about (0, 0), by a
+    single sector of its net: the full net is the sector followed by order - 1 copies of it,
+    each rotated by 1 / order of a turn from the last. The full net and its mesh are only
+    constructed when needed, and its port area and perimeter are computed for one sector.
+    Burnback, like every other simulation, runs on the full net: only storage and these two
+    sums scale with one sector.
+    """
+
+    __slots__ = ["__sector", "__order", "__net", "__mesh"]
+
+    def __init__(
+        self,
+        outer_diameter: float,
+        length: float,
+        inhibited_ends: InhibitedEnds,
+        sector: Net,
+        order: int,
+    ):
+        """
+        Construct a symmetric 2D grain from one sector of its net
+
+        :param outer_diameter: outer diameter of motor
+        :param length: length of the grain
+        :param inhibited_ends: which ends, if any, are inhibited
+        :param sector: the points of one sector of the net of this grain, in inches,
+                       around (0, 0)
+        :param order: number of sectors of the net
+        :raises ValueError: if distance to any point in sector from (0, 0) is greater than
+                            outer_diameter / 2
+                            if length <= 0
+                            if outer_diameter <= 0
+                            if order < 1
+        """
+        Grain.__init__(self, outer_diameter, length, inhibited_ends)
+        if order < 1:
+            raise ValueError("Must have at least one sector")
+        outer_rad = outer_diameter / 2
+        for point in sector:
+            d = sum(dist**2 for dist in point) ** 0.5
+            if d > outer_rad:
+                raise ValueError(
+                    f"At least one point, {point} in the provided sector is further "
+                    f"from center than the outer radius, {outer_rad}"
+                )
+        self.__set(list(sector), int(order))
+
+    def __set(self, sector: Net, order: int):
+        self._set_net(None)
+        self.__sector = sector
+        self.__order = order
+        self.__net: Optional[Net] = None
+        self.__mesh: Optional[Mesh] = None
+
+    @classmethod
+    def from_trusted(
+        cls,
+        outer_diameter: float,
+        length: float,
+        inhibited_ends: InhibitedEnds,
+        sector: Net,
+        order: int,
+    ) -> "SymmetricGrain2D":
+        """
+        Construct a symmetric 2D grain from parameters already known to be valid, without
+        checking or copying them; the grain takes ownership of sector. If
+        constants.VALIDATE_TRUSTED is set, they are checked as by the constructor instead
+
+        :param outer_diameter: outer diameter of motor
+        :param length: length of the grain
+        :param inhibited_ends: which ends, if any, are inhibited
+        :param sector: the points of one sector of the net of this grain
+        :param order: number of sectors of the net
+        :return: the resulting grain
+        """
+        if constants.VALIDATE_TRUSTED:
+            return cls(outer_diameter, length, inhibited_ends, sector, order)
+        grain = cls.__new__(cls)
+        grain._set_trusted(outer_diameter, length, inhibited_ends)
+        grain.__set(sector, order)
+        return grain
+
+    def apply_mutation(self, edits: Iterable[Edit]) -> "SymmetricGrain2D":
+        """
+        Construct a child of this grain by editing a few points of its sector, in order,
+        which edits every sector of its net alike. Only the edited points are checked
+        against the outer radius
+
+        :param edits: ("move", i, point) to move the point at i, ("insert", i, point) to
+                      insert a point at i and ("delete", i) to delete the point at i, with
+                      indices into the sector
+        :return: the child grain, with the same outer diameter, length, inhibited ends and
+                 order
+        :raises ValueError: if an edit is unknown, or if it places a point further from
+                            center than the outer radius
+        """
+        sector = IncrementalNet(self.__sector)
+        _apply_edits(sector, edits, self.outer_diameter / 2)
+        return SymmetricGrain2D.from_trusted(
+            self.outer_diameter,
+            self.length,
+            self.inhibited_ends,
+            sector.freeze(),
+            self.__order,
+        )
+
+    def __closed_sector(self) -> np.ndarray:
+        """The points of the sector, followed by the first point of the next sector"""
+        points = np.asarray(self.__sector, dtype=np.float64).reshape(-1, 2)
+        turn = 2 * np.pi / self.__order
+        cos, sin = np.cos(turn), np.sin(turn)
+        x, y = points[:1, 0], points[:1, 1]
+        following = np.stack([cos * x - sin * y, sin * x + cos * y], axis=1)
+        return np.concatenate([points, following])
+
+    @property
+    def sector(self) -> Net:
+        """
+        :return: the points of one sector of the net of the grain
+        """
+        return self.__sector
+
+    @property
+    def order(self) -> int:
+        """
+        :return: the number of sectors of the net of the grain
+        """
+        return self.__order
+
+    @property
+    def net(self) -> Net:
+        """
+        :return: the full net representing the internal geometry of the grain, expanded
+                 from its sector on first access
+        """
+        if self.__net is None:
+            points = np.asarray(self.__sector, dtype=np.float64).reshape(-1, 2)
+            turn = 2 * np.pi * np.arange(self.__order) / self.__order
+            cos, sin = np.cos(turn)[:, None], np.sin(turn)[:, None]
+            x, y = points[:, 0], points[:, 1]
+            full = np.stack([cos * x - sin * y, sin * x + cos * y], axis=-1)
+            self.__net = list(map(tuple, full.reshape(-1, 2).tolist()))
+        return self.__net
+
+    @property
+    def mesh(self) -> Mesh:
+        """
+        :return: the 2D mesh of the full net of the grain, constructed on first access
+        """
+        if self.__mesh is None:
+            self.__mesh = net_to_2D_mesh(self.net)
+        return self.__mesh
+
+    @property
+    def port_area(self) -> float:
+        """
+        :return: the area of the port formed by the net of the grain, found from one sector
+        """
+        if len(self.__sector) == 0:
+            return 0.0
+        points = self.__closed_sector()
+        x, y = points[:, 0], points[:, 1]
+        return abs(float(np.sum(x[:-1] * y[1:] - x[1:] * y[:-1]))) * self.__order / 2
+
+    @property
+    def port_perimeter(self) -> float:
+        """
+        :return: the length of the net of the grain, found from one sector
+        """
+        if len(self.__sector) == 0:
+            return 0.0
+        d = np.diff(self.__closed_sector(), axis=0)
+        return float(np.sum(np.hypot(d[:, 0], d[:, 1]))) * self.__order
+
 
 class Grain3D(Grain):
     """Represents a 3D grain.
@@ -131,6 +433,7 @@ class Grain3D(Grain):
 
     __slots__ = ["__outer", "__length", "__inhibited", "__mesh"]
 
+    @instrumentation.timed()
     def __init__(
         self,
         outer_diameter: float,
@@ -155,18 +458,16 @@ class Grain3D(Grain):
         """
         super().__init__(outer_diameter, length, inhibited_ends)
         outer_rad = outer_diameter / 2
-        has_z = False
-        for point in mesh:
-            if len(point) >= 3:
-                has_z = True
-            d = (point[0] ** 2 + point[1] ** 2) ** 0.5
-            if d > outer_rad:
-                raise ValueError(
-                    f"At least one point, {point}, in the provided mesh is further "
-                    f"from center than the outer radius, {outer_rad}"
-                )
-        if has_z:
-            max_z = max(point[2] for point in mesh)
+        radii = np.hypot(mesh.vertices[:, 0], mesh.vertices[:, 1])
+        beyond = np.flatnonzero(radii > outer_rad)
+        if len(beyond):
+            point = mesh.vertices[beyond[0], : mesh.dim]
+            raise ValueError(
+                f"At least one point, {tuple(point.tolist())}, in the provided mesh is "
+                f"further from center than the outer radius, {outer_rad}"
+            )
+        if mesh.dim == 3 and len(mesh):
+            max_z = mesh.vertices[:, 2].max()
             if max_z != length:
                 raise ValueError(
                     f"The maximum z-value of any point, {max_z}, is not equal to the provided "
@@ -174,15 +475,46 @@ class Grain3D(Grain):
                 )
         self.__mesh = mesh  # meshes are immutable: no need to copy
 
+    @classmethod
+    def from_trusted(
+        cls,
+        outer_diameter: float,
+        length: float,
+        inhibited_ends: InhibitedEnds,
+        mesh: Mesh,
+    ) -> "Grain3D":
+        """
+        Construct a 3D grain from parameters already known to be valid, such as those of
+        another grain, without checking them. If constants.VALIDATE_TRUSTED is set, they are
+        checked as by the constructor instead
+
+        :param outer_diameter: outer diameter of motor
+        :param length: length of the grain
+        :param inhibited_ends: which ends, if any, are inhibited
+        :param mesh: the mesh mapping points to the points they're connected to
+        :return: the resulting grain
+        """
+        if constants.VALIDATE_TRUSTED:
+            return cls(outer_diameter, length, inhibited_ends, mesh)
+        grain = cls.__new__(cls)
+        grain._set_trusted(outer_diameter, length, inhibited_ends)
+        grain.__mesh = mesh
+        return grain
+
     # noinspection PyPep8Naming
-    def to_openMotor_grain(self):
+    def to_openMotor_grain(self, map_dim: Optional[int] = None):
         """
         Convert this grain to an openMotor grain with corresponding dimensions and geometry
 
+        :param map_dim: if provided, the maps of the grain at this map size are computed now
         :return: the resulting openMotor grain
+        :raises ValueError: if this grain is not extruded from a net, as by net_to_3D_mesh
+        :raises ImportError: if openMotor is not installed
         """
-        # TODO
-        raise NotImplementedError("Unimplemented!")
+        # imported here, as openmotor depends on this module
+        from .openmotor import to_openMotor_grain
+
+        return to_openMotor_grain(self, map_dim)
 
     @property
     def mesh(self) -> Mesh:
@@ -190,3 +522,16 @@ class Grain3D(Grain):
         :return: the mesh representing the internal geometry of the grain
         """
         return self.__mesh
+
+    def wall_clearance(self) -> float:
+        """
+        :return: the least distance from the mesh of this grain to its outer wall, the
+                 cylinder of its outer diameter, which is the least distance from any of its
+                 vertices as the wall is convex; negative if a vertex is beyond the wall, or
+                 inf if the mesh has no vertices
+        """
+        vertices = self.__mesh.vertices
+        if not len(vertices):
+            return np.inf
+        radii = np.hypot(vertices[:, 0], vertices[:, 1])
+        return float(self.outer_diameter / 2 - radii.max())
@@ -0,0 +1,224 @@
+"""A copy-on-write net keeping its derived geometry up to date through local edits"""
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from .typedefs import Net, Point2D
+
+
+class IncrementalNet(Sequence[Point2D]):
+    """
+    A net whose points can be moved, inserted and deleted one at a time, which keeps sums
+    over its edges from which its area, perimeter and centroid follow, and the greatest
+    distance of its points from (0, 0). An edit only changes the terms of the edges it
+    touches, so each aggregate is updated in O(1). Only removing the point furthest from
+    center leaves the bounding radius to be recomputed, once, when it is next needed.
+
+    Copies share their points until either is edited, and freeze hands out the points as a
+    plain net without copying them, after which they are copied before the next edit. That
+    copy is of the list of points, O(n) in the length of the net, though only of references
+    to the same immutable points and without any arithmetic; every later edit until the
+    next copy or freeze is O(1), or O(n) for an insert or delete in the middle, as for any
+    list.
+    """
+
+    __slots__ = [
+        "__points",
+        "__shared",
+        "__cross",
+        "__length",
+        "__moment_x",
+        "__moment_y",
+        "__max_r2",
+    ]
+
+    def __init__(self, net: Net):
+        """
+        Construct an incremental net sharing the points of net, which it copies before any
+        edit rather than modifying
+
+        :param net: a net
+        """
+        self.__points: List[Point2D] = net if isinstance(net, list) else list(net)
+        self.__shared = True
+        self.__recompute()
+
+    def __recompute(self):
+        points = np.asarray(self.__points, dtype=np.float64).reshape(-1, 2)
+        x, y = points[:, 0], points[:, 1]
+        nx, ny = np.roll(x, -1), np.roll(y, -1)
+        cross = x * ny - nx * y
+        self.__cross = float(np.sum(cross))
+        self.__length = float(np.sum(np.hypot(nx - x, ny - y)))
+        self.__moment_x = float(np.sum((x + nx) * cross))
+        self.__moment_y = float(np.sum((y + ny) * cross))
+        self.__max_r2: Optional[float] = float(np.max(x * x + y * y, initial=0))
+
+    def __add_edge(self, a: Point2D, b: Point2D, sign: float):
+        (ax, ay), (bx, by) = a, b
+        cross = (ax * by - bx * ay) * sign
+        self.__cross += cross
+        self.__length += ((bx - ax) ** 2 + (by - ay) ** 2) ** 0.5 * sign
+        self.__moment_x += (ax + bx) * cross
+        self.__moment_y += (ay + by) * cross
+
+    def __add_point(self, point: Point2D):
+        if self.__max_r2 is not None:
+            self.__max_r2 = max(self.__max_r2, point[0] ** 2 + point[1] ** 2)
+
+    def __remove_point(self, point: Point2D):
+        if self.__max_r2 is not None and point[0] ** 2 + point[1] ** 2 >= self.__max_r2:
+            self.__max_r2 = None
+
+    def __own(self):
+        if self.__shared:
+            self.__points = list(self.__points)
+            self.__shared = False
+
+    def __neighbors(self, i: int):
+        n = len(self.__points)
+        return self.__points[(i - 1) % n], self.__points[(i + 1) % n]
+
+    def move(self, i: int, point: Point2D):
+        """
+        Move a point of this net
+
+        :param i: index of the point
+        :param point: where to move it
+        """
+        point = (float(point[0]), float(point[1]))
+        old = self.__points[i]
+        before, after = self.__neighbors(i)
+        self.__own()
+        self.__points[i] = point
+        self.__add_edge(before, old, -1)
+        self.__add_edge(old, after, -1)
+        self.__add_edge(before, point, 1)
+        self.__add_edge(point, after, 1)
+        self.__remove_point(old)
+        self.__add_point(point)
+
+    def insert(self, i: int, point: Point2D):
+        """
+        Insert a point into this net, on the edge between the points at i - 1 and i
+
+        :param i: index the point will have, from 0 to len(self)
+        :param point: the point
+        """
+        point = (float(point[0]), float(point[1]))
+        n = len(self.__points)
+        if not 0 <= i <= n:
+            raise IndexError("Point index out of range")
+        self.__own()
+        if n == 0:
+            self.__points.append(point)
+            self.__max_r2 = point[0] ** 2 + point[1] ** 2
+            return
+        before, after = self.__points[i - 1], self.__points[i % n]
+        self.__points.insert(i, point)
+        self.__add_edge(before, after, -1)
+        self.__add_edge(before, point, 1)
+        self.__add_edge(point, after, 1)
+        self.__add_point(point)
+
+    def delete(self, i: int):
+        """
+        Delete a point of this net, joining its neighbors by an edge
+
+        :param i: index of the point
+        """
+        old = self.__points[i]
+        before, after = self.__neighbors(i)
+        self.__own()
+        del self.__points[i]
+        self.__add_edge(before, old, -1)
+        self.__add_edge(old, after, -1)
+        self.__add_edge(before, after, 1)
+        self.__remove_point(old)
+
+    def copy(self) -> "IncrementalNet":
+        """
+        :return: a copy of this net, sharing its points until either is edited
+        """
+        net = IncrementalNet.__new__(IncrementalNet)
+        net.__points = self.__points
+        net.__cross = self.__cross
+        net.__length = self.__length
+        net.__moment_x = self.__moment_x
+        net.__moment_y = self.__moment_y
+        net.__max_r2 = self.__max_r2
+        net.__shared = self.__shared = True
+        return net
+
+    def freeze(self) -> Net:
+        """
+        :return: the points of this net, which must not be modified, as a net; they are
+                 copied before this net is next edited
+        """
+        self.__shared = True
+        return self.__points
+
+    def refresh(self):
+        """
+        Recompute every aggregate from scratch, discarding the rounding error accumulated
+        over many edits
+        """
+        self.__recompute()
+
+    @property
+    def signed_area(self) -> float:
+        """
+        :return: the area enclosed by this net, positive if its points are in
+                 counterclockwise order and negative if they are in clockwise order
+        """
+        return self.__cross / 2
+
+    @property
+    def area(self) -> float:
+        """
+        :return: the area of the port formed by this net
+        """
+        return abs(self.__cross) / 2
+
+    @property
+    def perimeter(self) -> float:
+        """
+        :return: the length of the edges of this net, including the one from its last point
+                 back to its first
+        """
+        return self.__length
+
+    @property
+    def centroid(self) -> Point2D:
+        """
+        :return: the centroid of the area enclosed by this net, or (0, 0) if it has none
+        """
+        if self.__cross == 0:
+            return 0.0, 0.0
+        return (
+            self.__moment_x / (3 * self.__cross),
+            self.__moment_y / (3 * self.__cross),
+        )
+
+    @property
+    def bounding_radius(self) -> float:
+        """
+        :return: the greatest distance of a point of this net from (0, 0)
+        """
+        if self.__max_r2 is None:
+            points = np.asarray(self.__points, dtype=np.float64).reshape(-1, 2)
+            self.__max_r2 = float(np.max(np.sum(points**2, axis=1), initial=0))
+        return self.__max_r2**0.5
+
+    def web_thickness(self, outer_diameter: float) -> float:
+        """
+        :param outer_diameter: outer diameter of the grain of this net
+        :return: the thinnest web between the points of this net and the outer wall
+        """
+        return outer_diameter / 2 - self.bounding_radius
+
+    def __getitem__(self, i):
+        return self.__points[i]
+
+    def __len__(self) -> int:
+        return len(self.__points)
@@ -0,0 +1,260 @@
+"""
+Named timers and counters around the hot paths of mock_grain.
+
+Instrumentation is disabled unless the MOCK_GRAIN_PROFILE environment variable is set, or
+enable is called; while disabled, timer returns a shared no-op context manager and timed
+functions only check a flag before calling through. Statistics are aggregated per process:
+PopulationEvaluator collects those of its workers after each population, so the
+statistics of the parent process cover the whole evaluation.
+"""
+import functools
+import os
+import threading
+import time
+from typing import Any, Callable, ContextManager, Dict, List, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+Snapshot = Dict[str, Any]
+
+_enabled = os.environ.get("MOCK_GRAIN_PROFILE", "") not in ("", "0")
+_tracing = False
+_lock = threading.Lock()
+_timers: Dict[str, List[float]] = {}  # name -> [calls, total, min, max], in seconds
+_counters: Dict[str, int] = {}
+_events: List[list] = []  # [name, start, duration, pid, tid], when tracing
+
+
+def enable(trace: bool = False):
+    """
+    Start recording timers and counters in this process
+
+    :param trace: whether to also record every timed interval, for to_chrome_trace
+    """
+    global _enabled, _tracing
+    _enabled = True
+    _tracing = trace
+
+
+def disable():
+    """
+    Stop recording timers and counters in this process; what was recorded is kept
+    """
+    global _enabled, _tracing
+    _enabled = False
+    _tracing = False
+
+
+def is_enabled() -> bool:
+    """
+    :return: whether timers and counters are being recorded in this process
+    """
+    return _enabled
+
+
+def is_tracing() -> bool:
+    """
+    :return: whether every timed interval is being recorded in this process
+    """
+    return _tracing
+
+
+def _record(name: str, start: float, stop: float):
+    elapsed = stop - start
+    with _lock:
+        stats = _timers.get(name)
+        if stats is None:
+            _timers[name] = [1, elapsed, elapsed, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = min(stats[2], elapsed)
+            stats[3] = max(stats[3], elapsed)
+        if _tracing:
+            _events.append([name, start, elapsed, os.getpid(), threading.get_ident()])
+
+
+class _Timer:
+    __slots__ = ["__name", "__start"]
+
+    def __init__(self, name: str):
+        self.__name = name
+        self.__start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _record(self.__name, self.__start, time.perf_counter())
+
+
+class _NullTimer:
+    __slots__ = []
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str) -> ContextManager:
+    """
+    :param name: name of the timer
+    :return: a context manager adding the time spent in it to the named timer
+    """
+    return _Timer(name) if _enabled else _NULL_TIMER
+
+
+def timed(name: Optional[str] = None) -> Callable[[F], F]:
+    """
+    Decorate a function to add the time spent in every call of it to a timer
+
+    :param name: name of the timer, by default the qualified name of the function
+    :return: the decorator
+    """
+
+    def decorator(fn: F) -> F:
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(label, start, time.perf_counter())
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, n: int = 1):
+    """
+    Add to a counter, if instrumentation is enabled
+
+    :param name: name of the counter
+    :param n: amount to add
+    """
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def snapshot() -> Snapshot:
+    """
+    :return: a copy of the statistics of this process, as plain data which can be pickled
+             or written as JSON: "timers" maps names to their number of calls and their
+             total, minimum and maximum times in seconds, "counters" maps names to their
+             counts, and "events" lists every traced interval
+    """
+    with _lock:
+        return _snapshot()
+
+
+def _snapshot() -> Snapshot:
+    return {
+        "timers": {
+            name: dict(zip(("calls", "total", "min", "max"), stats))
+            for name, stats in _timers.items()
+        },
+        "counters": dict(_counters),
+        "events": [list(event) for event in _events],
+    }
+
+
+def reset():
+    """
+    Discard the statistics of this process
+    """
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        _events.clear()
+
+
+def collect() -> Snapshot:
+    """
+    :return: the statistics of this process, which are then discarded, such that each
+             call returns what was recorded since the last
+    """
+    with _lock:
+        result = _snapshot()
+        _timers.clear()
+        _counters.clear()
+        _events.clear()
+    return result
+
+
+def merge(*snapshots: Snapshot) -> Snapshot:
+    """
+    :param snapshots: statistics, e.g. of several processes
+    :return: their combined statistics
+    """
+    timers: Dict[str, dict] = {}
+    counters: Dict[str, int] = {}
+    events: List[list] = []
+    for snap in snapshots:
+        for name, stats in snap["timers"].items():
+            if name in timers:
+                merged = timers[name]
+                merged["calls"] += stats["calls"]
+                merged["total"] += stats["total"]
+                merged["min"] = min(merged["min"], stats["min"])
+                merged["max"] = max(merged["max"], stats["max"])
+            else:
+                timers[name] = dict(stats)
+        for name, n in snap["counters"].items():
+            counters[name] = counters.get(name, 0) + n
+        events.extend(snap["events"])
+    return {"timers": timers, "counters": counters, "events": events}
+
+
+def absorb(snap: Snapshot):
+    """
+    Add statistics, e.g. collected from a worker process, to those of this process
+
+    :param snap: the statistics to add
+    """
+    with _lock:
+        merged = merge(_snapshot(), snap)
+        _timers.clear()
+        for name, stats in merged["timers"].items():
+            _timers[name] = [stats[key] for key in ("calls", "total", "min", "max")]
+        _counters.clear()
+        _counters.update(merged["counters"])
+        _events[:] = merged["events"]
+
+
+def to_chrome_trace(snap: Optional[Snapshot] = None) -> dict:
+    """
+    Convert statistics to the Chrome trace event format, viewable in chrome://tracing or
+    Perfetto: every traced interval is a complete event, and every counter a counter event
+
+    :param snap: the statistics to convert, by default those of this process
+    :return: the trace, to be written as JSON
+    """
+    snap = snapshot() if snap is None else snap
+    trace = [
+        {
+            "name": name,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": duration * 1e6,
+            "pid": pid,
+            "tid": tid,
+        }
+        for name, start, duration, pid, tid in snap["events"]
+    ]
+    end = max((event["ts"] + event["dur"] for event in trace), default=0)
+    trace += [
+        {"name": name, "ph": "C", "ts": end, "pid": os.getpid(), "args": {name: n}}
+        for name, n in snap["counters"].items()
+    ]
+    return {"traceEvents": trace, "displayTimeUnit": "ms"}
@@ -0,0 +1,122 @@
+"""
+Interning points as integer vertex IDs, welding points closer than a tolerance.
+
+Points are quantized to the cells of a grid twice as wide as the tolerance, and hashed by
+cell: points in the same cell are the same vertex. So that noise straddling the edge of a
+cell does not split a vertex, this is repeated for each of the 2^D grids offset from the
+first by half a cell along some of the D axes; any two points within the tolerance of each
+other along every axis share a cell of at least one of them. Welding is transitive, so a
+chain of points each within the tolerance of the next is one vertex.
+"""
+import itertools
+from typing import Optional, Tuple
+
+import numpy as np
+
+from . import constants
+from . import instrumentation
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """The finalizer of SplitMix64, spreading every bit of x over every bit of the hash"""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def hash_cells(cells: np.ndarray) -> np.ndarray:
+    """
+    :param cells: (N, D) C-contiguous int64 cell indices of N points along D axes
+    :return: (N,) 64-bit hash of the cell indices of each point
+    """
+    with np.errstate(over="ignore"):
+        key = np.zeros(len(cells), dtype=np.uint64)
+        for column in cells.view(np.uint64).T:
+            key = _mix(key ^ (column + np.uint64(0x9E3779B97F4A7C15)))
+        return key
+
+
+def _same_cell(cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Pairs of points, by index, such that the points of each cell are connected"""
+    keys = hash_cells(cells)
+    order = np.argsort(keys)
+    keys = keys[order]
+    equal = np.flatnonzero(keys[1:] == keys[:-1])
+    a, b = order[equal], order[equal + 1]
+    # points with equal hashes are in the same cell unless their hashes collide, which
+    # would at worst keep a pair of points apart
+    same = np.all(cells[a] == cells[b], axis=1)
+    return a[same], b[same]
+
+
+def _components(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """The least node connected to each of n nodes by the edges between a[i] and b[i]"""
+    labels = np.arange(n)
+    while True:
+        least = np.minimum(labels[a], labels[b])
+        changed = labels.copy()
+        np.minimum.at(changed, a, least)
+        np.minimum.at(changed, b, least)
+        changed = changed[changed]
+        if np.array_equal(changed, labels):
+            return labels
+        labels = changed
+
+
+def weld_labels(points: np.ndarray, tolerance: Optional[float] = None) -> np.ndarray:
+    """
+    Weld points within tolerance of each other along every axis; points further apart than
+    twice the tolerance along some axis are only welded through points between them
+
+    :param points: an (N, D) array of points
+    :param tolerance: the tolerance, by default constants.WELD_TOLERANCE; 0 welds only
+                      identical points
+    :return: the (N,) index of the first point welded with every point
+    :raises ValueError: if points is not a 2D array, or if tolerance is negative
+    """
+    if tolerance is None:
+        tolerance = constants.WELD_TOLERANCE
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2:
+        raise ValueError("Points must be an (N, D) array")
+    if tolerance < 0:
+        raise ValueError("Must have a non-negative tolerance")
+    if len(points) < 2:
+        return np.arange(len(points))
+    if tolerance == 0:
+        # adding 0.0 turns -0.0 into 0.0, so both have the same bits
+        pairs = [_same_cell(np.ascontiguousarray(points + 0.0).view(np.int64))]
+    else:
+        scaled = points / (2 * tolerance)
+        pairs = [
+            _same_cell(np.floor(scaled + shift).astype(np.int64))
+            for shift in itertools.product((0.0, 0.5), repeat=points.shape[1])
+        ]
+    return _components(
+        len(points),
+        np.concatenate([a for a, _ in pairs]),
+        np.concatenate([b for _, b in pairs]),
+    )
+
+
+@instrumentation.timed()
+def intern_points(
+    points: np.ndarray, tolerance: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Intern points as integer vertex IDs, welding them as by weld_labels
+
+    :param points: an (N, D) array of points
+    :param tolerance: the tolerance, by default constants.WELD_TOLERANCE; 0 welds only
+                      identical points
+    :return: an (M, D) array of the vertices, numbered in the order their first point
+             appears, each at its first point, and the (N,) vertex ID of every point
+    :raises ValueError: if points is not a 2D array, or if tolerance is negative
+    """
+    points = np.asarray(points, dtype=np.float64)
+    labels = weld_labels(points, tolerance)
+    # every point is labelled by the first point of its vertex, so vertices are numbered
+    # by counting the points which are their own label
+    first = labels == np.arange(len(labels))
+    ids = np.cumsum(first) - 1
+    return points[first], ids[labels]
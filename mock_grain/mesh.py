@@ -1,49 +1,349 @@
-from copy import deepcopy
-from typing import Iterator, Mapping, Set
+"""An immutable, array-backed mesh"""
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Set
 
-from typedefs import Point
+import numpy as np
+
+from . import constants
+from . import instrumentation
+from .interning import intern_points, weld_labels
+from .spatial import SpatialIndex
+from .typedefs import Point
 
 
 class Mesh(Mapping[Point, Set[Point]]):
     """
     An immutable mapping storing a mesh as an adjacency list: maps vertices to the vertices
     they have edges with.
+
+    Vertices are stored as an (N, 3) float64 array and edges in compressed sparse row (CSR)
+    form, so the neighbors of vertex i are vertices[indices[indptr[i]:indptr[i + 1]]]. The
+    points of 2D meshes are stored with a z-value of 0 and dim == 2. The mapping interface
+    is a lazy view over these arrays.
     """
 
-    def __init__(self, mapping: Mapping[Point, Set[Point]]):
+    __slots__ = [
+        "__vertices",
+        "__indptr",
+        "__indices",
+        "__dim",
+        "__points",
+        "__index",
+        "__spatial",
+    ]
+
+    @instrumentation.timed()
+    def __init__(
+        self, mapping: Mapping[Point, Set[Point]], tolerance: Optional[float] = None
+    ):
         """
         Construct a new mesh from the provided mapping
 
         :param mapping: a mapping
+        :param tolerance: if provided, points of the mapping within this tolerance of each
+                          other along every axis are welded into one vertex, as by
+                          interning.weld_labels, dropping the edges this collapses; by
+                          default points must match exactly
         :raises ValueError: if the mesh mapping has any points with a z-value less than 0, or
                             if the mesh mapping has any vertices which are not
                             non-trivially cyclic (cycle of length > 2), or
                             if the mesh mapping is directed: j in mesh[i] but not i in mesh[j],
                             or if the union of value sets is not the same as the set of keys,
-                            or if the mesh mapping has no point with a z-value of 0
+                            or if the mesh mapping has no point with a z-value of 0, or
+                            if the points of the mesh mapping differ in dimension
         """
-        values = {v for vs in mapping.values() for v in vs}
-        if mapping.keys() != values:
+        points = list(mapping)
+        dims = {len(point) for point in points}
+        if len(dims) > 1:
+            raise ValueError("Mesh mapping has points of differing dimensions")
+        dim = dims.pop() if dims else 3
+        if tolerance is not None:
+            self.__weld(mapping, points, dim, tolerance)
+            return
+        n = len(points)
+        index = {point: i for i, point in enumerate(points)}
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(
+            np.fromiter((len(vs) for vs in mapping.values()), dtype=np.int64, count=n),
+            out=indptr[1:],
+        )
+        try:
+            indices = np.fromiter(
+                (index[v] for vs in mapping.values() for v in vs),
+                dtype=np.int64,
+                count=int(indptr[-1]),
+            )
+        except KeyError:
+            raise ValueError(
+                "There exists a point which is only a key or a value"
+            ) from None
+        vertices = np.zeros((n, 3), dtype=np.float64)
+        if n:
+            vertices[:, :dim] = points
+        self.__set_arrays(vertices, indptr, indices, dim)
+        self.__validate()
+
+    def __weld(
+        self,
+        mapping: Mapping[Point, Set[Point]],
+        points: List[Point],
+        dim: int,
+        tolerance: float,
+    ):
+        values = [v for vs in mapping.values() for v in vs]
+        counts = np.fromiter(
+            (len(vs) for vs in mapping.values()), dtype=np.int64, count=len(points)
+        )
+        try:
+            coordinates = np.array(points + values, dtype=np.float64).reshape(-1, dim)
+        except ValueError:
+            raise ValueError(
+                "Mesh mapping has points of differing dimensions"
+            ) from None
+        vertices, ids = intern_points(coordinates, tolerance)
+        keys = ids[: len(points)]
+        # vertices are numbered in the order their first point appears, keys first, so a
+        # vertex of no key is numbered after every vertex of one
+        n = int(keys.max()) + 1 if len(keys) else 0
+        if len(values) and ids[len(points) :].max() >= n:
             raise ValueError("There exists a point which is only a key or a value")
-        has_z = False
-        for point in mapping:
-            if len(point) >= 3:
-                has_z = True
-                if point[2] < 0:
-                    raise ValueError("Mesh mapping has point with z-value less than 0")
-        if has_z:
-            if min(point[2] for point in mapping.keys()) != 0:
+        self.__set_edges(vertices, np.repeat(keys, counts), ids[len(points) :], dim)
+        self.__validate()
+
+    def __set_edges(
+        self,
+        vertices: np.ndarray,
+        rows: np.ndarray,
+        columns: np.ndarray,
+        dim: int,
+    ):
+        """Set the arrays of this mesh from its vertices and its edges, from rows to
+        columns, which may be repeated or loops where vertices were welded"""
+        n = len(vertices)
+        kept = rows != columns
+        edges = np.sort(rows[kept] * n + columns[kept])
+        edges = edges[np.diff(edges, prepend=-1) != 0]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edges // n, minlength=n), out=indptr[1:])
+        padded = np.zeros((n, 3), dtype=np.float64)
+        padded[:, :dim] = vertices
+        self.__set_arrays(padded, indptr, edges % n, dim)
+
+    @classmethod
+    @instrumentation.timed()
+    def from_arrays(
+        cls, vertices: np.ndarray, indptr: np.ndarray, indices: np.ndarray
+    ) -> "Mesh":
+        """
+        Construct a new mesh directly from its vertex and CSR adjacency arrays
+
+        :param vertices: an (N, 2) or (N, 3) array of vertex coordinates
+        :param indptr: an (N + 1,) array of offsets into indices, starting at 0
+        :param indices: the concatenated neighbor indices of every vertex
+        :return: the mesh over the provided arrays
+        :raises ValueError: if the arrays are malformed, or for the same reasons as
+                            Mesh(mapping)
+        """
+        vertices = np.asarray(vertices, dtype=np.float64)
+        indptr = np.asarray(indptr, dtype=np.int64)
+        indices = np.asarray(indices, dtype=np.int64)
+        if vertices.ndim != 2 or vertices.shape[1] not in (2, 3):
+            raise ValueError("Vertices must be an (N, 2) or (N, 3) array")
+        n, dim = vertices.shape
+        if indptr.shape != (n + 1,) or indptr[0] != 0 or np.any(np.diff(indptr) < 0):
+            raise ValueError("indptr must be non-decreasing offsets of length N + 1")
+        if indices.shape != (indptr[-1],):
+            raise ValueError("indices must have length indptr[-1]")
+        if indices.size and (indices.min() < 0 or indices.max() >= n):
+            raise ValueError("indices refer to vertices outside the mesh")
+        padded = np.zeros((n, 3), dtype=np.float64)
+        padded[:, :dim] = vertices
+        mesh = cls.__new__(cls)
+        mesh.__set_arrays(padded, indptr.copy(), indices.copy(), dim)
+        mesh.__validate()
+        return mesh
+
+    @classmethod
+    def from_trusted(
+        cls, vertices: np.ndarray, indptr: np.ndarray, indices: np.ndarray, dim: int
+    ) -> "Mesh":
+        """
+        Construct a new mesh from arrays already known to form a valid mesh, such as those
+        of another mesh, without copying or validating them. The arrays are made read-only.
+        If constants.VALIDATE_TRUSTED is set, they are validated as by from_arrays instead
+
+        :param vertices: an (N, 3) float64 array of vertex coordinates, with z-values of 0
+                         if dim == 2
+        :param indptr: an (N + 1,) int64 array of offsets into indices, starting at 0
+        :param indices: the concatenated int64 neighbor indices of every vertex
+        :param dim: the dimension, 2 or 3, of the points of the mesh
+        :return: the mesh over the provided arrays
+        """
+        if constants.VALIDATE_TRUSTED:
+            return cls.from_arrays(vertices[:, :dim], indptr, indices)
+        mesh = cls.__new__(cls)
+        mesh.__set_arrays(vertices, indptr, indices, dim)
+        return mesh
+
+    @classmethod
+    @instrumentation.timed()
+    def merge(
+        cls, meshes: Sequence["Mesh"], tolerance: Optional[float] = None
+    ) -> "Mesh":
+        """
+        Merge meshes into one, welding their vertices within tolerance of each other along
+        every axis, as by interning.weld_labels, and dropping the edges this repeats or
+        collapses
+
+        :param meshes: the meshes, all of the same dimension
+        :param tolerance: the tolerance, by default constants.WELD_TOLERANCE
+        :return: the merged mesh, whose vertices are numbered in the order they first
+                 appear in meshes
+        :raises ValueError: if there are no meshes, if they differ in dimension, or if the
+                            merged mesh is invalid, as for Mesh(mapping)
+        """
+        if not meshes:
+            raise ValueError("Must merge at least one mesh")
+        dims = {mesh.dim for mesh in meshes}
+        if len(dims) > 1:
+            raise ValueError("Meshes differ in dimension")
+        dim = dims.pop()
+        starts = np.cumsum([0] + [len(mesh) for mesh in meshes])
+        vertices, ids = intern_points(
+            np.concatenate([mesh.vertices[:, :dim] for mesh in meshes]), tolerance
+        )
+        rows = np.concatenate(
+            [
+                np.repeat(np.arange(start, start + len(mesh)), np.diff(mesh.indptr))
+                for mesh, start in zip(meshes, starts)
+            ]
+        )
+        columns = np.concatenate(
+            [mesh.indices + start for mesh, start in zip(meshes, starts)]
+        )
+        mesh = cls.__new__(cls)
+        mesh.__set_edges(vertices, ids[rows], ids[columns], dim)
+        mesh.__validate()
+        return mesh
+
+    def find(self, points: np.ndarray, tolerance: Optional[float] = None) -> np.ndarray:
+        """
+        Find the vertices of this mesh at points, to within tolerance along every axis
+
+        :param points: an (M, D) array of points, with D the dimension of this mesh
+        :param tolerance: the tolerance, by default constants.WELD_TOLERANCE
+        :return: the (M,) index of the vertex at every point, or -1 for points at none
+        :raises ValueError: if points are not of the dimension of this mesh
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != self.__dim:
+            raise ValueError(f"Points must be an (M, {self.__dim}) array")
+        n = len(self)
+        labels = weld_labels(
+            np.concatenate([self.__vertices[:, : self.__dim], points]), tolerance
+        )[n:]
+        return np.where(labels < n, labels, -1)
+
+    def __set_arrays(
+        self, vertices: np.ndarray, indptr: np.ndarray, indices: np.ndarray, dim: int
+    ):
+        for array in (vertices, indptr, indices):
+            array.setflags(write=False)
+        self.__vertices = vertices
+        self.__indptr = indptr
+        self.__indices = indices
+        self.__dim = dim
+        self.__points: Optional[List[Point]] = None
+        self.__index: Optional[Dict[Point, int]] = None
+        self.__spatial: Optional[SpatialIndex] = None
+
+    def __validate(self):
+        n = len(self)
+        indptr, indices = self.__indptr, self.__indices
+        if np.any(np.bincount(indices, minlength=n) == 0):
+            raise ValueError("There exists a point which is only a key or a value")
+        if self.__dim == 3 and n:
+            z = self.__vertices[:, 2]
+            if z.min() < 0:
+                raise ValueError("Mesh mapping has point with z-value less than 0")
+            if z.min() != 0:
                 raise ValueError("Mesh mapping has no point with z-value of 0")
-        for k, v in ((k, v) for k, vs in mapping.items() for v in vs):
-            if k not in mapping[v]:
-                raise ValueError("Mesh mapping is directed")
-        self.mapping = deepcopy(mapping)
+        rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+        forward = np.sort(rows * n + indices)
+        if np.any(forward[1:] == forward[:-1]):
+            raise ValueError("Mesh mapping has a repeated edge")
+        if not np.array_equal(forward, np.sort(indices * n + rows)):
+            raise ValueError("Mesh mapping is directed")
+
+    @property
+    def vertices(self) -> np.ndarray:
+        """
+        :return: a read-only (N, 3) array of the coordinates of every vertex
+        """
+        return self.__vertices
+
+    @property
+    def indptr(self) -> np.ndarray:
+        """
+        :return: a read-only (N + 1,) array of offsets into indices for every vertex
+        """
+        return self.__indptr
+
+    @property
+    def indices(self) -> np.ndarray:
+        """
+        :return: a read-only array of the concatenated neighbor indices of every vertex
+        """
+        return self.__indices
+
+    @property
+    def dim(self) -> int:
+        """
+        :return: the dimension, 2 or 3, of the points of this mesh
+        """
+        return self.__dim
+
+    @property
+    def spatial_index(self) -> SpatialIndex:
+        """
+        :return: a spatial index over the vertices of this mesh, in its dimension, built on
+                 first use
+        """
+        if self.__spatial is None:
+            self.__spatial = SpatialIndex(self.__vertices[:, : self.__dim])
+        return self.__spatial
+
+    @property
+    def mapping(self) -> Mapping[Point, Set[Point]]:
+        """
+        :return: this mesh as a mapping from vertices to the vertices they have edges with
+        """
+        return self
+
+    def __point_list(self) -> List[Point]:
+        if self.__points is None:
+            coords = self.__vertices[:, : self.__dim].tolist()
+            self.__points = list(map(tuple, coords))
+        return self.__points
+
+    def __point_index(self) -> Dict[Point, int]:
+        if self.__index is None:
+            self.__index = {p: i for i, p in enumerate(self.__point_list())}
+        return self.__index
 
     def __getitem__(self, p: Point) -> Set[Point]:
-        return self.mapping[p]
+        i = self.__point_index()[p]
+        points = self.__point_list()
+        neighbors = self.__indices[self.__indptr[i] : self.__indptr[i + 1]]
+        return {points[j] for j in neighbors.tolist()}
+
+    def __contains__(self, p) -> bool:
+        try:
+            return p in self.__point_index()
+        except TypeError:
+            return False
 
     def __len__(self) -> int:
-        return len(self.mapping)
+        return self.__vertices.shape[0]
 
     def __iter__(self) -> Iterator[Point]:
-        yield from self.mapping
+        yield from self.__point_list()
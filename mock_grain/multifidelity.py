@@ -0,0 +1,239 @@
+"""
+Scoring populations coarse to fine: every grain is scored by a cheap, coarse fitness, and
+only the most promising are promoted to successively finer and more expensive ones
+"""
+import math
+import time
+from typing import Callable, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from .burnback import Regression
+from .evaluation import Fitness, PopulationEvaluator
+from .grains import Grain, Grain2D, SymmetricGrain2D
+from .population import Grain2DBatch
+from .simplify import douglas_peucker
+
+
+class Tier(NamedTuple):
+    """A fidelity at which grains are scored, and which of them are promoted past it"""
+
+    fitness: Fitness  # scores a grain at this fidelity; must be picklable
+    keep: float = 1.0  # fraction of the grains scored at this tier which are promoted
+    # grains scoring within this much of the worst promoted score are promoted too
+    band: float = 0.0
+
+
+class TierStats(NamedTuple):
+    """What happened at one tier of a multi-fidelity evaluation"""
+
+    evaluated: int  # number of grains scored at this tier
+    promoted: int  # number of those promoted to the next tier
+    seconds: float  # time spent scoring at this tier
+    # rank correlation between the scores at this tier and at the next, over the grains
+    # promoted to it; nan for the last tier, or if fewer than 2 grains were promoted
+    rank_correlation: float
+    # mean absolute difference between the scores at this tier and at the next, over
+    # the grains promoted to it; nan for the last tier, or if none were promoted
+    mean_difference: float
+
+
+class MultiFidelityResult(NamedTuple):
+    """The scores of a population, and how far each grain got"""
+
+    scores: np.ndarray  # the score of each grain at the finest tier it reached
+    tier: np.ndarray  # the index of the finest tier each grain reached
+    stats: List[TierStats]  # what happened at each tier reached by any grain
+
+
+class BurnbackFitness:
+    """
+    A fitness at a given fidelity: scores a 2D grain from its burnback at a given
+    resolution, optionally after simplifying its net. Picklable if score is, so it can be
+    scored in worker processes
+    """
+
+    __slots__ = ["__score", "__resolution", "__web_steps", "__tolerance"]
+
+    def __init__(
+        self,
+        score: Callable[[Regression], float],
+        resolution: int = 500,
+        web_steps: int = 100,
+        tolerance: Optional[float] = None,
+    ):
+        """
+        :param score: maps the regression of a grain to its score
+        :param resolution: number of grid cells along the outer diameter
+        :param web_steps: number of web distances the regression is sampled at
+        :param tolerance: if provided, nets are first simplified by douglas_peucker with
+                          this tolerance
+        """
+        self.__score = score
+        self.__resolution = resolution
+        self.__web_steps = web_steps
+        self.__tolerance = tolerance
+
+    def __call__(self, grain: Grain2D) -> float:
+        if self.__tolerance is not None and not isinstance(grain, SymmetricGrain2D):
+            net = douglas_peucker(grain.net, self.__tolerance, grain.outer_diameter)
+            grain = Grain2D.from_trusted(
+                grain.outer_diameter, grain.length, grain.inhibited_ends, net
+            )
+        regression = grain.burnback(self.__resolution, self.__web_steps)
+        return self.__score(regression)
+
+
+def _ranks(values: np.ndarray) -> np.ndarray:
+    """The rank of each value, tied values sharing the mean of the ranks they span"""
+    order = np.argsort(values, kind="stable")
+    ordered = values[order]
+    # the first and one past the last position in order of each run of equal values
+    starts = np.flatnonzero(np.concatenate([[True], ordered[1:] != ordered[:-1]]))
+    stops = np.append(starts[1:], len(values))
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[order] = np.repeat((starts + stops - 1) / 2, stops - starts)
+    return ranks
+
+
+def _rank_correlation(a: np.ndarray, b: np.ndarray) -> float:
+    """Spearman's rank correlation of two equally long arrays, nan if it is undefined"""
+    if len(a) < 2:
+        return math.nan
+    ra, rb = _ranks(a), _ranks(b)
+    ra -= ra.mean()
+    rb -= rb.mean()
+    norm = np.sqrt(np.sum(ra * ra) * np.sum(rb * rb))
+    return float(np.sum(ra * rb) / norm) if norm else math.nan
+
+
+def _promote(
+    scores: np.ndarray, keep: float, band: float, maximize: bool
+) -> np.ndarray:
+    """Indices of the best keep of scores, and of any within band of the worst of those"""
+    if not len(scores) or keep <= 0:
+        return np.empty(0, dtype=np.int64)
+    signed = scores if maximize else -scores
+    count = min(len(scores), max(1, math.ceil(keep * len(scores))))
+    cutoff = np.partition(signed, len(scores) - count)[len(scores) - count]
+    return np.flatnonzero(signed >= cutoff - band)
+
+
+class MultiFidelityEvaluator:
+    """
+    Scores populations of grains through a sequence of tiers of increasing fidelity. Every
+    grain is scored at the first tier; at each tier, the best fraction of the grains scored
+    there, and any close enough to the worst of those that the coarse score can not tell
+    them apart, are promoted and scored again at the next. Each grain ends with the score of
+    the finest tier it reached, and each evaluation reports per tier timings and how well
+    its scores agreed with those of the next tier, for tuning what is promoted
+    """
+
+    __slots__ = ["__tiers", "__maximize", "__evaluator", "__stats"]
+
+    def __init__(
+        self,
+        tiers: Sequence[Tier],
+        maximize: bool = True,
+        workers: Optional[int] = 1,
+        **evaluator_options,
+    ):
+        """
+        Construct an evaluator; every tier scores populations in the pool of one
+        PopulationEvaluator
+
+        :param tiers: the tiers, from the coarsest to the finest; keep and band of the last
+                      tier are unused
+        :param maximize: whether higher scores are better
+        :param workers: number of worker processes shared by the tiers, as for
+                        PopulationEvaluator; by default populations are scored in this
+                        process
+        :param evaluator_options: other options of the PopulationEvaluator
+        :raises ValueError: if there are no tiers, or if a tier keeps a fraction outside of
+                            [0, 1] or has a negative band
+        """
+        if not tiers:
+            raise ValueError("Must have at least one tier")
+        for tier in tiers:
+            if not 0 <= tier.keep <= 1:
+                raise ValueError("Must keep a fraction of grains between 0 and 1")
+            if tier.band < 0:
+                raise ValueError("Must have a non-negative band")
+        self.__tiers = list(tiers)
+        self.__maximize = maximize
+        self.__evaluator = PopulationEvaluator(
+            [tier.fitness for tier in tiers], workers, **evaluator_options
+        )
+        self.__stats: List[TierStats] = []
+
+    @property
+    def tiers(self) -> List[Tier]:
+        """
+        :return: the tiers, from the coarsest to the finest
+        """
+        return list(self.__tiers)
+
+    @property
+    def stats(self) -> List[TierStats]:
+        """
+        :return: the statistics of each tier of the last evaluation
+        """
+        return list(self.__stats)
+
+    def evaluate(
+        self, population: Union[Grain2DBatch, Sequence[Grain]]
+    ) -> MultiFidelityResult:
+        """
+        Score every grain of a population, coarse to fine
+
+        :param population: a population of 2D grains, or a sequence of 2D and 3D grains
+        :return: the score of every grain at the finest tier it reached, in the order of
+                 the population, that tier, and the statistics of each tier
+        """
+        n = len(population)
+        scores = np.zeros(n, dtype=np.float64)
+        reached = np.zeros(n, dtype=np.int64)
+        active = np.arange(n)
+        stats = []
+        previous: Optional[np.ndarray] = None
+        for t, tier in enumerate(self.__tiers):
+            if t and not len(active):
+                break
+            if isinstance(population, Grain2DBatch):
+                members = population.select(active)
+            else:
+                members = [population[i] for i in active]
+            start = time.perf_counter()
+            tier_scores = self.__evaluator.evaluate(members, t)
+            seconds = time.perf_counter() - start
+            if previous is not None:
+                # now the promoted grains of the last tier have been scored again, see how
+                # well the two tiers agreed on them
+                stats[-1] = stats[-1]._replace(
+                    rank_correlation=_rank_correlation(previous, tier_scores),
+                    mean_difference=float(np.mean(np.abs(previous - tier_scores))),
+                )
+            scores[active] = tier_scores
+            reached[active] = t
+            promoted = np.empty(0, dtype=np.int64)
+            if t + 1 < len(self.__tiers):
+                promoted = _promote(tier_scores, tier.keep, tier.band, self.__maximize)
+            stats.append(
+                TierStats(len(active), len(promoted), seconds, math.nan, math.nan)
+            )
+            previous = tier_scores[promoted]
+            active = active[promoted]
+        self.__stats = stats
+        return MultiFidelityResult(scores, reached, stats)
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        self.__evaluator.close()
+
+    def __enter__(self) -> "MultiFidelityEvaluator":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
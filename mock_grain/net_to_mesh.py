@@ -1,11 +1,26 @@
 """Functions for converting nets to meshes"""
-from typing import Dict, Set
+from typing import Dict, Optional, Set
 
-from mock_grain.mesh import Mesh
-from mock_grain.typedefs import Net, Point3D
+import numpy as np
+
+from . import instrumentation
+from .mesh import Mesh
+from .typedefs import Net, Point3D
+
+
+def _ring_arrays(net: Net) -> Optional[np.ndarray]:
+    """
+    :return: the points of net as an (N, 2) array if they form a ring with N >= 3 distinct
+             points, so its mesh is valid by construction; otherwise None
+    """
+    n = len(net)
+    if n < 3 or len(set(net)) != n:
+        return None
+    return np.asarray(net, dtype=np.float64).reshape(n, 2)
 
 
 # noinspection PyPep8Naming
+@instrumentation.timed()
 def net_to_2D_mesh(net: Net) -> Mesh:
     """
     Convert a net to its equivalent mesh representation, where points are 2D
@@ -13,12 +28,21 @@ def net_to_2D_mesh(net: Net) -> Mesh:
     :param net: net to convert
     :return: the equivalent 2D mesh representation to this net
     """
+    points = _ring_arrays(net)
     n = len(net)
-    mapping = {net[i]: {net[i - 1], net[(i + 1) % n]} for i in range(n)}
-    return Mesh(mapping)
+    if points is None:
+        mapping = {net[i]: {net[i - 1], net[(i + 1) % n]} for i in range(n)}
+        return Mesh(mapping)
+    # vertex i is connected to vertices i - 1 and i + 1
+    ring = np.arange(n)
+    indices = np.stack([np.roll(ring, 1), np.roll(ring, -1)], axis=1).ravel()
+    vertices = np.zeros((n, 3))
+    vertices[:, :2] = points
+    return Mesh.from_trusted(vertices, np.arange(0, 2 * n + 1, 2), indices, 2)
 
 
 # noinspection PyPep8Naming
+@instrumentation.timed()
 def net_to_3D_mesh(net: Net, length: float) -> Mesh:
     """
     Convert a net to its equivalent mesh representation, where points are 3D
@@ -27,6 +51,18 @@ def net_to_3D_mesh(net: Net, length: float) -> Mesh:
     :param length: length of grain
     :return: the equivalent 3D mesh representation to this net
     """
+    points = _ring_arrays(net)
+    if points is not None and length > 0:
+        # vertex i is point i of the bottom ring and vertex n + i point i of the top ring;
+        # each is connected to its neighbors in its ring and to its twin in the other
+        n = len(points)
+        ring = np.arange(n)
+        bottom = np.stack([np.roll(ring, 1), np.roll(ring, -1), ring + n], axis=1)
+        vertices = np.zeros((2 * n, 3))
+        vertices[:, :2] = np.concatenate([points, points])
+        vertices[n:, 2] = length
+        indices = np.concatenate([bottom, (bottom + n) % (2 * n)]).ravel()
+        return Mesh.from_trusted(vertices, np.arange(0, 6 * n + 1, 3), indices, 3)
     mesh_2d = net_to_2D_mesh(net)
     mesh_3d_map: Dict[Point3D, Set[Point3D]] = {}
     for u, adjacent in mesh_2d.items():
@@ -0,0 +1,357 @@
+"""Functions for checking the invariants of nets: orientation, edge lengths and simplicity"""
+import bisect
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from .constants import InhibitedEnds
+from .population import Grain2DBatch
+from .typedefs import Net, Point2D
+
+# nets with at most this many points are checked for simplicity by testing every pair of
+# edges at once, which beats the sweep for small nets
+_BRUTE_FORCE_POINTS = 64
+
+
+def signed_area(net: Net) -> float:
+    """
+    :param net: a net
+    :return: the area enclosed by net, positive if its points are in counterclockwise order
+             and negative if they are in clockwise order
+    """
+    points = np.asarray(net, dtype=np.float64).reshape(-1, 2)
+    x, y = points[:, 0], points[:, 1]
+    return float(np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)) / 2
+
+
+def is_counterclockwise(net: Net) -> bool:
+    """
+    :param net: a net
+    :return: whether the points of net are in counterclockwise order
+    """
+    return signed_area(net) > 0
+
+
+def min_edge_length(net: Net) -> float:
+    """
+    :param net: a net
+    :return: the length of the shortest edge of net, including the edge from its last
+             point back to its first; infinity if net has no points
+    """
+    points = np.asarray(net, dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        return float("inf")
+    d = np.roll(points, -1, axis=0) - points
+    return float(np.sqrt(np.min(np.sum(d * d, axis=1))))
+
+
+def _orient(a: Point2D, b: Point2D, c: Point2D) -> float:
+    """Positive if c is left of the line from a to b, negative if right, 0 if on it"""
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+
+class _Edge:
+    """An edge of a net, directed from its lexicographically least end to its greatest"""
+
+    __slots__ = ["left", "right", "index"]
+
+    def __init__(self, left: Point2D, right: Point2D, index: int):
+        self.left = left
+        self.right = right
+        self.index = index
+
+    def __lt__(self, other: "_Edge") -> bool:
+        # whether this edge is below other where both cross the sweep line; the edge which
+        # entered the sweep last is compared against the line of the other, which spans it
+        if self.left >= other.left:
+            o = _orient(other.left, other.right, self.left) or _orient(
+                other.left, other.right, self.right
+            )
+            return o < 0
+        o = _orient(self.left, self.right, other.left) or _orient(
+            self.left, self.right, other.right
+        )
+        return o > 0
+
+
+def _crosses(a: _Edge, b: _Edge, n: int) -> bool:
+    """Whether two edges of a net of n points meet anywhere they are not meant to"""
+    d1 = _orient(b.left, b.right, a.left)
+    d2 = _orient(b.left, b.right, a.right)
+    d3 = _orient(a.left, a.right, b.left)
+    d4 = _orient(a.left, a.right, b.right)
+    gap = (a.index - b.index) % n
+    if gap in (1, n - 1):
+        # consecutive edges share a point, and only meet elsewhere if they fold back
+        # along each other
+        if d1 or d2:
+            return False
+        shared = a.left if a.left in (b.left, b.right) else a.right
+        far_a = a.right if shared == a.left else a.left
+        far_b = b.right if shared == b.left else b.left
+        dot = (far_a[0] - shared[0]) * (far_b[0] - shared[0]) + (
+            far_a[1] - shared[1]
+        ) * (far_b[1] - shared[1])
+        return dot > 0
+    if ((d1 > 0 and d2 < 0) or (d1 < 0 and d2 > 0)) and (
+        (d3 > 0 and d4 < 0) or (d3 < 0 and d4 > 0)
+    ):
+        return True
+
+    def on(p, q, r):  # whether r, collinear with p and q, lies between them
+        return min(p[0], q[0]) <= r[0] <= max(p[0], q[0]) and min(p[1], q[1]) <= r[
+            1
+        ] <= max(p[1], q[1])
+
+    return (
+        (d1 == 0 and on(b.left, b.right, a.left))
+        or (d2 == 0 and on(b.left, b.right, a.right))
+        or (d3 == 0 and on(a.left, a.right, b.left))
+        or (d4 == 0 and on(a.left, a.right, b.right))
+    )
+
+
+def _is_simple_sweep(points: List[Point2D]) -> bool:
+    """
+    Shamos-Hoey: sweep a vertical line across the edges, keeping those it crosses ordered
+    from bottom to top, and test only edges which become neighbors in that order. The
+    first intersection is always found between neighbors, so only O(n) pairs are tested.
+    The order is a plain list kept sorted by bisection, so each event also costs O(k) to
+    insert or remove an edge, where k is the most edges any vertical line crosses: this is
+    O(n log n + n k), which is O(n^2) at worst, for nets whose edges are mostly stacked
+    above one another, but k is a few dozen at most for the ports of grains
+    """
+    n = len(points)
+    edges = []
+    for i in range(n):
+        p, q = points[i], points[(i + 1) % n]
+        edges.append(_Edge(min(p, q), max(p, q), i))
+    # at the same point, edges enter before others leave, so touching edges are compared
+    events = sorted(
+        [(e.left, 0, e.index) for e in edges] + [(e.right, 1, e.index) for e in edges]
+    )
+    status: List[_Edge] = []
+    for _, leaving, i in events:
+        edge = edges[i]
+        if not leaving:
+            at = bisect.bisect_left(status, edge)
+            status.insert(at, edge)
+            neighbors = status[at - 1 : at] + status[at + 1 : at + 2]
+            if any(_crosses(edge, other, n) for other in neighbors):
+                return False
+        else:
+            at = bisect.bisect_left(status, edge)
+            while status[at] is not edge:
+                at += 1
+            del status[at]
+            if 0 < at < len(status) and _crosses(status[at - 1], status[at], n):
+                return False
+    return True
+
+
+def _is_simple_pairwise(points: np.ndarray) -> bool:
+    """Test every pair of edges of a small net for an intersection at once"""
+    n = len(points)
+    a, b = points, np.roll(points, -1, axis=0)
+    i, j = np.triu_indices(n, 1)
+
+    def orient(p, q, r):
+        return (q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) - (
+            q[..., 1] - p[..., 1]
+        ) * (r[..., 0] - p[..., 0])
+
+    def on(p, q, r):
+        lo, hi = np.minimum(p, q), np.maximum(p, q)
+        return np.all((lo <= r) & (r <= hi), axis=-1)
+
+    d1, d2 = orient(a[j], b[j], a[i]), orient(a[j], b[j], b[i])
+    d3, d4 = orient(a[i], b[i], a[j]), orient(a[i], b[i], b[j])
+    proper = (d1 * d2 < 0) & (d3 * d4 < 0)
+    touch = (
+        ((d1 == 0) & on(a[j], b[j], a[i]))
+        | ((d2 == 0) & on(a[j], b[j], b[i]))
+        | ((d3 == 0) & on(a[i], b[i], a[j]))
+        | ((d4 == 0) & on(a[i], b[i], b[j]))
+    )
+    # consecutive edges share a point, and only meet elsewhere if they fold back along each
+    # other: edge i then edge j = i + 1 share b[i] == a[j]; edge 0 follows edge n - 1
+    consecutive = (j - i == 1) | ((i == 0) & (j == n - 1))
+    first = np.where(j - i == 1, i, j)
+    second = np.where(j - i == 1, j, i)
+    back = a[first] - b[first]
+    ahead = b[second] - a[second]
+    folds = (orient(a[first], b[first], b[second]) == 0) & (
+        np.sum(back * ahead, axis=-1) > 0
+    )
+    return not np.any(np.where(consecutive, folds, proper | touch))
+
+
+def is_simple(net: Net) -> bool:
+    """
+    Check whether a net is a simple polygon: no two of its edges meet, except consecutive
+    edges at the point they share. Repeated points, edges which touch and edges which fold
+    back along each other all make a net not simple
+
+    :param net: a net
+    :return: whether net is a simple polygon with at least 3 points
+    """
+    points = np.asarray(net, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3 or np.any(np.all(points == np.roll(points, -1, axis=0), axis=1)):
+        return False  # an edge of length 0 repeats a point
+    if len(points) <= _BRUTE_FORCE_POINTS:
+        return _is_simple_pairwise(points)
+    return _is_simple_sweep(list(map(tuple, points.tolist())))
+
+
+def is_valid_net(net: Net, min_edge: float = 0.0) -> bool:
+    """
+    Check the invariants of a net which can be checked without a grain
+
+    :param net: a net
+    :param min_edge: every edge of net must be longer than this
+    :return: whether net is a simple polygon whose edges are all longer than min_edge
+    """
+    return len(net) >= 3 and min_edge_length(net) > min_edge and is_simple(net)
+
+
+def check_nets(
+    nets: Union[Grain2DBatch, Sequence[Net]], min_edge: float = 0.0
+) -> np.ndarray:
+    """
+    Check the invariants of every net of a population at once, as a cheap filter before
+    evaluation; edge lengths are checked for every net first, and only nets which pass are
+    checked for simplicity
+
+    :param nets: a population of grains, whose constraints are also checked, or of nets
+    :param min_edge: every edge of a valid net must be longer than this
+    :return: a boolean array which is True for each valid net
+    """
+    if not isinstance(nets, Grain2DBatch):
+        nets = Grain2DBatch(nets, 1, 1, InhibitedEnds.NEITHER)
+        mask = np.ones(len(nets), dtype=bool)
+    else:
+        mask = nets.valid_mask()
+    points, offsets = nets.points, nets.offsets
+    counts = np.diff(offsets)
+    mask &= counts >= 3
+    # the edge after the last point of each net returns to its first point
+    following = np.arange(1, len(points) + 1)
+    following[offsets[1:][counts > 0] - 1] = offsets[:-1][counts > 0]
+    d = points[following] - points
+    edges = np.sum(d * d, axis=1)
+    shortest = np.full(len(counts), np.inf)
+    nonempty = counts > 0
+    shortest[nonempty] = np.minimum.reduceat(edges, offsets[:-1][nonempty])
+    mask &= shortest > min_edge**2
+    for i in np.flatnonzero(mask):
+        mask[i] = is_simple(points[offsets[i] : offsets[i + 1]])
+    return mask
+
+
+def _radial_net(radius: np.ndarray, angles: np.ndarray, jitter: float, seed) -> Net:
+    """Place a point along each angle at the given radius, optionally jittered"""
+    if jitter:
+        radius = radius * (
+            1 + jitter * np.random.default_rng(seed).uniform(-1, 1, len(radius))
+        )
+    points = np.stack([radius * np.cos(angles), radius * np.sin(angles)], axis=1)
+    return list(map(tuple, points.tolist()))
+
+
+def _check_points(n: int):
+    if n < 3:
+        raise ValueError("A net must have at least 3 points")
+
+
+def star_net(
+    n: int,
+    arms: int = 5,
+    inner_radius: float = 0.5,
+    outer_radius: float = 1.0,
+    jitter: float = 0.0,
+    seed: Optional[int] = None,
+) -> Net:
+    """
+    Generate a star-shaped net whose radius varies linearly with angle between the tips of
+    its arms and the valleys between them. Every point is at a distinct angle, in
+    counterclockwise order, so the net is simple
+
+    :param n: number of points of the net
+    :param arms: number of arms of the star
+    :param inner_radius: radius of the valleys between arms
+    :param outer_radius: radius of the tips of the arms
+    :param jitter: relative amplitude of uniform noise added to the radius of each point
+    :param seed: seed of the noise
+    :return: the resulting net
+    :raises ValueError: if n < 3
+    """
+    _check_points(n)
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    phase = np.abs((angles * arms / np.pi) % 2 - 1)  # 1 at each tip, 0 at each valley
+    radius = inner_radius + (outer_radius - inner_radius) * phase
+    return _radial_net(radius, angles, jitter, seed)
+
+
+def slot_net(
+    n: int,
+    length: float = 1.0,
+    radius: float = 0.25,
+    jitter: float = 0.0,
+    seed: Optional[int] = None,
+) -> Net:
+    """
+    Generate a slot (stadium) shaped net: the points within radius of a segment of length
+    along the x-axis, centered at (0, 0)
+
+    :param n: number of points of the net
+    :param length: length of the straight sides of the slot
+    :param radius: radius of the rounded ends of the slot
+    :param jitter: relative amplitude of uniform noise added to the radius of each point
+    :param seed: seed of the noise
+    :return: the resulting net
+    :raises ValueError: if n < 3
+    """
+    _check_points(n)
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    cos, sin = np.cos(angles), np.abs(np.sin(angles))
+    with np.errstate(divide="ignore"):
+        side = radius / sin  # where each ray leaves through a straight side
+    # otherwise it leaves through the circle about the nearer end of the segment
+    along = np.abs(cos) * length / 2
+    end = along + np.sqrt(np.maximum(along**2 - (length / 2) ** 2 + radius**2, 0))
+    return _radial_net(
+        np.where(np.abs(side * cos) <= length / 2, side, end), angles, jitter, seed
+    )
+
+
+def finocyl_net(
+    n: int,
+    fins: int = 6,
+    core_radius: float = 0.4,
+    fin_radius: float = 0.9,
+    fin_width: float = 0.1,
+    jitter: float = 0.0,
+    seed: Optional[int] = None,
+) -> Net:
+    """
+    Generate a finocyl net: a circular core with rectangular fins radiating from (0, 0)
+
+    :param n: number of points of the net
+    :param fins: number of evenly spaced fins
+    :param core_radius: radius of the core
+    :param fin_radius: distance from (0, 0) to the tip of each fin
+    :param fin_width: width of each fin
+    :param jitter: relative amplitude of uniform noise added to the radius of each point
+    :param seed: seed of the noise
+    :return: the resulting net
+    :raises ValueError: if n < 3
+    """
+    _check_points(n)
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    # the angle of each point from the axis of the nearest fin
+    offset = (angles + np.pi / fins) % (2 * np.pi / fins) - np.pi / fins
+    cos, sin = np.cos(offset), np.abs(np.sin(offset))
+    with np.errstate(divide="ignore"):
+        fin = np.minimum(fin_radius / cos, fin_width / 2 / sin)
+    fin[cos <= 0] = 0
+    return _radial_net(np.maximum(core_radius, fin), angles, jitter, seed)
@@ -0,0 +1,265 @@
+"""
+Exporting grains to openMotor, for full ballistic simulation of the best candidates.
+
+openMotor is an optional dependency, imported only when a grain is first exported. Grains
+are exported as subclasses of its FmmGrain: openMotor computes the core map and regression
+map of an FmmGrain with fast marching when a simulation is set up, and exported grains
+rasterize their net and compute an exact distance transform for it instead, keeping the
+maps of each map size so that a grain simulated again, or exported again by
+OpenMotorExporter, does not compute them again. The maps are derived from the regression
+map of the net on the grid of openMotor, so one computed already, as by regression_map, can
+be passed in to be reused rather than computed again.
+"""
+import functools
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from . import instrumentation
+from .burnback import RegressionMap, regression_map
+from .burnback3d import extruded_net
+from .cache import canonical_key
+from .constants import InhibitedEnds
+from .convert_units import scale_factor
+from .grains import Grain, Grain2D, Grain3D
+from .population import Grain2DBatch
+from .typedefs import Net
+
+# the unit of the geometry of grains, and of the properties of openMotor grains
+_UNIT = "in"
+_OPENMOTOR_UNIT = "m"
+_INHIBITED = {
+    InhibitedEnds.NEITHER: "Neither",
+    InhibitedEnds.TOP: "Top",
+    InhibitedEnds.BOTTOM: "Bottom",
+    InhibitedEnds.BOTH: "Both",
+}
+
+# the core map and regression map of a grain at a map size
+Maps = Tuple[np.ndarray, np.ma.MaskedArray]
+
+
+def _fmm_grain():
+    """openMotor's FmmGrain, imported on first use"""
+    try:
+        from motorlib.grain import FmmGrain
+    except ImportError as e:
+        raise ImportError(
+            "Exporting grains to openMotor requires its motorlib package"
+        ) from e
+    return FmmGrain
+
+
+@instrumentation.timed()
+def openmotor_maps(
+    net: Net,
+    outer_diameter: float,
+    map_dim: int,
+    regression: Optional[RegressionMap] = None,
+) -> Maps:
+    """
+    Compute the maps of a grain on the grid of openMotor: map_dim by map_dim samples,
+    spanning the outer diameter from edge to edge, in coordinates normalized such that the
+    outer radius is 1
+
+    :param net: the net of the grain, centered at (0, 0)
+    :param outer_diameter: outer diameter of the grain, in the units of the net
+    :param map_dim: number of samples along each side of the grid
+    :param regression: if provided, the regression map of net on the grid of openMotor,
+                       regression_map(net, outer_diameter * map_dim / (map_dim - 1),
+                       map_dim), whose distance field is used rather than computed again
+    :return: the core map, True where there is propellant, and the regression map, the web
+             at which each sample starts burning, masked outside the outer diameter
+    :raises ValueError: if map_dim is less than 2, or regression is not on the grid of
+                        openMotor
+    """
+    if map_dim < 2:
+        raise ValueError("Must have at least 2 samples along each side of the map")
+    spacing = outer_diameter / (map_dim - 1)
+    if regression is None:
+        # regression_map samples the centers of its cells, so a grid of cells one sample
+        # wider than the outer diameter has its centers on the samples of openMotor
+        regression = regression_map(net, spacing * map_dim, map_dim)
+    elif regression.port.shape != (map_dim, map_dim) or not np.isclose(
+        regression.cell_size, spacing
+    ):
+        raise ValueError("The regression map is not on the grid of openMotor")
+    samples = np.linspace(-1, 1, map_dim)
+    mask = samples[:, None] ** 2 + samples[None, :] ** 2 > 1
+    # the net lies within the outer diameter, so no sample masked out is in the port
+    distance = regression.distance / (outer_diameter / 2)
+    return ~regression.port, np.ma.MaskedArray(distance, mask)
+
+
+@functools.lru_cache(maxsize=None)
+def _grain_class(base: type) -> type:
+    """A subclass of openMotor's FmmGrain computing its maps from a net"""
+
+    class MockGrain(base):
+        """An openMotor grain whose core is the net of a mock_grain grain"""
+
+        geomName = "mock_grain"
+
+        def __init__(self):
+            super().__init__()
+            self.net: Net = []
+            self.netDiameter = 1.0
+            self.maps: Dict[int, Maps] = {}
+
+        def getMaps(self, map_dim: int) -> Maps:
+            if map_dim not in self.maps:
+                self.maps[map_dim] = openmotor_maps(self.net, self.netDiameter, map_dim)
+            return self.maps[map_dim]
+
+        def generateCoreMap(self):
+            self.coreMap = self.getMaps(self.mapDim)[0].copy()
+
+        def generateRegressionMap(self):
+            # what FmmGrain computes from its regression map, after fast marching
+            self.regressionMap = self.getMaps(self.mapDim)[1]
+            max_dist = float(np.ma.max(self.regressionMap))
+            self.wallWeb = self.unNormalize(max_dist)
+            webs = np.sort(self.regressionMap.compressed())
+            polled = np.arange(int(max_dist * self.mapDim) + 2) / self.mapDim
+            counts = len(webs) - np.searchsorted(webs, polled, side="right")
+            self.faceArea = np.array([self.mapToArea(count) for count in counts])
+            polled, face_area = np.append(polled, 1), np.append(self.faceArea, 0)
+            self.faceAreaFunc = lambda web: np.interp(web, polled, face_area)
+
+    return MockGrain
+
+
+def _net(grain: Grain) -> Net:
+    net = None
+    if isinstance(grain, Grain2D):
+        net = grain.net
+    elif isinstance(grain, Grain3D):
+        net = extruded_net(grain)
+        if net is None:
+            raise ValueError("openMotor only models grains of constant cross-section")
+        net = list(map(tuple, net.tolist()))
+    if net is None or len(net) < 3:
+        raise ValueError("Can only export grains with a port to openMotor")
+    return net
+
+
+@instrumentation.timed()
+def to_openMotor_grain(
+    grain: Grain,
+    map_dim: Optional[int] = None,
+    regression: Optional[RegressionMap] = None,
+):
+    """
+    Convert a grain to an openMotor grain with corresponding dimensions and geometry
+
+    :param grain: a 2D grain, or a 3D grain extruded from a net
+    :param map_dim: if provided, the maps of the grain at this map size are computed now
+    :param regression: if provided, with map_dim, the regression map of the net of grain
+                       on the grid of openMotor at that map size, as for openmotor_maps
+    :return: the openMotor grain, in SI units
+    :raises ValueError: if grain has no port, is a 3D grain not extruded from a net, or
+                        regression is provided without map_dim or not on its grid
+    :raises ImportError: if openMotor is not installed
+    """
+    if regression is not None and map_dim is None:
+        raise ValueError("A regression map needs the map size it was computed for")
+    net = _net(grain)
+    exported = _grain_class(_fmm_grain())()
+    factor = scale_factor(_UNIT, _OPENMOTOR_UNIT)
+    exported.setProperties(
+        {
+            "diameter": grain.outer_diameter * factor,
+            "length": grain.length * factor,
+            "inhibitedEnds": _INHIBITED[grain.inhibited_ends],
+        }
+    )
+    exported.net = net
+    exported.netDiameter = grain.outer_diameter
+    if regression is not None:
+        exported.maps[map_dim] = openmotor_maps(
+            net, grain.outer_diameter, map_dim, regression
+        )
+    elif map_dim is not None:
+        exported.getMaps(map_dim)
+    return exported
+
+
+class OpenMotorExporter:
+    """
+    Converts grains to openMotor grains, caching the exported grains, and so their maps,
+    by the canonical_key of their geometry: exporting a grain identical to one exported
+    before returns the same openMotor grain
+    """
+
+    __slots__ = ["__map_dim", "__maxsize", "__decimals", "__grains", "__hits"]
+
+    def __init__(
+        self, map_dim: Optional[int] = None, maxsize: int = 1024, decimals: int = 9
+    ):
+        """
+        :param map_dim: if provided, the maps of every grain exported are computed at this
+                        map size, which should be the mapDim of the simulations they will
+                        be part of
+        :param maxsize: maximum number of exported grains cached
+        :param decimals: number of decimal places grains are quantized to, as for
+                         canonical_key
+        :raises ValueError: if maxsize is negative
+        """
+        if maxsize < 0:
+            raise ValueError("Must have a non-negative maximum size")
+        self.__map_dim = map_dim
+        self.__maxsize = maxsize
+        self.__decimals = decimals
+        self.__grains: "OrderedDict[str, object]" = OrderedDict()
+        self.__hits = 0
+
+    @property
+    def hits(self) -> int:
+        """
+        :return: the number of grains exported from the cache
+        """
+        return self.__hits
+
+    def export(self, grain: Grain, regression: Optional[RegressionMap] = None):
+        """
+        :param grain: a 2D grain, or a 3D grain extruded from a net
+        :param regression: if provided, the regression map of the net of grain on the grid
+                           of openMotor at the map size of this exporter, as for
+                           openmotor_maps, used if grain has not been exported before
+        :return: the openMotor grain of grain, shared with every identical grain
+        :raises ValueError: if grain has no port, or is a 3D grain not extruded from a net,
+                            or regression is not on the grid of this exporter
+        :raises ImportError: if openMotor is not installed
+        """
+        key = canonical_key(grain, self.__decimals)
+        if key in self.__grains:
+            self.__grains.move_to_end(key)
+            self.__hits += 1
+            return self.__grains[key]
+        exported = to_openMotor_grain(grain, self.__map_dim, regression)
+        self.__grains[key] = exported
+        while len(self.__grains) > self.__maxsize:
+            self.__grains.popitem(last=False)
+        return exported
+
+    def export_batch(self, population: Union[Grain2DBatch, Sequence[Grain]]) -> List:
+        """
+        :param population: a population of 2D grains, or a sequence of 2D grains and of 3D
+                           grains extruded from nets
+        :return: the openMotor grain of every grain, in order
+        :raises ValueError: if a grain has no port, or is a 3D grain not extruded from a
+                            net
+        :raises ImportError: if openMotor is not installed
+        """
+        return [self.export(population[i]) for i in range(len(population))]
+
+    def clear(self):
+        """
+        Empty the cache of exported grains
+        """
+        self.__grains.clear()
+        self.__hits = 0
+
+    def __len__(self) -> int:
+        return len(self.__grains)
@@ -0,0 +1,368 @@
+"""
+Streaming candidates through the stages of a generation: construction and validation,
+simplification, cache lookup and evaluation.
+
+Every stage runs on its own thread and takes its items from a bounded queue, so a stage
+which falls behind blocks the stages before it instead of letting the generation pile up in
+memory, and cheap stages run while the expensive ones wait on worker processes. Items are
+dropped as soon as a stage rejects them, and leave the pipeline in the order they entered.
+"""
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from . import instrumentation
+from .cache import FitnessCache
+from .evaluation import Fitness, PopulationEvaluator
+from .grains import Grain
+
+# how often, in seconds, a stage blocked on a queue checks whether the pipeline was closed
+_POLL = 0.05
+
+
+class Scored(NamedTuple):
+    """A grain and its fitness, as emitted by an evaluation stage"""
+
+    grain: Grain
+    fitness: float
+
+
+class StageStats(NamedTuple):
+    """What one stage of a pipeline has done so far"""
+
+    name: str
+    received: int  # number of items taken from the queue before the stage
+    emitted: int  # number of items put on the queue after the stage
+    dropped: int  # number of items the stage rejected
+    busy: float  # seconds spent processing items, not waiting for them
+    throughput: float  # items received per busy second, or 0 before any
+    queue_depth: int  # number of items waiting in the queue before the stage
+    max_queue_depth: int  # greatest number of items seen waiting there
+    mean_queue_depth: float  # mean number of items waiting there when one was taken
+
+
+class _Failure:
+    """An exception raised by a stage, passed down the pipeline to be raised by it"""
+
+    __slots__ = ["error"]
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _Closed(Exception):
+    """Raised in the thread of a stage when the pipeline is closed"""
+
+
+_DONE = object()
+
+
+class _Stage:
+    __slots__ = [
+        "name",
+        "fn",
+        "batch_size",
+        "linger",
+        "drop",
+        "inbox",
+        "received",
+        "emitted",
+        "dropped",
+        "busy",
+        "max_depth",
+        "total_depth",
+    ]
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        drop: tuple = (),
+        batch_size: int = 0,
+        linger: float = 0.0,
+    ):
+        self.name = name
+        self.fn = fn
+        # stages taking batches are called with a list of up to batch_size items, taken
+        # until linger seconds after the first, and return a list of results; other
+        # stages are called with one item
+        self.batch_size = batch_size
+        self.linger = linger
+        self.drop = drop
+        self.inbox: Optional[queue.Queue] = None
+        self.received = 0
+        self.emitted = 0
+        self.dropped = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self.total_depth = 0
+
+    def stats(self) -> StageStats:
+        depth = self.inbox.qsize() if self.inbox is not None else 0
+        return StageStats(
+            name=self.name,
+            received=self.received,
+            emitted=self.emitted,
+            dropped=self.dropped,
+            busy=self.busy,
+            throughput=self.received / self.busy if self.busy else 0.0,
+            queue_depth=depth,
+            max_queue_depth=self.max_depth,
+            mean_queue_depth=self.total_depth / self.received if self.received else 0.0,
+        )
+
+
+class Pipeline:
+    """
+    A chain of stages each candidate of a source flows through, one thread per stage,
+    connected by bounded queues. Stages are added in order; iterating over the pipeline
+    runs it, and yields what comes out of its last stage. A pipeline can only be run once
+    """
+
+    __slots__ = [
+        "__source",
+        "__maxsize",
+        "__stages",
+        "__emitted",
+        "__threads",
+        "__closed",
+    ]
+
+    def __init__(self, source: Iterable, maxsize: int = 64):
+        """
+        :param source: the candidates, such as a generator of nets or grains; it is
+                       iterated on a thread of its own
+        :param maxsize: the greatest number of items waiting before each stage
+        :raises ValueError: if maxsize is not positive
+        """
+        if maxsize < 1:
+            raise ValueError("Must have a positive maximum queue size")
+        self.__source = source
+        self.__maxsize = maxsize
+        self.__stages: List[_Stage] = []
+        self.__emitted = 0
+        self.__threads: Optional[List[threading.Thread]] = None
+        self.__closed = threading.Event()
+
+    def __add(self, stage: _Stage) -> "Pipeline":
+        if self.__threads is not None:
+            raise ValueError("Cannot add stages to a pipeline which has been run")
+        self.__stages.append(stage)
+        return self
+
+    def map(
+        self,
+        fn: Callable[[Any], Any],
+        name: Optional[str] = None,
+        drop: tuple = (ValueError,),
+    ) -> "Pipeline":
+        """
+        Add a stage transforming every item, such as constructing a grain from a net; an
+        item is dropped if fn returns None for it or raises one of drop, as the
+        constructors of grains do for invalid geometry
+
+        :param fn: maps an item to the next
+        :param name: name of the stage, by default that of fn
+        :param drop: the exceptions which drop an item rather than fail the pipeline
+        :return: this pipeline
+        :raises ValueError: if the pipeline has been run
+        """
+        name = name or getattr(fn, "__name__", "map")
+        return self.__add(_Stage(name, fn, drop))
+
+    def filter(
+        self, predicate: Callable[[Any], bool], name: Optional[str] = None
+    ) -> "Pipeline":
+        """
+        Add a stage dropping every item for which predicate is false
+
+        :param predicate: whether to keep an item
+        :param name: name of the stage, by default that of predicate
+        :return: this pipeline
+        :raises ValueError: if the pipeline has been run
+        """
+        name = name or getattr(predicate, "__name__", "filter")
+        return self.__add(_Stage(name, lambda item: item if predicate(item) else None))
+
+    def evaluate(
+        self,
+        fitness: Union[Fitness, PopulationEvaluator],
+        cache: Optional[FitnessCache] = None,
+        batch_size: int = 64,
+        linger: float = 0.05,
+        name: str = "evaluate",
+    ) -> "Pipeline":
+        """
+        Add a stage scoring grains in batches, each of the grains which arrive within
+        linger seconds of its first, up to batch_size, so that the overhead of each call of
+        an evaluator is shared by many grains without waiting long for a batch to fill;
+        grains are looked up in cache first, if provided, and only the misses are scored
+
+        :param fitness: a fitness function, or an evaluator to score batches with
+        :param cache: the fitness cache, used only by this stage while the pipeline runs
+        :param batch_size: the greatest number of grains scored at once
+        :param linger: the longest time, in seconds, a batch waits for more grains
+        :param name: name of the stage
+        :return: this pipeline, now emitting a Scored per grain
+        :raises ValueError: if batch_size is not positive, or if the pipeline has been run
+        """
+        if batch_size < 1:
+            raise ValueError("Must have a positive batch size")
+
+        def score(grains: List[Grain]) -> List[Scored]:
+            if cache is not None:
+                scores = cache.evaluate(grains, fitness)
+            elif isinstance(fitness, PopulationEvaluator):
+                scores = fitness.evaluate(grains)
+            else:
+                scores = [fitness(grain) for grain in grains]
+            return [Scored(g, float(s)) for g, s in zip(grains, scores)]
+
+        return self.__add(_Stage(name, score, batch_size=batch_size, linger=linger))
+
+    def stats(self) -> List[StageStats]:
+        """
+        :return: what each stage has done so far, in order, after a first entry named
+                 "source" for the iteration of the source
+        """
+        source = StageStats("source", 0, self.__emitted, 0, 0.0, 0.0, 0, 0, 0.0)
+        return [source] + [stage.stats() for stage in self.__stages]
+
+    def __put(self, outbox: queue.Queue, item):
+        while True:
+            if self.__closed.is_set():
+                raise _Closed
+            try:
+                outbox.put(item, timeout=_POLL)
+                return
+            except queue.Full:
+                pass
+
+    def __get(self, stage: _Stage, deadline: Optional[float] = None):
+        """The next item before a stage, or None if none arrives before the deadline"""
+        while True:
+            if self.__closed.is_set():
+                raise _Closed
+            timeout = _POLL
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.perf_counter())
+            try:
+                depth = stage.inbox.qsize()
+                if timeout > 0:
+                    item = stage.inbox.get(timeout=timeout)
+                else:
+                    item = stage.inbox.get_nowait()
+            except queue.Empty:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return None
+                continue
+            if item is not _DONE and not isinstance(item, _Failure):
+                stage.received += 1
+                stage.max_depth = max(stage.max_depth, depth)
+                stage.total_depth += depth
+            return item
+
+    def __produce(self, outbox: queue.Queue):
+        try:
+            for item in self.__source:
+                self.__put(outbox, item)
+                self.__emitted += 1
+            self.__put(outbox, _DONE)
+        except _Closed:
+            pass
+        except BaseException as e:
+            self.__forward(outbox, _Failure(e))
+
+    def __forward(self, outbox: queue.Queue, item):
+        try:
+            self.__put(outbox, item)
+        except _Closed:
+            pass
+
+    def __run(self, stage: _Stage, outbox: queue.Queue):
+        try:
+            end = None
+            while end is None:
+                item = self.__get(stage)
+                if item is _DONE or isinstance(item, _Failure):
+                    self.__put(outbox, item)
+                    return
+                items = [item]
+                deadline = time.perf_counter() + stage.linger
+                while len(items) < stage.batch_size:
+                    item = self.__get(stage, deadline)
+                    if item is None:
+                        break
+                    if item is _DONE or isinstance(item, _Failure):
+                        end = item
+                        break
+                    items.append(item)
+                start = time.perf_counter()
+                with instrumentation.timer(f"Pipeline.{stage.name}"):
+                    if stage.batch_size:
+                        results = stage.fn(items)
+                    else:
+                        results = [self.__apply(stage, item)]
+                stage.busy += time.perf_counter() - start
+                for result in results:
+                    if result is None:
+                        stage.dropped += 1
+                    else:
+                        self.__put(outbox, result)
+                        stage.emitted += 1
+            self.__put(outbox, end)
+        except _Closed:
+            pass
+        except BaseException as e:
+            self.__forward(outbox, _Failure(e))
+
+    @staticmethod
+    def __apply(stage: _Stage, item):
+        try:
+            return stage.fn(item)
+        except stage.drop:
+            return None
+
+    def __iter__(self) -> Iterator:
+        if self.__threads is not None:
+            raise ValueError("A pipeline can only be run once")
+        queues = [queue.Queue(self.__maxsize) for _ in range(len(self.__stages) + 1)]
+        self.__threads = [
+            threading.Thread(target=self.__produce, args=(queues[0],), daemon=True)
+        ]
+        for stage, inbox, outbox in zip(self.__stages, queues, queues[1:]):
+            stage.inbox = inbox
+            self.__threads.append(
+                threading.Thread(target=self.__run, args=(stage, outbox), daemon=True)
+            )
+        for thread in self.__threads:
+            thread.start()
+        return self.__drain(queues[-1])
+
+    def __drain(self, outbox: queue.Queue) -> Iterator:
+        try:
+            while True:
+                item = outbox.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop every stage of the pipeline, if it is running, and wait for them to stop;
+        done when the iteration over it finishes or is abandoned
+        """
+        self.__closed.set()
+        for thread in self.__threads or ():
+            thread.join()
+
+    def __enter__(self) -> "Pipeline":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,241 @@
+"""A container holding a whole population of 2D grains in flat NumPy arrays"""
+import operator
+from typing import Dict, Iterable, Sequence, Union
+
+import numpy as np
+
+from .constants import InhibitedEnds
+from .grains import Grain2D
+from .typedefs import Net
+
+
+class Grain2DBatch(Sequence[Grain2D]):
+    """
+    A population of 2D grains stored column-wise: the net of grain i is the ragged slice
+    points[offsets[i]:offsets[i + 1]], and outer diameters, lengths and inhibited ends are
+    one array each. Every grain's constraints are checked at once by valid_mask, and Grain2D
+    objects are only constructed when a grain is indexed.
+    """
+
+    __slots__ = [
+        "__points",
+        "__offsets",
+        "__outer",
+        "__length",
+        "__inhibited",
+        "__grains",
+    ]
+
+    def __init__(
+        self,
+        nets: Sequence[Net],
+        outer_diameters: Union[float, Sequence[float]],
+        lengths: Union[float, Sequence[float]],
+        inhibited_ends: Union[InhibitedEnds, Sequence[InhibitedEnds]],
+    ):
+        """
+        Construct a population from the nets of its grains; the remaining parameters are
+        either one value shared by every grain or one value per grain
+
+        :param nets: the net of every grain, in inches, centered at (0, 0)
+        :param outer_diameters: outer diameter(s) of the grains
+        :param lengths: length(s) of the grains
+        :param inhibited_ends: which ends, if any, are inhibited for the grains
+        :raises ValueError: if a per-grain parameter is neither one value nor a
+                            one-dimensional sequence of one value per net
+        """
+        n = len(nets)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(net) for net in nets], out=offsets[1:], dtype=np.int64)
+        points = np.empty((int(offsets[-1]), 2), dtype=np.float64)
+        for i, net in enumerate(nets):
+            if len(net):
+                points[offsets[i] : offsets[i + 1]] = net
+        if isinstance(inhibited_ends, InhibitedEnds):
+            inhibited_ends = [inhibited_ends]
+        inhibited = [ends.value for ends in inhibited_ends]
+        self.__set_arrays(points, offsets, outer_diameters, lengths, inhibited)
+
+    @classmethod
+    def from_grains(cls, grains: Iterable[Grain2D]) -> "Grain2DBatch":
+        """
+        Construct a population holding the provided grains
+
+        :param grains: the grains of the population
+        :return: the resulting population
+        """
+        grains = list(grains)
+        return cls(
+            [grain.net for grain in grains],
+            [grain.outer_diameter for grain in grains],
+            [grain.length for grain in grains],
+            [grain.inhibited_ends for grain in grains],
+        )
+
+    @classmethod
+    def from_arrays(
+        cls,
+        points: np.ndarray,
+        offsets: np.ndarray,
+        outer_diameters: Union[float, np.ndarray],
+        lengths: Union[float, np.ndarray],
+        inhibited_ends: Union[int, np.ndarray],
+    ) -> "Grain2DBatch":
+        """
+        Construct a population directly from its columns
+
+        :param points: an (M, 2) array of the concatenated points of every net
+        :param offsets: an (N + 1,) array of offsets into points, starting at 0
+        :param outer_diameters: outer diameter(s) of the grains
+        :param lengths: length(s) of the grains
+        :param inhibited_ends: the InhibitedEnds value(s) of the grains
+        :return: the resulting population
+        :raises ValueError: if the arrays are malformed
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if (
+            offsets.ndim != 1
+            or offsets.size == 0
+            or offsets[0] != 0
+            or offsets[-1] != len(points)
+            or np.any(np.diff(offsets) < 0)
+        ):
+            raise ValueError("offsets must be non-decreasing, from 0 to len(points)")
+        batch = cls.__new__(cls)
+        batch.__set_arrays(points, offsets, outer_diameters, lengths, inhibited_ends)
+        return batch
+
+    def __set_arrays(self, points, offsets, outer_diameters, lengths, inhibited):
+        n = len(offsets) - 1
+
+        def column(values, dtype, name):
+            values = np.atleast_1d(np.asarray(values, dtype=dtype))
+            if values.ndim != 1:
+                raise ValueError(f"Expected one {name} per grain, got {values.shape}")
+            if len(values) not in (1, n):
+                raise ValueError(f"Expected one {name} per grain, got {len(values)}")
+            return np.broadcast_to(values, (n,)).copy()
+
+        self.__points = points
+        self.__offsets = offsets
+        self.__outer = column(outer_diameters, np.float64, "outer diameter")
+        self.__length = column(lengths, np.float64, "length")
+        self.__inhibited = column(inhibited, np.int8, "inhibited end")
+        self.__grains: Dict[int, Grain2D] = {}
+
+    @property
+    def points(self) -> np.ndarray:
+        """
+        :return: an (M, 2) array of the concatenated points of every net
+        """
+        return self.__points
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """
+        :return: an (N + 1,) array where the net of grain i is
+                 points[offsets[i]:offsets[i + 1]]
+        """
+        return self.__offsets
+
+    @property
+    def outer_diameters(self) -> np.ndarray:
+        """
+        :return: the outer diameter of every grain
+        """
+        return self.__outer
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        :return: the length of every grain
+        """
+        return self.__length
+
+    @property
+    def inhibited_ends(self) -> np.ndarray:
+        """
+        :return: the InhibitedEnds value of every grain
+        """
+        return self.__inhibited
+
+    def net(self, i: int) -> Net:
+        """
+        :param i: index of a grain in the population
+        :return: the net of that grain
+        """
+        start, stop = self.__offsets[i], self.__offsets[i + 1]
+        return list(map(tuple, self.__points[start:stop].tolist()))
+
+    def valid_mask(self) -> np.ndarray:
+        """
+        Check the constraints of Grain2D for every grain of the population at once
+
+        :return: a boolean array which is True for each grain with positive length and
+                 diameter whose net lies entirely within its outer radius
+        """
+        counts = np.diff(self.__offsets)
+        max_radius = np.zeros(len(self))
+        nonempty = counts > 0
+        if np.any(nonempty):
+            radii = np.sqrt(np.sum(self.__points**2, axis=1))
+            max_radius[nonempty] = np.maximum.reduceat(
+                radii, self.__offsets[:-1][nonempty]
+            )
+        return (
+            (self.__length > 0) & (self.__outer > 0) & (max_radius <= self.__outer / 2)
+        )
+
+    def select(self, which: Union[np.ndarray, Sequence[int]]) -> "Grain2DBatch":
+        """
+        Construct a population from some of the grains of this one
+
+        :param which: a boolean mask over, or the indices of, the grains to keep
+        :return: the population of the selected grains, in order
+        """
+        which = np.asarray(which)
+        indices = np.flatnonzero(which) if which.dtype == bool else which.astype(int)
+        counts = np.diff(self.__offsets)[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        starts = self.__offsets[:-1][indices]
+        rows = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+        return Grain2DBatch.from_arrays(
+            self.__points[rows],
+            offsets,
+            self.__outer[indices],
+            self.__length[indices],
+            self.__inhibited[indices],
+        )
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Grain2D, "Grain2DBatch"]:
+        """
+        :param i: index of a grain in the population, or a slice of the population
+        :return: that grain, constructed on first access, or the population of the grains
+                 in the slice, as by select
+        :raises ValueError: if the grain violates a constraint of Grain2D
+        :raises TypeError: if i is neither an integer nor a slice
+        """
+        if isinstance(i, slice):
+            return self.select(np.arange(len(self))[i])
+        try:
+            i = operator.index(i)
+        except TypeError:
+            raise TypeError(
+                f"Grains are indexed by integers or slices, not {type(i).__name__}"
+            ) from None
+        if not -len(self) <= i < len(self):
+            raise IndexError("Grain index out of range")
+        i %= len(self)
+        if i not in self.__grains:
+            self.__grains[i] = Grain2D(
+                float(self.__outer[i]),
+                float(self.__length[i]),
+                InhibitedEnds(int(self.__inhibited[i])),
+                self.net(i),
+            )
+        return self.__grains[i]
+
+    def __len__(self) -> int:
+        return len(self.__offsets) - 1
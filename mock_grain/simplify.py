@@ -0,0 +1,317 @@
+"""
+Functions for reducing the number of points of nets: Douglas-Peucker and Visvalingam
+simplification, resampling at uniform arc length and a hard budget of points.
+
+Simplification only ever drops points, and resampling only places points on the edges of a
+net, so neither moves a net outside of a circle containing it. Given an outer diameter,
+every function also pulls any point which rounding left beyond the outer radius back onto
+it, so its result always satisfies the outer radius constraint of Grain2D. Simplification
+may however make a simple net self-intersecting, which nets.is_simple can check.
+"""
+import heapq
+from typing import Callable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .constants import InhibitedEnds
+from .population import Grain2DBatch
+from .typedefs import Net
+
+# points past the outer radius are moved this far inside of it, relatively, so rounding
+# while checking their distance from center can not put them back outside
+_CLIP_MARGIN = 4 * np.finfo(np.float64).eps
+
+
+def _points(net: Net) -> np.ndarray:
+    return np.asarray(net, dtype=np.float64).reshape(-1, 2)
+
+
+def _clip(points: np.ndarray, outer_radius) -> np.ndarray:
+    """Scale points further from (0, 0) than outer_radius, per point or shared, onto it"""
+    radius = np.sqrt(np.sum(points**2, axis=1))
+    outside = radius > outer_radius
+    if np.any(outside):
+        limit = np.broadcast_to(outer_radius, radius.shape)[outside]
+        scale = limit / radius[outside] * (1 - _CLIP_MARGIN)
+        points = points.copy()
+        points[outside] *= scale[:, np.newaxis]
+    return points
+
+
+def _to_net(points: np.ndarray, outer_diameter: Optional[float]) -> Net:
+    if outer_diameter is not None:
+        points = _clip(points, outer_diameter / 2)
+    return list(map(tuple, points.tolist()))
+
+
+def _segment_distance(points: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Distance from each of points to the segment from a to b"""
+    ab = b - a
+    length = float(ab @ ab)
+    t = np.zeros(len(points))
+    if length > 0:
+        t = np.clip((points - a) @ ab / length, 0, 1)
+    d = points - (a + t[:, np.newaxis] * ab)
+    return np.sqrt(np.sum(d * d, axis=1))
+
+
+def _douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    n = len(points)
+    if n <= 3:
+        return points
+    # split the ring at its first point and the point furthest from it, and simplify the
+    # two chains between them
+    far = int(np.argmax(np.sum((points - points[0]) ** 2, axis=1)))
+    ring = np.concatenate([points, points[:1]])
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, far]] = True
+    stack = [(0, far), (far, n)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        d = _segment_distance(ring[i + 1 : j], ring[i], ring[j])
+        m = int(np.argmax(d))
+        if d[m] > tolerance:
+            k = i + 1 + m
+            keep[k] = True
+            stack += [(i, k), (k, j)]
+    if np.count_nonzero(keep) < 3:
+        # a net needs a third point, which may as well be the one furthest from the others
+        d = _segment_distance(points, points[0], points[far])
+        d[keep] = -1
+        keep[int(np.argmax(d))] = True
+    return points[keep]
+
+
+def _visvalingam(points: np.ndarray, min_area: float, max_points: int) -> np.ndarray:
+    n = len(points)
+    if n <= 3 or (n <= max_points and min_area <= 0):
+        return points
+    prev = np.roll(np.arange(n), 1).tolist()
+    following = np.roll(np.arange(n), -1).tolist()
+    xy = points.tolist()
+
+    def area(i: int) -> float:
+        (ax, ay), (bx, by), (cx, cy) = xy[prev[i]], xy[i], xy[following[i]]
+        return abs((bx - ax) * (cy - ay) - (by - ay) * (cx - ax)) / 2
+
+    areas = [area(i) for i in range(n)]
+    heap = [(a, i) for i, a in enumerate(areas)]
+    heapq.heapify(heap)
+    removed = [False] * n
+    remaining = n
+    while remaining > 3 and heap:
+        a, i = heapq.heappop(heap)
+        if removed[i] or a != areas[i]:
+            continue  # an outdated entry, superseded when a neighbor was removed
+        if a >= min_area and remaining <= max_points:
+            break
+        removed[i] = True
+        remaining -= 1
+        p, f = prev[i], following[i]
+        following[p], prev[f] = f, p
+        for j in (p, f):
+            # a point's area never drops below that of a point removed before it, so
+            # points are removed in order of their effective area
+            areas[j] = max(area(j), a)
+            heapq.heappush(heap, (areas[j], j))
+    return points[~np.array(removed)]
+
+
+def _resample(points: np.ndarray, n: int) -> np.ndarray:
+    return _resample_arrays(points, np.array([0, len(points)]), n)
+
+
+def _resample_arrays(points: np.ndarray, offsets: np.ndarray, n: int) -> np.ndarray:
+    """Resample every net of a population, stored as ragged arrays, to n points at once"""
+    counts = np.diff(offsets)
+    if n < 3:
+        raise ValueError("A net must have at least 3 points")
+    if np.any(counts < 2):
+        raise ValueError("Can only resample nets of at least 2 points")
+    # the edge after the last point of each net returns to its first point
+    following = np.arange(1, len(points) + 1)
+    following[offsets[1:] - 1] = offsets[:-1]
+    edges = points[following] - points
+    lengths = np.sqrt(np.sum(edges * edges, axis=1))
+    starts = np.concatenate([[0.0], np.cumsum(lengths)[:-1]])
+    perimeters = np.add.reduceat(lengths, offsets[:-1])
+    if np.any(perimeters <= 0):
+        raise ValueError("Can only resample nets of positive perimeter")
+    # the arc length along the whole population of each new point
+    targets = starts[offsets[:-1], np.newaxis] + perimeters[:, np.newaxis] * (
+        np.arange(n) / n
+    )
+    edge = np.searchsorted(starts, targets, side="right") - 1
+    edge = np.clip(edge, offsets[:-1, np.newaxis], offsets[1:, np.newaxis] - 1).ravel()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (targets.ravel() - starts[edge]) / lengths[edge]
+    t = np.clip(np.nan_to_num(t, posinf=0.0), 0, 1)
+    return points[edge] + t[:, np.newaxis] * edges[edge]
+
+
+def douglas_peucker(
+    net: Net, tolerance: float, outer_diameter: Optional[float] = None
+) -> Net:
+    """
+    Simplify a net with the Douglas-Peucker algorithm: keep only the points needed for every
+    dropped point to lie within tolerance of the simplified net
+
+    :param net: a net
+    :param tolerance: the greatest distance from a dropped point to the simplified net
+    :param outer_diameter: outer diameter of the grain of net, if any, to keep the result
+                           within
+    :return: the simplified net, with at least 3 points if net has
+    :raises ValueError: if tolerance is negative
+    """
+    if tolerance < 0:
+        raise ValueError("Must have a non-negative tolerance")
+    return _to_net(_douglas_peucker(_points(net), tolerance), outer_diameter)
+
+
+def visvalingam(
+    net: Net, min_area: float, outer_diameter: Optional[float] = None
+) -> Net:
+    """
+    Simplify a net with the Visvalingam-Whyatt algorithm: repeatedly drop the point which
+    forms the triangle of least area with its neighbors, while that area is below min_area
+
+    :param net: a net
+    :param min_area: the least area of the triangle of any point which is kept
+    :param outer_diameter: outer diameter of the grain of net, if any, to keep the result
+                           within
+    :return: the simplified net, with at least 3 points if net has
+    :raises ValueError: if min_area is negative
+    """
+    if min_area < 0:
+        raise ValueError("Must have a non-negative minimum area")
+    points = _visvalingam(_points(net), min_area, len(net))
+    return _to_net(points, outer_diameter)
+
+
+def limit_points(
+    net: Net, max_points: int, outer_diameter: Optional[float] = None
+) -> Net:
+    """
+    Drop the least significant points of a net, by Visvalingam-Whyatt, until it has at most
+    max_points points
+
+    :param net: a net
+    :param max_points: the greatest number of points of the result
+    :param outer_diameter: outer diameter of the grain of net, if any, to keep the result
+                           within
+    :return: net, or as many of its points as allowed
+    :raises ValueError: if max_points < 3
+    """
+    if max_points < 3:
+        raise ValueError("A net must have at least 3 points")
+    return _to_net(_visvalingam(_points(net), 0.0, max_points), outer_diameter)
+
+
+def resample(net: Net, n: int, outer_diameter: Optional[float] = None) -> Net:
+    """
+    Place n points evenly along the perimeter of a net, starting from its first point
+
+    :param net: a net
+    :param n: number of points of the result
+    :param outer_diameter: outer diameter of the grain of net, if any, to keep the result
+                           within
+    :return: the resampled net
+    :raises ValueError: if n < 3, or if net has fewer than 2 points or no perimeter
+    """
+    return _to_net(_resample(_points(net), n), outer_diameter)
+
+
+def _map_batch(
+    nets: Union[Grain2DBatch, Sequence[Net]],
+    simplify: Callable[[np.ndarray], np.ndarray],
+) -> Union[Grain2DBatch, List[Net]]:
+    if not isinstance(nets, Grain2DBatch):
+        return [_to_net(simplify(_points(net)), None) for net in nets]
+    points, offsets = nets.points, nets.offsets
+    parts = [simplify(points[offsets[i] : offsets[i + 1]]) for i in range(len(nets))]
+    return _from_parts(nets, parts)
+
+
+def _from_parts(batch: Grain2DBatch, parts: List[np.ndarray]) -> Grain2DBatch:
+    counts = [len(part) for part in parts]
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    points = np.concatenate(parts) if parts else np.empty((0, 2))
+    outer_radius = np.repeat(batch.outer_diameters / 2, counts)
+    return Grain2DBatch.from_arrays(
+        _clip(points, outer_radius),
+        offsets,
+        batch.outer_diameters,
+        batch.lengths,
+        batch.inhibited_ends,
+    )
+
+
+def douglas_peucker_batch(
+    nets: Union[Grain2DBatch, Sequence[Net]], tolerance: float
+) -> Union[Grain2DBatch, List[Net]]:
+    """
+    Simplify every net of a population with douglas_peucker
+
+    :param nets: a population of grains, kept within their outer diameters, or of nets
+    :param tolerance: the greatest distance from a dropped point to its simplified net
+    :return: the population of simplified grains or nets, in order
+    :raises ValueError: if tolerance is negative
+    """
+    if tolerance < 0:
+        raise ValueError("Must have a non-negative tolerance")
+    return _map_batch(nets, lambda points: _douglas_peucker(points, tolerance))
+
+
+def visvalingam_batch(
+    nets: Union[Grain2DBatch, Sequence[Net]], min_area: float
+) -> Union[Grain2DBatch, List[Net]]:
+    """
+    Simplify every net of a population with visvalingam
+
+    :param nets: a population of grains, kept within their outer diameters, or of nets
+    :param min_area: the least area of the triangle of any point which is kept
+    :return: the population of simplified grains or nets, in order
+    :raises ValueError: if min_area is negative
+    """
+    if min_area < 0:
+        raise ValueError("Must have a non-negative minimum area")
+    return _map_batch(nets, lambda points: _visvalingam(points, min_area, len(points)))
+
+
+def limit_points_batch(
+    nets: Union[Grain2DBatch, Sequence[Net]], max_points: int
+) -> Union[Grain2DBatch, List[Net]]:
+    """
+    Limit every net of a population to at most max_points points with limit_points
+
+    :param nets: a population of grains, kept within their outer diameters, or of nets
+    :param max_points: the greatest number of points of any net of the result
+    :return: the population of limited grains or nets, in order
+    :raises ValueError: if max_points < 3
+    """
+    if max_points < 3:
+        raise ValueError("A net must have at least 3 points")
+    return _map_batch(nets, lambda points: _visvalingam(points, 0.0, max_points))
+
+
+def resample_batch(
+    nets: Union[Grain2DBatch, Sequence[Net]], n: int
+) -> Union[Grain2DBatch, List[Net]]:
+    """
+    Resample every net of a population to n points with resample, all at once
+
+    :param nets: a population of grains, kept within their outer diameters, or of nets
+    :param n: number of points of every net of the result
+    :return: the population of resampled grains or nets, in order
+    :raises ValueError: if n < 3, or if any net has fewer than 2 points or no perimeter
+    """
+    batch = nets
+    if not isinstance(nets, Grain2DBatch):
+        batch = Grain2DBatch(nets, 1, 1, InhibitedEnds.NEITHER)
+    points = _resample_arrays(batch.points, batch.offsets, n).reshape(len(batch), n, 2)
+    if not isinstance(nets, Grain2DBatch):
+        return [_to_net(net, None) for net in points]
+    return _from_parts(batch, list(points))
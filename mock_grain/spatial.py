@@ -0,0 +1,356 @@
+"""
+A spatial index over a set of points, for proximity and clearance queries.
+
+Points are bucketed into the cells of a uniform grid, hashed as by interning, and sorted by
+hash, so the points of any cell are one contiguous run, found through an open addressing
+hash table from the hash of each cell to its run. Queries are batched: the cells around
+every query point are looked up together, one offset at a time, and nearest neighbours are
+found by searching successively wider shells of cells around the cell of each query until
+its k nearest points are known to be no further than the shell.
+"""
+import itertools
+from typing import Optional, Tuple
+
+import numpy as np
+
+from . import instrumentation
+from .interning import hash_cells
+
+# the greatest number of neighbouring cells looked up at once
+_CHUNK_CELLS = 2**20
+# shells of cells at most this far from the cell of a query are searched cell by cell;
+# queries whose neighbours lie further are compared with every point instead
+_MAX_REACH = 3
+# the default cell size is refined up to this many times, until points share their cell
+# with at most this many points on average
+_REFINEMENTS = 4
+_CROWDING = 2.0
+
+
+def _shell(reach: int, dim: int) -> np.ndarray:
+    """The offsets of the cells at Chebyshev distance reach from a cell"""
+    offsets = np.array(list(itertools.product(range(-reach, reach + 1), repeat=dim)))
+    return offsets[np.abs(offsets).max(axis=1) == reach].astype(np.int64)
+
+
+def _smallest(
+    query: np.ndarray, index: np.ndarray, distance: np.ndarray, m: int, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The k nearest of the candidate points of each of m queries, padded with -1 and inf;
+    the candidates of each query must be contiguous, as they are gathered
+    """
+    indices = np.full((m, k), -1, dtype=np.int64)
+    distances = np.full((m, k), np.inf)
+    if not len(query):
+        return indices, distances
+    starts = np.flatnonzero(np.concatenate([[True], query[1:] != query[:-1]]))
+    groups = query[starts]
+    sizes = np.diff(np.append(starts, len(query)))
+    distance = distance.copy()
+    # take the nearest candidate of every query k times, rather than sorting them all
+    for j in range(min(k, int(sizes.max()))):
+        least = np.minimum.reduceat(distance, starts)
+        hits = np.flatnonzero(distance == np.repeat(least, sizes))
+        group = np.searchsorted(starts, hits, side="right") - 1
+        first = hits[np.concatenate([[True], group[1:] != group[:-1]])]
+        found = np.isfinite(least)
+        indices[groups[found], j] = index[first[found]]
+        distances[groups[found], j] = least[found]
+        distance[first] = np.inf
+    return indices, distances
+
+
+def _merge(
+    a: Tuple[np.ndarray, np.ndarray], b: Tuple[np.ndarray, np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """The k nearest of two disjoint sets of k nearest points of each query"""
+    indices = np.concatenate([a[0], b[0]], axis=1)
+    distances = np.concatenate([a[1], b[1]], axis=1)
+    order = np.argsort(distances, axis=1, kind="stable")[:, : a[0].shape[1]]
+    return (
+        np.take_along_axis(indices, order, axis=1),
+        np.take_along_axis(distances, order, axis=1),
+    )
+
+
+class SpatialIndex:
+    """
+    A uniform hash grid over a set of points, answering nearest neighbour, k nearest
+    neighbour and radius queries for many query points at once
+    """
+
+    __slots__ = [
+        "__points",
+        "__cell_size",
+        "__origin",
+        "__order",
+        "__sorted",
+        "__cells",
+        "__table",
+        "__starts",
+        "__counts",
+    ]
+
+    @instrumentation.timed()
+    def __init__(self, points: np.ndarray, cell_size: Optional[float] = None):
+        """
+        :param points: an (N, D) array of the points to index
+        :param cell_size: the width of the cells of the grid, by default such that there is
+                          about one point per cell of the bounding box of the points
+        :raises ValueError: if points is not a 2D array, or if cell_size is not positive
+        """
+        points = np.array(points, dtype=np.float64)
+        if points.ndim != 2:
+            raise ValueError("Points must be an (N, D) array")
+        if cell_size is not None and not cell_size > 0:
+            raise ValueError("Must have a positive cell size")
+        points.setflags(write=False)
+        self.__points = points
+        self.__origin = points.min(axis=0) if len(points) else np.zeros(points.shape[1])
+        if cell_size is not None:
+            self.__set_cells(cell_size)
+            return
+        extent = np.ptp(points, axis=0) if len(points) else np.zeros(0)
+        extent = extent[extent > 0]
+        if not len(extent):
+            self.__set_cells(1.0)
+            return
+        # a cell per point of the bounding box, refined while points crowd into fewer
+        # cells, as the points of a mesh lie on surfaces rather than filling its volume
+        cell_size = float(np.prod(extent / len(points) ** (1 / len(extent))))
+        cell_size **= 1 / len(extent)
+        for _ in range(_REFINEMENTS):
+            self.__set_cells(cell_size)
+            # the mean number of points in the cell of each point
+            crowding = np.sum(self.__counts.astype(np.float64) ** 2) / len(points)
+            if crowding <= _CROWDING:
+                break
+            cell_size *= (_CROWDING / crowding) ** (1 / len(extent))
+
+    def __set_cells(self, cell_size: float):
+        self.__cell_size = cell_size
+        cells = self.__cell(self.__points)
+        keys = hash_cells(cells)
+        self.__order = np.argsort(keys, kind="stable")
+        keys = keys[self.__order]
+        self.__cells = cells[self.__order]
+        self.__sorted = self.__points[self.__order]
+        # an open addressing hash table of the run of points of every cell, by hash
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        counts = np.diff(np.append(starts, len(keys)))
+        size = 1 << int(2 * len(starts)).bit_length()
+        self.__table = np.zeros(size, dtype=np.uint64)
+        self.__starts = np.zeros(size, dtype=np.int64)
+        self.__counts = np.zeros(size, dtype=np.int64)
+        slot = keys[starts] & np.uint64(size - 1)
+        pending = np.arange(len(starts))
+        while len(pending):
+            free = self.__counts[slot[pending]] == 0
+            # of the cells probing each free slot, the first takes it
+            _, first = np.unique(slot[pending[free]], return_index=True)
+            placed = pending[free][first]
+            self.__table[slot[placed]] = keys[starts[placed]]
+            self.__starts[slot[placed]] = starts[placed]
+            self.__counts[slot[placed]] = counts[placed]
+            pending = np.setdiff1d(pending, placed, assume_unique=True)
+            slot[pending] = (slot[pending] + np.uint64(1)) & np.uint64(size - 1)
+
+    def __lookup(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """The start and number of the sorted points of the cell of every hash"""
+        mask = np.uint64(len(self.__table) - 1)
+        starts = np.zeros(len(keys), dtype=np.int64)
+        counts = np.zeros(len(keys), dtype=np.int64)
+        slot = keys & mask
+        pending = np.arange(len(keys))
+        while len(pending):
+            probe = slot[pending]
+            filled = self.__counts[probe] > 0
+            hit = filled & (self.__table[probe] == keys[pending])
+            starts[pending[hit]] = self.__starts[probe[hit]]
+            counts[pending[hit]] = self.__counts[probe[hit]]
+            pending = pending[filled & ~hit]
+            slot[pending] = (slot[pending] + np.uint64(1)) & mask
+        return starts, counts
+
+    @property
+    def points(self) -> np.ndarray:
+        """
+        :return: the read-only (N, D) array of the indexed points
+        """
+        return self.__points
+
+    @property
+    def cell_size(self) -> float:
+        """
+        :return: the width of the cells of the grid
+        """
+        return self.__cell_size
+
+    def __len__(self) -> int:
+        return len(self.__points)
+
+    def __cell(self, points: np.ndarray) -> np.ndarray:
+        cells = np.floor((points - self.__origin) / self.__cell_size)
+        return np.ascontiguousarray(cells.astype(np.int64))
+
+    def __check(self, points) -> np.ndarray:
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != self.__points.shape[1]:
+            raise ValueError(f"Points must be an (M, {self.__points.shape[1]}) array")
+        return points
+
+    def __gather(
+        self, points: np.ndarray, cells: np.ndarray, offsets: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Every indexed point in the cells at the offsets from the cell of each query point,
+        as the query, the indexed point and the distance between them
+        """
+        found = []
+        step = max(1, _CHUNK_CELLS // len(offsets))
+        for first in range(0, len(cells), step):
+            chunk = cells[first : first + step]
+            neighbours = (chunk[:, None, :] + offsets[None]).reshape(-1, cells.shape[1])
+            start, counts = self.__lookup(hash_cells(neighbours))
+            total = int(counts.sum())
+            lookup = np.repeat(np.arange(len(neighbours)), counts)
+            position = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            position += np.repeat(start, counts)
+            # neighbouring cells whose hashes collide with another share its points
+            same = np.all(self.__cells[position] == neighbours[lookup], axis=1)
+            query = lookup[same] // len(offsets) + first
+            found.append((query, position[same]))
+        query = np.concatenate([q for q, _ in found] + [np.zeros(0, np.int64)])
+        position = np.concatenate([p for _, p in found] + [np.zeros(0, np.int64)])
+        distance = np.linalg.norm(self.__sorted[position] - points[query], axis=1)
+        return query, self.__order[position], distance
+
+    def __brute_force(
+        self, points: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """The k nearest indexed points of each query point, by comparing with all"""
+        indices = np.empty((len(points), k), dtype=np.int64)
+        distances = np.empty((len(points), k))
+        step = max(1, _CHUNK_CELLS // max(len(self.__points), 1))
+        for first in range(0, len(points), step):
+            chunk = points[first : first + step]
+            d = np.linalg.norm(chunk[:, None, :] - self.__points[None], axis=2)
+            nearest = np.argpartition(d, k - 1, axis=1)[:, :k]
+            d = np.take_along_axis(d, nearest, axis=1)
+            order = np.argsort(d, axis=1, kind="stable")
+            indices[first : first + step] = np.take_along_axis(nearest, order, axis=1)
+            distances[first : first + step] = np.take_along_axis(d, order, axis=1)
+        return indices, distances
+
+    @instrumentation.timed()
+    def query(self, points: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest indexed points of every query point
+
+        :param points: an (M, D) array of query points
+        :param k: the number of neighbours to find
+        :return: the (M, k) indices of the nearest indexed points of every query point and
+                 the (M, k) distances to them, both in order of increasing distance
+        :raises ValueError: if points are not of the dimension of the index, or if k is not
+                            positive or is more than the number of indexed points
+        """
+        points = self.__check(points)
+        if not 0 < k <= len(self.__points):
+            raise ValueError(f"Must have 0 < k <= {len(self.__points)}, got {k}")
+        m = len(points)
+        indices = np.full((m, k), -1, dtype=np.int64)
+        distances = np.full((m, k), np.inf)
+        cells = self.__cell(points)
+        size = self.__cell_size
+        inside = (points - self.__origin) / size - cells
+        margin = np.minimum(inside, 1 - inside).min(axis=1) * size
+        pending = np.arange(m)
+        for reach in range(_MAX_REACH + 1):
+            if not len(pending):
+                break
+            query, index, distance = self.__gather(
+                points[pending], cells[pending], _shell(reach, points.shape[1])
+            )
+            # the new shell holds none of the points of the shells inside it
+            found_indices, found_distances = _merge(
+                (indices[pending], distances[pending]),
+                _smallest(query, index, distance, len(pending), k),
+            )
+            indices[pending], distances[pending] = found_indices, found_distances
+            # any point outside the shells searched is further than reach cells, plus the
+            # distance from the query point to the nearest side of its own cell, away
+            pending = pending[found_distances[:, -1] > reach * size + margin[pending]]
+        if len(pending):
+            indices[pending], distances[pending] = self.__brute_force(
+                points[pending], k
+            )
+        instrumentation.count("spatial_brute_force", len(pending))
+        return indices, distances
+
+    def nearest(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the nearest indexed point of every query point
+
+        :param points: an (M, D) array of query points
+        :return: the (M,) index of the nearest indexed point of every query point and the
+                 (M,) distance to it
+        :raises ValueError: if points are not of the dimension of the index, or if there
+                            are no indexed points
+        """
+        indices, distances = self.query(points, 1)
+        return indices[:, 0], distances[:, 0]
+
+    @instrumentation.timed()
+    def within(
+        self, points: np.ndarray, radius: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the indexed points within a radius of every query point
+
+        :param points: an (M, D) array of query points
+        :param radius: the radius
+        :return: the (M + 1,) offsets and the concatenated indices of the indexed points
+                 within radius of every query point, in compressed sparse row form as for
+                 Mesh, each in order of increasing distance
+        :raises ValueError: if points are not of the dimension of the index, or if radius
+                            is negative
+        """
+        points = self.__check(points)
+        if radius < 0:
+            raise ValueError("Must have a non-negative radius")
+        dim = points.shape[1]
+        reach = int(np.ceil(radius / self.__cell_size))
+        if reach <= _MAX_REACH:
+            offsets = np.concatenate([_shell(r, dim) for r in range(reach + 1)])
+            query, index, distance = self.__gather(points, self.__cell(points), offsets)
+        else:
+            found = []
+            step = max(1, _CHUNK_CELLS // max(len(self.__points), 1))
+            for first in range(0, len(points), step):
+                chunk = points[first : first + step]
+                d = np.linalg.norm(chunk[:, None, :] - self.__points[None], axis=2)
+                q, i = np.nonzero(d <= radius)
+                found.append((q + first, i, d[q, i]))
+            query = np.concatenate([q for q, _, _ in found] + [np.zeros(0, np.int64)])
+            index = np.concatenate([i for _, i, _ in found] + [np.zeros(0, np.int64)])
+            distance = np.concatenate([d for _, _, d in found] + [np.zeros(0)])
+        near = distance <= radius
+        query, index, distance = query[near], index[near], distance[near]
+        order = np.lexsort((distance, query))
+        offsets = np.zeros(len(points) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(query, minlength=len(points)), out=offsets[1:])
+        return offsets, index[order]
+
+    def pairs(self, radius: float) -> np.ndarray:
+        """
+        Find every pair of indexed points within a radius of each other
+
+        :param radius: the radius
+        :return: a (P, 2) array of the indices i < j of every such pair
+        :raises ValueError: if radius is negative
+        """
+        offsets, indices = self.within(self.__points, radius)
+        first = np.repeat(np.arange(len(self.__points)), np.diff(offsets))
+        pairs = np.stack([first, indices], axis=1)
+        return pairs[pairs[:, 0] < pairs[:, 1]]
@@ -1,14 +1,44 @@
 """Tests for mock_grain module"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
 import unittest
 from typing import Dict, Set
+from unittest import mock
 
-import convert_units
-import grains
-import net_to_mesh
-from constants import InhibitedEnds
-from grains import Grain2D, Grain3D
-from mesh import Mesh
-from typedefs import *
+import numpy as np
+
+from mock_grain import archive
+from mock_grain import ballistics
+from mock_grain import benchmarks
+from mock_grain import burnback
+from mock_grain import burnback3d
+from mock_grain import cache
+from mock_grain import checkpoint
+from mock_grain import constants
+from mock_grain import convert_units
+from mock_grain import grains
+from mock_grain import instrumentation
+from mock_grain import interning
+from mock_grain import net_to_mesh
+from mock_grain import nets
+from mock_grain import openmotor
+from mock_grain import pipeline
+from mock_grain import simplify
+from mock_grain import spatial
+from mock_grain import voxels
+from mock_grain.cache import FitnessCache
+from mock_grain.constants import InhibitedEnds
+from mock_grain.evaluation import PopulationEvaluator
+from mock_grain.grains import Grain2D, Grain3D
+from mock_grain.incremental_net import IncrementalNet
+from mock_grain.mesh import Mesh
+from mock_grain.multifidelity import BurnbackFitness, MultiFidelityEvaluator, Tier
+from mock_grain.population import Grain2DBatch
+from mock_grain.typedefs import *
 
 
 def _tri_prism_mesh_map(top_z: float, bottom_z: float = 0) -> Dict[Point, Set[Point]]:
@@ -81,6 +111,67 @@ class MeshTest(unittest.TestCase):
         no_zero_z = _tri_prism_mesh_map(10, 1)
         self.assertRaises(ValueError, lambda: Mesh(no_zero_z))
 
+    def test_make_invalid_mixed_dimensions(self):
+        mixed = {(1, 0): {(0, 1, 0)}, (0, 1, 0): {(1, 0)}}
+        self.assertRaises(ValueError, lambda: Mesh(mixed))
+
+    def test_arrays(self):
+        mesh = TRIANGULAR_PRISM_MESH
+        self.assertEqual(3, mesh.dim)
+        self.assertEqual((6, 3), mesh.vertices.shape)
+        self.assertEqual(7, len(mesh.indptr))
+        self.assertEqual(18, len(mesh.indices))
+        self.assertFalse(mesh.vertices.flags.writeable)
+        for i, point in enumerate(mesh):
+            self.assertEqual(point, tuple(mesh.vertices[i]))
+            neighbors = mesh.indices[mesh.indptr[i] : mesh.indptr[i + 1]]
+            self.assertEqual(mesh[point], {tuple(mesh.vertices[j]) for j in neighbors})
+
+    def test_from_arrays(self):
+        square = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+        mesh = Mesh.from_arrays(square, [0, 2, 4, 6, 8], [3, 1, 0, 2, 1, 3, 2, 0])
+        self.assertEqual(2, mesh.dim)
+        self.assertEqual(
+            {
+                (1, 0): {(0, 1), (0, -1)},
+                (0, 1): {(1, 0), (-1, 0)},
+                (-1, 0): {(0, 1), (0, -1)},
+                (0, -1): {(-1, 0), (1, 0)},
+            },
+            dict(mesh),
+        )
+
+    def test_from_arrays_invalid(self):
+        square = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+        self.assertRaises(  # directed
+            ValueError,
+            lambda: Mesh.from_arrays(square, [0, 2, 3, 4, 5], [3, 1, 2, 3, 0]),
+        )
+        self.assertRaises(  # repeated edge
+            ValueError,
+            lambda: Mesh.from_arrays(square, [0, 2, 4, 6, 8], [1, 1, 0, 0, 3, 3, 2, 2]),
+        )
+        self.assertRaises(  # out of range
+            ValueError,
+            lambda: Mesh.from_arrays(square, [0, 2, 4, 6, 8], [3, 1, 0, 2, 1, 3, 2, 4]),
+        )
+
+    def test_from_trusted(self):
+        vertices = np.array([(1, 0, 0), (0, 1, 0), (-1, 0, 0)], dtype=np.float64)
+        indptr = np.array([0, 2, 4, 6])
+        indices = np.array([1, 2, 0, 2, 0, 1])
+        mesh = Mesh.from_trusted(vertices, indptr, indices, 2)
+        self.assertIs(vertices, mesh.vertices)
+        self.assertEqual({(0.0, 1.0), (-1.0, 0.0)}, mesh[(1.0, 0.0)])
+        directed = np.array([1, 2, 0, 2, 1, 1])
+        with mock.patch.object(constants, "VALIDATE_TRUSTED", False):
+            Mesh.from_trusted(vertices.copy(), indptr, directed, 2)  # not checked
+        with mock.patch.object(constants, "VALIDATE_TRUSTED", True):
+            self.assertRaises(
+                ValueError,
+                lambda: Mesh.from_trusted(vertices.copy(), indptr, directed, 2),
+            )
+
 
 class ConvertNetUnitsTest(unittest.TestCase):
     def test_convert_net_units(self):
@@ -92,6 +183,56 @@ class ConvertNetUnitsTest(unittest.TestCase):
                 self.assertAlmostEqual(expected[i][j], actual[i][j])
 
 
+class ConvertTest(unittest.TestCase):
+    def test_convert_nets(self):
+        nets = [[], TRIANGLE_NET, SQUARE_NET]
+        actual = convert_units.convert(nets, "m", "mm")
+        self.assertEqual(
+            [[(x * 1000, y * 1000) for x, y in net] for net in nets], actual
+        )
+        self.assertEqual([(0.0, 0.0)], convert_units.convert([(0, 0)], "in", "m"))
+        # nets of any sequence type, with the first of them empty or not
+        for population in (tuple(map(tuple, nets)), [np.array(TRIANGLE_NET), ()]):
+            actual = convert_units.convert(population, "m", "mm")
+            self.assertEqual(
+                [[(x * 1000, y * 1000) for x, y in net] for net in population], actual
+            )
+
+    def test_convert_array_in_place(self):
+        points = np.array([[25.4, 0], [0, 50.8]])
+        self.assertIs(points, convert_units.convert(points, "mm", "in", out=points))
+        np.testing.assert_allclose([[1, 0], [0, 2]], points)
+
+    def test_convert_population(self):
+        batch = Grain2DBatch([TRIANGLE_NET, SQUARE_NET], 4, 10, InhibitedEnds.TOP)
+        actual = convert_units.convert(batch, "in", "mm")
+        self.assertIs(batch.offsets, actual.offsets)
+        np.testing.assert_allclose(batch.points * 25.4, actual.points)
+        np.testing.assert_allclose([101.6, 101.6], actual.outer_diameters)
+        self.assertEqual(InhibitedEnds.TOP, actual[1].inhibited_ends)
+
+    def test_convert_grain(self):
+        grain = Grain3D(10, 10, InhibitedEnds.BOTH, TRIANGULAR_PRISM_MESH)
+        actual = convert_units.convert(grain, "mm", "m")
+        self.assertAlmostEqual(0.01, actual.length)
+        self.assertIs(grain.mesh.indptr, actual.mesh.indptr)
+        np.testing.assert_allclose(grain.mesh.vertices / 1000, actual.mesh.vertices)
+        sector = [(0.5, -0.2), (1.0, 0.0), (0.5, 0.2)]
+        symmetric = grains.SymmetricGrain2D(4, 10, InhibitedEnds.BOTH, sector, 6)
+        actual = convert_units.convert(symmetric, "in", "mm")
+        self.assertIsInstance(actual, grains.SymmetricGrain2D)
+        self.assertEqual(6, actual.order)
+        self.assertEqual([(x * 25.4, y * 25.4) for x, y in sector], actual.sector)
+        self.assertAlmostEqual(101.6, actual.outer_diameter)
+
+    def test_invalid_units(self):
+        self.assertRaises(ValueError, lambda: convert_units.convert(1, "ft", "m"))
+        self.assertRaises(
+            ValueError,
+            lambda: convert_units.convert(TRIANGLE_NET, "mm", "in", np.empty((3, 2))),
+        )
+
+
 # noinspection SpellCheckingInspection
 class ConvertMeshUnitsTest(unittest.TestCase):
     def test_convert_mesh_units(self):
@@ -110,6 +251,9 @@ class ConvertMeshUnitsTest(unittest.TestCase):
                 for k in init
             }
         )
+        self.assertIs(
+            actual.indices, convert_units.mm_mesh_to_inch_mesh(actual).indices
+        )
         self.assertEqual(len(scaled), len(actual))
         # Sort keys and check for almost equal
         # Sort corresponding values and check for almost equal
@@ -138,6 +282,13 @@ class ConvertNetToMeshTest(unittest.TestCase):
         }
         self.assertEqual(exp, net_to_mesh.net_to_2D_mesh(SQUARE_NET))
 
+    def test_convert_net_with_repeated_point(self):
+        net = [(1, 0), (0, 1), (-1, 0), (0, 1)]
+        self.assertEqual(
+            {(1, 0): {(0, 1)}, (0, 1): {(1, 0), (-1, 0)}, (-1, 0): {(0, 1)}},
+            net_to_mesh.net_to_2D_mesh(net),
+        )
+
 
 class ConvertNetTo3DMeshTest(unittest.TestCase):
     def test_convert_net_to_mesh_3D(self):
@@ -175,6 +326,39 @@ class ConvertNetTo3DMeshTest(unittest.TestCase):
         self.assertEqual(exp, net_to_mesh.net_to_3D_mesh(SQUARE_NET, exp_length))
 
 
+class _StandInFmmGrain:
+    """The parts of openMotor's FmmGrain which exported grains rely on"""
+
+    geomName = None
+
+    def __init__(self):
+        self.props = {}
+        self.mapDim = None
+
+    def setProperties(self, props):
+        self.props.update(props)
+
+    def unNormalize(self, value):
+        return value / 2 * self.props["diameter"]
+
+    def mapToArea(self, value):
+        return self.props["diameter"] ** 2 * value / self.mapDim**2
+
+    def simulationSetup(self, map_dim):
+        self.mapDim = map_dim
+        self.generateCoreMap()
+        self.generateRegressionMap()
+
+
+def _stand_in_motorlib() -> Dict[str, types.ModuleType]:
+    """Modules to patch into sys.modules in place of openMotor's motorlib"""
+    grain = types.ModuleType("motorlib.grain")
+    grain.FmmGrain = _StandInFmmGrain
+    motorlib = types.ModuleType("motorlib")
+    motorlib.grain = grain
+    return {"motorlib": motorlib, "motorlib.grain": grain}
+
+
 class Grain2DTest(unittest.TestCase):
     def test_make_simple(self):
         exp_od = 3
@@ -201,7 +385,8 @@ class Grain2DTest(unittest.TestCase):
             ValueError, lambda: Grain2D(0, 1, InhibitedEnds.BOTTOM, TRIANGLE_NET)
         )
         self.assertRaises(
-            ValueError, lambda: Grain2D(-20, 1, InhibitedEnds.BOTTOM, TRIANGLE_NET),
+            ValueError,
+            lambda: Grain2D(-20, 1, InhibitedEnds.BOTTOM, TRIANGLE_NET),
         )
 
     def test_make_invalid_length(self):
@@ -213,7 +398,31 @@ class Grain2DTest(unittest.TestCase):
         )
 
     def test_convert_to_openMotor(self):
-        raise NotImplementedError
+        net = _circle_net(1)
+        grain = Grain2D(4, 10, InhibitedEnds.TOP, net)
+        with mock.patch.dict(sys.modules, _stand_in_motorlib()):
+            exported = grain.to_openMotor_grain()
+        self.assertEqual(
+            {"diameter": 4 * 0.0254, "length": 10 * 0.0254, "inhibitedEnds": "Top"},
+            exported.props,
+        )
+        exported.simulationSetup(201)
+        # a web of 1 inch, and a face of propellant pi * (2^2 - 1^2) square inches
+        self.assertAlmostEqual(0.0254, exported.wallWeb, delta=0.0254 * 0.02)
+        self.assertAlmostEqual(
+            np.pi * 3 * 0.0254**2,
+            exported.faceArea[0],
+            delta=np.pi * 3 * 0.0254**2 * 0.02,
+        )
+        self.assertEqual(0, exported.faceAreaFunc(1))
+        self.assertEqual(
+            np.count_nonzero(
+                ~exported.coreMap & ~np.ma.getmaskarray(exported.regressionMap)
+            ),
+            np.count_nonzero(exported.regressionMap == 0),
+        )
+        with mock.patch.dict(sys.modules, {"motorlib": None, "motorlib.grain": None}):
+            self.assertRaises(ImportError, grain.to_openMotor_grain)
 
     def check_properties(self, exp_od, exp_length, exp_inhibited, exp_net):
         actual = Grain2D(exp_od, exp_length, exp_inhibited, exp_net)
@@ -238,6 +447,21 @@ class Grain3DTest(unittest.TestCase):
         exp_mesh: Mesh = net_to_mesh.net_to_3D_mesh(SQUARE_NET, exp_length)
         self.check_properties(exp_od, exp_length, exp_inhibited, exp_mesh)
 
+    def test_from_trusted(self):
+        with mock.patch.object(constants, "VALIDATE_TRUSTED", False):
+            grain = Grain3D.from_trusted(
+                6, 9, InhibitedEnds.BOTTOM, TRIANGULAR_PRISM_MESH
+            )
+        self.assertEqual(9, grain.length)  # not checked against the mesh
+        self.assertIs(TRIANGULAR_PRISM_MESH, grain.mesh)
+        with mock.patch.object(constants, "VALIDATE_TRUSTED", True):
+            self.assertRaises(
+                ValueError,
+                lambda: Grain3D.from_trusted(
+                    6, 9, InhibitedEnds.BOTTOM, TRIANGULAR_PRISM_MESH
+                ),
+            )
+
     def test_make_invalid_mesh_length(self):  # mesh is invalid for length
         self.assertRaises(
             ValueError,
@@ -275,7 +499,16 @@ class Grain3DTest(unittest.TestCase):
         )
 
     def test_convert_to_openMotor(self):
-        raise NotImplementedError
+        mesh = net_to_mesh.net_to_3D_mesh(SQUARE_NET, 5)
+        grain = Grain3D(4, 5, InhibitedEnds.BOTH, mesh)
+        flat = Grain2D(4, 5, InhibitedEnds.BOTH, SQUARE_NET)
+        with mock.patch.dict(sys.modules, _stand_in_motorlib()):
+            exported = grain.to_openMotor_grain(101)
+            expected = flat.to_openMotor_grain(101)
+            tapered = Grain3D(2.5, 2, InhibitedEnds.BOTH, _tapered_mesh(3, 20))
+            self.assertRaises(ValueError, tapered.to_openMotor_grain)
+        self.assertEqual("Both", exported.props["inhibitedEnds"])
+        np.testing.assert_array_equal(expected.maps[101][0], exported.maps[101][0])
 
     def check_properties(self, exp_od, exp_length, exp_inhibited, exp_mesh):
         actual = grains.Grain3D(exp_od, exp_length, exp_inhibited, exp_mesh)
@@ -285,5 +518,1365 @@ class Grain3DTest(unittest.TestCase):
         self.assertEqual(exp_mesh, actual.mesh)
 
 
+class Grain2DBatchTest(unittest.TestCase):
+    def test_valid_mask(self):
+        batch = Grain2DBatch(
+            [TRIANGLE_NET, SQUARE_NET, SQUARE_NET, TRIANGLE_NET, []],
+            [3, 4, 1, 3, 2],
+            [10, 5, 10, -1, 1],
+            InhibitedEnds.BOTH,
+        )
+        self.assertEqual([True, True, False, False, True], batch.valid_mask().tolist())
+
+    def test_lazy_grains(self):
+        batch = Grain2DBatch(
+            [TRIANGLE_NET, SQUARE_NET],
+            3,
+            [10, 5.1],
+            [InhibitedEnds.NEITHER, InhibitedEnds.TOP],
+        )
+        self.assertEqual(2, len(batch))
+        grain = batch[1]
+        self.assertIs(grain, batch[-1])
+        self.assertEqual(3, grain.outer_diameter)
+        self.assertEqual(5.1, grain.length)
+        self.assertEqual(InhibitedEnds.TOP, grain.inhibited_ends)
+        self.assertEqual(SQUARE_NET, grain.net)
+        self.assertRaises(IndexError, lambda: batch[2])
+        self.assertIs(grain, batch[np.int64(1)])
+        self.assertRaises(TypeError, lambda: batch[1.0])
+        self.assertRaises(TypeError, lambda: batch["1"])
+        sliced = batch[::-1]
+        self.assertIsInstance(sliced, Grain2DBatch)
+        self.assertEqual([SQUARE_NET, TRIANGLE_NET], [g.net for g in sliced])
+        self.assertEqual(0, len(batch[2:]))
+
+    def test_invalid_grain_raises(self):
+        batch = Grain2DBatch([SQUARE_NET], 1, 10, InhibitedEnds.BOTH)
+        self.assertRaises(ValueError, lambda: batch[0])
+
+    def test_mismatched_columns(self):
+        self.assertRaises(
+            ValueError,
+            lambda: Grain2DBatch([TRIANGLE_NET] * 3, [3, 4], 1, InhibitedEnds.BOTH),
+        )
+        self.assertRaises(
+            ValueError,
+            lambda: Grain2DBatch([TRIANGLE_NET] * 2, [[3, 4]], 1, InhibitedEnds.BOTH),
+        )
+        self.assertRaises(
+            ValueError,
+            lambda: Grain2DBatch.from_arrays(
+                np.zeros((6, 2)), [0, 3, 6], 3, np.ones((2, 2)), 1
+            ),
+        )
+
+    def test_from_grains_and_select(self):
+        grains = [
+            Grain2D(3, 10, InhibitedEnds.NEITHER, TRIANGLE_NET),
+            Grain2D(4, 5, InhibitedEnds.BOTH, SQUARE_NET),
+            Grain2D(5, 2, InhibitedEnds.TOP, TRIANGLE_NET),
+        ]
+        batch = Grain2DBatch.from_grains(grains)
+        selected = batch.select([False, True, True])
+        self.assertEqual(2, len(selected))
+        for expected, actual in zip(grains[1:], selected):
+            self.assertEqual(expected.outer_diameter, actual.outer_diameter)
+            self.assertEqual(expected.length, actual.length)
+            self.assertEqual(expected.inhibited_ends, actual.inhibited_ends)
+            self.assertEqual(expected.net, actual.net)
+
+
+def _circle_net(radius: float, n: int = 400) -> Net:
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    return list(zip(radius * np.cos(angles), radius * np.sin(angles)))
+
+
+class GridBurnbackTest(unittest.TestCase):
+    def test_distance_transform(self):
+        features = np.random.default_rng(0).random((30, 40)) < 0.05
+        rows, cols = np.nonzero(features)
+        i, j = np.mgrid[:30, :40]
+        expected = ((i[..., None] - rows) ** 2 + (j[..., None] - cols) ** 2).min(-1)
+        actual = burnback.squared_distance_transform(features)
+        self.assertTrue(np.array_equal(expected, actual))
+
+    def test_rasterize_square(self):
+        port = burnback.rasterize_port([(1, 1), (-1, 1), (-1, -1), (1, -1)], 4, 8)
+        expected = np.zeros((8, 8), dtype=bool)
+        expected[2:6, 2:6] = True
+        self.assertTrue(np.array_equal(expected, port))
+
+    def test_tube(self):
+        outer, inner = 2.0, 0.5
+        regression = burnback.grid_regression(_circle_net(inner), outer, 400, 50)
+        self.assertAlmostEqual(outer / 2 - inner, regression.web[-1], delta=0.01)
+        expected_area = np.pi * (inner + regression.web) ** 2
+        np.testing.assert_allclose(expected_area, regression.port_area, rtol=0.02)
+        expected_perimeter = 2 * np.pi * (inner + regression.web)
+        np.testing.assert_allclose(
+            expected_perimeter[2:-2], regression.perimeter[2:-2], rtol=0.06
+        )
+
+    def test_grain_burnback(self):
+        grain = Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET)
+        regression = grain.burnback(resolution=100, web_steps=20)
+        self.assertEqual(20, len(regression.web))
+        self.assertAlmostEqual(4, regression.port_area[0], delta=0.2)
+        self.assertTrue(np.all(np.diff(regression.port_area) >= 0))
+        self.assertAlmostEqual(np.pi * 4, regression.port_area[-1], delta=0.2)
+
+    def test_empty_net(self):
+        regression = burnback.grid_regression([], 2, 50, 10)
+        self.assertTrue(np.all(regression.port_area == 0))
+        self.assertTrue(np.all(regression.perimeter == 0))
+
+
+class ExactBurnbackTest(unittest.TestCase):
+    def test_square_before_wall(self):
+        square = [(-0.3, -0.3), (0.3, -0.3), (0.3, 0.3), (-0.3, 0.3)]
+        regression = burnback.exact_regression(square, 2, 50)
+        self.assertAlmostEqual(0.7, regression.web[-1], places=5)
+        # until the corner arcs reach the wall, the port is a rounded square
+        early = regression.web < 1 - 0.3 * np.sqrt(2)
+        web = regression.web[early]
+        np.testing.assert_allclose(2.4 + 2 * np.pi * web, regression.perimeter[early])
+        np.testing.assert_allclose(
+            0.36 + 2.4 * web + np.pi * web**2, regression.port_area[early]
+        )
+        self.assertAlmostEqual(np.pi, regression.port_area[-1])
+        self.assertAlmostEqual(0, regression.perimeter[-1])
+
+    def test_orientation(self):
+        net = [(0.5, 0), (0, 0.2), (-0.4, 0), (0, -0.6)]
+        ccw = burnback.exact_regression(net, 2, 20)
+        cw = burnback.exact_regression(net[::-1], 2, 20)
+        np.testing.assert_allclose(ccw.port_area, cw.port_area)
+        np.testing.assert_allclose(ccw.perimeter, cw.perimeter, atol=1e-9)
+
+    def test_perimeter_is_area_derivative(self):
+        angles = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+        radii = 0.3 + 0.15 * np.cos(3 * angles)
+        net = list(zip(radii * np.cos(angles), radii * np.sin(angles)))
+        regression = burnback.exact_regression(net, 2, 200)
+        slope = np.gradient(regression.port_area, regression.web)
+        np.testing.assert_allclose(
+            slope[1:-1], regression.perimeter[1:-1], rtol=0.02, atol=0.05
+        )
+
+    def test_matches_grid(self):
+        grain = Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET)
+        exact = burnback.exact_regression(grain.net, grain.outer_diameter, 30)
+        grid = grain.burnback(resolution=400, web_steps=30)
+        self.assertAlmostEqual(exact.web[-1], grid.web[-1], delta=0.03)
+        np.testing.assert_allclose(
+            exact.port_area, np.interp(exact.web, grid.web, grid.port_area), rtol=0.02
+        )
+
+    def test_many_vertices(self):
+        # rounding leaves slivers of burning surface on nets of many short edges, which
+        # must not keep the grain burning past its burnout
+        for n in (120, 200):
+            net = nets.star_net(n)
+            exact = burnback.exact_regression(net, 2.5, 50)
+            grid = burnback.grid_regression(net, 2.5, 1000, 50)
+            self.assertAlmostEqual(exact.web[-1], grid.web[-1], delta=2.5 / 1000 * 2)
+            self.assertEqual(0, exact.perimeter[-1])
+            np.testing.assert_allclose(
+                exact.port_area,
+                np.interp(exact.web, grid.web, grid.port_area),
+                rtol=0.01,
+            )
+
+    def test_empty_net(self):
+        regression = burnback.exact_regression([], 2, 10)
+        self.assertTrue(np.all(regression.port_area == 0))
+        self.assertTrue(np.all(regression.perimeter == 0))
+
+
+def _vertex_count(grain: grains.Grain) -> float:
+    if isinstance(grain, Grain2D):
+        return len(grain.net) + grain.outer_diameter
+    return 100 * len(grain.mesh) + grain.length
+
+
+class PopulationEvaluatorTest(unittest.TestCase):
+    def test_batch_in_order(self):
+        nets = [SQUARE_NET[:k] for k in range(3, 9)] * 4
+        batch = Grain2DBatch(nets, np.arange(1, 25) * 4.0, 10, InhibitedEnds.BOTH)
+        expected = [len(net) + od for net, od in zip(nets, batch.outer_diameters)]
+        with PopulationEvaluator(_vertex_count, workers=2, chunk_size=5) as evaluator:
+            self.assertEqual(expected, evaluator.evaluate(batch).tolist())
+            # the pool persists between populations
+            self.assertEqual(
+                expected[:3], evaluator.evaluate(batch.select([0, 1, 2])).tolist()
+            )
+
+    def test_mixed_population(self):
+        population = [
+            Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET),
+            Grain3D(10, 10, InhibitedEnds.TOP, TRIANGULAR_PRISM_MESH),
+            Grain2D(4, 10, InhibitedEnds.BOTH, TRIANGLE_NET),
+        ]
+        serial = PopulationEvaluator(_vertex_count, workers=1).evaluate(population)
+        with PopulationEvaluator(_vertex_count, workers=2) as evaluator:
+            parallel = evaluator.evaluate(population)
+            self.assertEqual(0, len(evaluator.evaluate([])))
+        self.assertEqual([12, 610, 7], parallel.tolist())
+        self.assertEqual(serial.tolist(), parallel.tolist())
+
+    def test_several_fitness_functions(self):
+        population = [
+            Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET[:k]) for k in (3, 5)
+        ]
+        fitness = [_vertex_count, _coarse_vertex_count]
+        with PopulationEvaluator(fitness, workers=2) as evaluator:
+            self.assertEqual([7, 9], evaluator.evaluate(population).tolist())
+            self.assertEqual([2, 4], evaluator.evaluate(population, 1).tolist())
+            self.assertRaises(ValueError, evaluator.evaluate, population, 2)
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            PopulationEvaluator(_vertex_count, workers=0)
+        with self.assertRaises(ValueError):
+            PopulationEvaluator(_vertex_count, chunk_size=0)
+
+
+class FitnessCacheTest(unittest.TestCase):
+    def test_canonical_key(self):
+        grain = Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET)
+        shifted = Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET[3:] + SQUARE_NET[:3])
+        reversed_net = Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET[::-1])
+        jittered = Grain2D(
+            4, 10, InhibitedEnds.BOTH, [(x + 1e-12, y) for x, y in SQUARE_NET]
+        )
+        key = cache.canonical_key(grain)
+        for same in (shifted, reversed_net, jittered):
+            self.assertEqual(key, cache.canonical_key(same))
+        for different in (
+            Grain2D(5, 10, InhibitedEnds.BOTH, SQUARE_NET),
+            Grain2D(4, 10, InhibitedEnds.TOP, SQUARE_NET),
+            Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET[:-1]),
+        ):
+            self.assertNotEqual(key, cache.canonical_key(different))
+        prism = Grain3D(10, 10, InhibitedEnds.BOTH, TRIANGULAR_PRISM_MESH)
+        rebuilt = Grain3D(10, 10, InhibitedEnds.BOTH, Mesh(_tri_prism_mesh_map(10)))
+        self.assertEqual(cache.canonical_key(prism), cache.canonical_key(rebuilt))
+
+    def test_lru(self):
+        fitness_cache = FitnessCache(maxsize=2)
+        grains_ = [
+            Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET[:k]) for k in range(3, 6)
+        ]
+        for grain in grains_:
+            fitness_cache.get_or_compute(grain, lambda g: len(g.net))
+        self.assertEqual(2, len(fitness_cache))
+        self.assertNotIn(grains_[0], fitness_cache)
+        self.assertEqual(4, fitness_cache.get_or_compute(grains_[1], None))
+        self.assertEqual((1, 3), (fitness_cache.hits, fitness_cache.misses))
+
+    def test_evaluate_computes_each_grain_once(self):
+        nets = [
+            SQUARE_NET,
+            SQUARE_NET[::-1],
+            TRIANGLE_NET,
+            SQUARE_NET[2:] + SQUARE_NET[:2],
+        ]
+        batch = Grain2DBatch(nets, 4, 10, InhibitedEnds.BOTH)
+        computed = []
+
+        def fitness(grain):
+            computed.append(grain)
+            return len(grain.net)
+
+        fitness_cache = FitnessCache()
+        self.assertEqual([8, 8, 3, 8], fitness_cache.evaluate(batch, fitness).tolist())
+        self.assertEqual(2, len(computed))
+        self.assertEqual(
+            [3, 8], fitness_cache.evaluate(list(batch)[2:], fitness).tolist()
+        )
+        self.assertEqual(2, len(computed))
+        self.assertEqual((4, 2), (fitness_cache.hits, fitness_cache.misses))
+
+    def test_persistence(self):
+        grain = Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fitness.sqlite")
+            first = FitnessCache(path=path)
+            first.put(grain, 1.5)
+            first.close()
+            second = FitnessCache(path=path)
+            self.assertEqual(1.5, second.get_or_compute(grain, None))
+            self.assertEqual(1, second.hits)
+            second.close()
+
+
+class NetsTest(unittest.TestCase):
+    def test_orientation(self):
+        self.assertAlmostEqual(4, nets.signed_area(SQUARE_NET))
+        self.assertAlmostEqual(-4, nets.signed_area(SQUARE_NET[::-1]))
+        self.assertTrue(nets.is_counterclockwise(TRIANGLE_NET))
+
+    def test_min_edge_length(self):
+        self.assertAlmostEqual(1, nets.min_edge_length(SQUARE_NET))
+        self.assertAlmostEqual(1, nets.min_edge_length(TRIANGLE_NET))
+
+    def test_is_simple(self):
+        self.assertTrue(nets.is_simple(SQUARE_NET))
+        self.assertTrue(nets.is_simple(TRIANGLE_NET[::-1]))
+        self.assertFalse(nets.is_simple([(0, 0), (1, 1), (1, 0), (0, 1)]))  # bowtie
+        self.assertFalse(nets.is_simple([(0, 0), (2, 0), (1, 0), (1, 1)]))  # folds back
+        self.assertFalse(nets.is_simple([(0, 0), (2, 0), (1, 0)]))  # degenerate
+        self.assertFalse(  # touches itself
+            nets.is_simple([(0, 0), (2, 0), (2, 2), (1, 0), (0, 2)])
+        )
+        self.assertFalse(nets.is_simple([(0, 0), (1, 0), (1, 0), (0, 1)]))
+        self.assertFalse(nets.is_simple(TRIANGLE_NET[:2]))
+
+    def test_is_simple_sweep(self):
+        angles = np.linspace(0, 2 * np.pi, 500, endpoint=False)
+        radii = 1 + 0.3 * np.sin(7 * angles)
+        star = list(zip(radii * np.cos(angles), radii * np.sin(angles)))
+        self.assertTrue(nets.is_simple(star))
+        star[100], star[101] = star[101], star[100]
+        self.assertFalse(nets.is_simple(star))
+        star[100], star[300] = star[300], star[100]
+        self.assertFalse(nets.is_simple(star))
+
+    def test_check_nets(self):
+        population = [
+            SQUARE_NET,
+            [(0, 0), (1, 1), (1, 0), (0, 1)],
+            TRIANGLE_NET,
+            [],
+            [(0, 0), (0.01, 0), (0, 1)],
+        ]
+        expected = [True, False, True, False, False]
+        self.assertEqual(expected, nets.check_nets(population, 0.1).tolist())
+        batch = Grain2DBatch(population, [4, 4, 1, 4, 4], 10, InhibitedEnds.BOTH)
+        self.assertEqual(
+            [True, False, False, False, True], nets.check_nets(batch).tolist()
+        )
+
+    def test_generators(self):
+        for generate in (nets.star_net, nets.slot_net, nets.finocyl_net):
+            for n in (10, 1000):
+                net = generate(n, jitter=0.05, seed=3)
+                self.assertEqual(n, len(net))
+                self.assertTrue(nets.is_valid_net(net))
+                self.assertTrue(nets.is_counterclockwise(net))
+                self.assertEqual(net, generate(n, jitter=0.05, seed=3))
+        self.assertAlmostEqual(  # a rectangle with semicircular ends
+            1 * 0.5 + np.pi * 0.25**2, nets.signed_area(nets.slot_net(4000)), places=4
+        )
+
+
+class BenchmarksTest(unittest.TestCase):
+    def test_run(self):
+        names = ["net_to_3D_mesh", "is_simple", "import_python"]
+        results = benchmarks.run([10], ["finocyl"], 1, names)
+        self.assertEqual(["net_to_3D_mesh", "is_simple"], [r.name for r in results])
+        self.assertTrue(all(r.seconds > 0 for r in results))
+        results = benchmarks.run([10], ["finocyl"], 1, names, imports=True)
+        self.assertEqual(names, [r.name for r in results])
+        # the inputs of the benchmarks which are not run are never built
+        with mock.patch.object(
+            net_to_mesh, "net_to_3D_mesh", side_effect=AssertionError
+        ):
+            results = benchmarks.run([10], ["finocyl"], 1, ["is_simple"])
+        self.assertEqual(["is_simple"], [r.name for r in results])
+
+    def test_import_times(self):
+        results = benchmarks.import_times(1, ["import_package"])
+        self.assertEqual([("import_package", "import", 0)], [r[:3] for r in results])
+        self.assertGreater(results[0].seconds, 0)
+
+    def test_lazy_package(self):
+        # importing the package imports none of its modules, or NumPy, until they are used
+        code = (
+            "import sys\n"
+            "import mock_grain\n"
+            "assert 'numpy' not in sys.modules and 'mock_grain.grains' not in sys.modules\n"
+            "assert not hasattr(mock_grain, 'Grain2d') and 'numpy' not in sys.modules\n"
+            "from mock_grain import Grain2D\n"
+            "import mock_grain.grains\n"
+            "assert Grain2D is mock_grain.grains.Grain2D\n"
+            "assert 'mock_grain.cache' not in sys.modules and 'grains' not in sys.modules\n"
+            "assert mock_grain.InhibitedEnds is mock_grain.grains.InhibitedEnds\n"
+        )
+        parent = os.path.dirname(os.path.dirname(os.path.abspath(benchmarks.__file__)))
+        subprocess.run([sys.executable, "-c", code], cwd=parent, check=True)
+
+    def test_compare(self):
+        old = benchmarks.to_json(
+            [
+                benchmarks.Result("mesh_init", "star", 10, 1.0, 1),
+                benchmarks.Result("mesh_init", "star", 100, 1.0, 1),
+            ]
+        )
+        new = benchmarks.to_json(
+            [
+                benchmarks.Result("mesh_init", "star", 10, 1.05, 1),
+                benchmarks.Result("mesh_init", "star", 100, 1.5, 1),
+                benchmarks.Result("mesh_init", "slot", 100, 1.0, 1),
+            ]
+        )
+        changes = benchmarks.compare(old, new, threshold=0.1)
+        self.assertEqual([10, 100], [c.size for c in changes])
+        self.assertEqual([False, True], [c.regression for c in changes])
+
+
+def _mean_perimeter(grain: grains.Grain) -> float:
+    return float(np.mean(grain.burnback(resolution=50, web_steps=5).perimeter))
+
+
+class InstrumentationTest(unittest.TestCase):
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+
+    def test_disabled(self):
+        instrumentation.reset()
+        net_to_mesh.net_to_2D_mesh(SQUARE_NET)
+        with instrumentation.timer("block"):
+            instrumentation.count("things")
+        self.assertEqual(
+            {"timers": {}, "counters": {}, "events": []}, instrumentation.snapshot()
+        )
+
+    def test_timers_and_counters(self):
+        instrumentation.enable(trace=True)
+        for _ in range(3):
+            net_to_mesh.net_to_3D_mesh(SQUARE_NET, 5)
+        with instrumentation.timer("block"):
+            instrumentation.count("things", 2)
+        stats = instrumentation.collect()
+        self.assertEqual(3, stats["timers"]["net_to_3D_mesh"]["calls"])
+        self.assertEqual(1, stats["timers"]["block"]["calls"])
+        self.assertEqual({"things": 2}, stats["counters"])
+        trace = instrumentation.to_chrome_trace(stats)["traceEvents"]
+        self.assertEqual(4, sum(event["ph"] == "X" for event in trace))
+        self.assertEqual(
+            {"timers": {}, "counters": {}, "events": []}, instrumentation.snapshot()
+        )
+        merged = instrumentation.merge(stats, stats)
+        self.assertEqual(6, merged["timers"]["net_to_3D_mesh"]["calls"])
+        self.assertEqual({"things": 4}, merged["counters"])
+
+    def test_merges_workers(self):
+        instrumentation.enable()
+        batch = Grain2DBatch([SQUARE_NET, TRIANGLE_NET] * 3, 4, 10, InhibitedEnds.BOTH)
+        with PopulationEvaluator(_mean_perimeter, workers=2, chunk_size=2) as evaluator:
+            evaluator.evaluate(batch)
+        stats = instrumentation.snapshot()
+        self.assertEqual(6, stats["counters"]["grains_evaluated"])
+        self.assertEqual(6, stats["timers"]["fitness"]["calls"])
+        self.assertEqual(6, stats["timers"]["Grain2D.__init__"]["calls"])
+        self.assertEqual(6, stats["timers"]["Grain2D.burnback"]["calls"])
+
+
+class SimplifyTest(unittest.TestCase):
+    def test_douglas_peucker(self):
+        net = [(0, 0), (1, 0.001), (2, 0), (2, 1), (1, 1), (0, 1)]
+        self.assertEqual(
+            [(0, 0), (2, 0), (2, 1), (0, 1)], simplify.douglas_peucker(net, 0.01)
+        )
+        # collinear points are dropped even without tolerance
+        self.assertEqual(5, len(simplify.douglas_peucker(net, 0)))
+        self.assertEqual(3, len(simplify.douglas_peucker(net, 10)))
+        self.assertRaises(ValueError, simplify.douglas_peucker, net, -1)
+
+    def test_visvalingam(self):
+        net = [(0, 0), (1, 0.001), (2, 0), (2, 1), (1, 1), (0, 1)]
+        self.assertEqual(
+            [(0, 0), (2, 0), (2, 1), (0, 1)], simplify.visvalingam(net, 0.01)
+        )
+        self.assertEqual(3, len(simplify.visvalingam(net, 10)))
+        self.assertEqual(4, len(simplify.limit_points(net, 4)))
+        self.assertEqual(net, simplify.limit_points(net, 10))
+        self.assertRaises(ValueError, simplify.limit_points, net, 2)
+
+    def test_resample(self):
+        square = [(0, 0), (1, 0), (1, 1), (0, 1)]
+        self.assertEqual(
+            [(0, 0), (0.5, 0), (1, 0), (1, 0.5), (1, 1), (0.5, 1), (0, 1), (0, 0.5)],
+            simplify.resample(square, 8),
+        )
+        self.assertRaises(ValueError, simplify.resample, square, 2)
+        self.assertRaises(ValueError, simplify.resample, [(0, 0), (0, 0)], 4)
+
+    def test_outer_radius(self):
+        # points on the outer radius must stay within it, despite rounding
+        circle = nets.star_net(997, inner_radius=1, outer_radius=1)
+        for n in (3, 10, 1000, 5000):
+            Grain2D(2, 1, InhibitedEnds.BOTH, simplify.resample(circle, n, 2))
+        self.assertTrue(
+            all(abs(complex(*p)) <= 1 for p in simplify.resample(circle, 5000, 2))
+        )
+
+    def test_batch(self):
+        population = Grain2DBatch(
+            [nets.star_net(500, jitter=0.01, seed=0), nets.slot_net(300)],
+            [2.5, 1.5],
+            10,
+            InhibitedEnds.BOTH,
+        )
+        resampled = simplify.resample_batch(population, 64)
+        self.assertEqual([64, 64], np.diff(resampled.offsets).tolist())
+        np.testing.assert_allclose(
+            simplify.resample(population.net(1), 64, 1.5), resampled.net(1), atol=1e-12
+        )
+        np.testing.assert_array_equal([2.5, 1.5], resampled.outer_diameters)
+        for batch, single in [
+            (
+                simplify.douglas_peucker_batch(population, 0.01),
+                simplify.douglas_peucker,
+            ),
+            (simplify.visvalingam_batch(population, 1e-4), simplify.visvalingam),
+            (simplify.limit_points_batch(population, 40), simplify.limit_points),
+        ]:
+            self.assertTrue(np.all(batch.valid_mask()))
+            parameter = {
+                simplify.douglas_peucker: 0.01,
+                simplify.visvalingam: 1e-4,
+                simplify.limit_points: 40,
+            }[single]
+            self.assertEqual(single(population.net(0), parameter), batch.net(0))
+        np.testing.assert_allclose(
+            [simplify.resample(population.net(0), 16)],
+            simplify.resample_batch([population.net(0)], 16),
+            atol=1e-12,
+        )
+
+
+class IncrementalNetTest(unittest.TestCase):
+    def assertMatchesScratch(self, net: IncrementalNet):
+        scratch = IncrementalNet(list(net))
+        self.assertAlmostEqual(scratch.signed_area, net.signed_area)
+        self.assertAlmostEqual(scratch.perimeter, net.perimeter)
+        self.assertAlmostEqual(scratch.bounding_radius, net.bounding_radius)
+        np.testing.assert_allclose(scratch.centroid, net.centroid, atol=1e-12)
+
+    def test_aggregates(self):
+        net = IncrementalNet([(1, 1), (3, 1), (3, 2), (1, 2)])
+        self.assertEqual(2, net.area)
+        self.assertEqual(6, net.perimeter)
+        self.assertEqual((2, 1.5), net.centroid)
+        self.assertAlmostEqual(13**0.5, net.bounding_radius)
+        self.assertAlmostEqual(5 - 13**0.5, net.web_thickness(10))
+        self.assertEqual(0, IncrementalNet([]).bounding_radius)
+
+    def test_edits(self):
+        net = IncrementalNet(nets.star_net(50, jitter=0.1, seed=0))
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            point = tuple(rng.uniform(-1, 1, 2))
+            kind = rng.integers(3)
+            if kind == 0:
+                net.move(int(rng.integers(len(net))), point)
+            elif kind == 1:
+                net.insert(int(rng.integers(len(net) + 1)), point)
+            elif len(net) > 3:
+                net.delete(int(rng.integers(len(net))))
+            self.assertMatchesScratch(net)
+
+    def test_copy_on_write(self):
+        points = list(SQUARE_NET)
+        net = IncrementalNet(points)
+        copy = net.copy()
+        copy.move(0, (0.5, 0.5))
+        copy.delete(1)
+        self.assertEqual(SQUARE_NET, points)
+        self.assertEqual(SQUARE_NET, list(net))
+        frozen = copy.freeze()
+        copy.insert(0, (0, 0))
+        self.assertEqual(7, len(frozen))
+        self.assertEqual(8, len(copy))
+
+
+class ApplyMutationTest(unittest.TestCase):
+    def test_child(self):
+        parent = Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET)
+        child = parent.apply_mutation(
+            [("move", 0, (-1, -0.5)), ("insert", 4, (-1.5, 0)), ("delete", 1)]
+        )
+        self.assertEqual(SQUARE_NET, parent.net)
+        self.assertEqual(
+            [
+                (-1, -0.5),
+                (0, 1),
+                (-1, 1),
+                (-1.5, 0),
+                (-1, 0),
+                (-1, -1),
+                (0, -1),
+                (1, -1),
+            ],
+            child.net,
+        )
+        self.assertEqual(
+            (parent.outer_diameter, parent.length, parent.inhibited_ends),
+            (child.outer_diameter, child.length, child.inhibited_ends),
+        )
+        self.assertAlmostEqual(nets.signed_area(child.net), child.geometry.signed_area)
+        self.assertAlmostEqual(4, parent.geometry.area)
+
+    def test_geometry_is_a_copy(self):
+        grain = Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET)
+        grain.geometry.move(0, (1.5, 1.5))
+        self.assertAlmostEqual(4, grain.geometry.area)
+        self.assertEqual(SQUARE_NET, grain.apply_mutation([]).net)
+
+    def test_invalid_mutation(self):
+        parent = Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET)
+        self.assertRaises(ValueError, parent.apply_mutation, [("move", 0, (2, 1))])
+        self.assertRaises(ValueError, parent.apply_mutation, [("spin", 0, (0, 0))])
+
+
+def _burnout_web(grain: grains.Grain) -> float:
+    return float(grain.burnback(resolution=100, web_steps=5).web[-1])
+
+
+class SymmetricGrain2DTest(unittest.TestCase):
+    SECTOR: Net = [(1, 0), (0.5, 0.2), (0.4, 0.4)]
+
+    def test_expansion(self):
+        grain = grains.SymmetricGrain2D(4, 10, InhibitedEnds.BOTH, self.SECTOR, 4)
+        self.assertEqual(12, len(grain.net))
+        np.testing.assert_allclose(
+            [(0, 1), (-0.2, 0.5), (-0.4, 0.4)], grain.net[3:6], atol=1e-15
+        )
+        full = Grain2D(4, 10, InhibitedEnds.BOTH, grain.net)
+        self.assertAlmostEqual(full.geometry.area, grain.port_area)
+        self.assertAlmostEqual(full.geometry.perimeter, grain.port_perimeter)
+        self.assertEqual(12, len(grain.mesh))
+
+    def test_exact_burnback(self):
+        grain = grains.SymmetricGrain2D(4, 10, InhibitedEnds.BOTH, self.SECTOR, 4)
+        sector = burnback.exact_regression(grain.net, 4, 20, order=4)
+        full = burnback.exact_regression(grain.net, 4, 20)
+        for a, b in zip(sector, full):
+            np.testing.assert_allclose(a, b, atol=1e-9)
+        # order is only trusted once the net is checked to have that symmetry
+        for net in [grain.net[:-1], [(0.5, 0), (0, 0.2), (-0.4, 0), (0, -0.6)]]:
+            self.assertRaises(
+                ValueError, burnback.exact_regression, net, 4, 20, order=2
+            )
+        self.assertRaises(
+            ValueError, burnback.exact_regression, grain.net, 4, 20, order=3
+        )
+
+    def test_invalid_grain(self):
+        args = (4, 10, InhibitedEnds.BOTH)
+        self.assertRaises(
+            ValueError, grains.SymmetricGrain2D, *args, [(3, 0), (0, 1)], 3
+        )
+        self.assertRaises(ValueError, grains.SymmetricGrain2D, *args, self.SECTOR, 0)
+
+    def test_apply_mutation(self):
+        grain = grains.SymmetricGrain2D(4, 10, InhibitedEnds.BOTH, self.SECTOR, 4)
+        child = grain.apply_mutation([("move", 1, (0.6, 0.1)), ("delete", 2)])
+        self.assertIsInstance(child, grains.SymmetricGrain2D)
+        self.assertEqual(self.SECTOR, grain.sector)
+        self.assertEqual([(1, 0), (0.6, 0.1)], child.sector)
+        self.assertEqual(8, len(child.net))
+
+    def test_evaluator(self):
+        population = [
+            grains.SymmetricGrain2D(4, 10, InhibitedEnds.BOTH, self.SECTOR, 4),
+            Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET),
+        ]
+        expected = [_burnout_web(grain) for grain in population]
+        with PopulationEvaluator(_burnout_web, workers=2) as evaluator:
+            np.testing.assert_allclose(expected, evaluator.evaluate(population))
+
+
+def _coarse_vertex_count(grain: grains.Grain) -> float:
+    return len(grain.net) // 2 * 2
+
+
+def _mean_perimeter_score(regression: burnback.Regression) -> float:
+    return float(np.mean(regression.perimeter))
+
+
+class MultiFidelityTest(unittest.TestCase):
+    def test_promotion(self):
+        population = Grain2DBatch(
+            [SQUARE_NET[:k] for k in range(3, 9)], 4, 10, InhibitedEnds.BOTH
+        )
+        tiers = [
+            Tier(_coarse_vertex_count, keep=0.5),
+            Tier(_vertex_count, keep=0.5, band=1),
+            Tier(_vertex_count),
+        ]
+        result = MultiFidelityEvaluator(tiers).evaluate(population)
+        # 3 of 6 are kept, then the best 2 of 3 and the one within 1 of the worst of them
+        np.testing.assert_array_equal([0, 0, 0, 2, 2, 2], result.tier)
+        np.testing.assert_array_equal([2, 4, 4, 10, 11, 12], result.scores)
+        self.assertEqual([6, 3, 3], [s.evaluated for s in result.stats])
+        self.assertEqual([3, 3, 0], [s.promoted for s in result.stats])
+        self.assertAlmostEqual(
+            np.corrcoef([0, 1, 2], [0, 1, 2])[0, 1], result.stats[1].rank_correlation
+        )
+        self.assertEqual(0, result.stats[1].mean_difference)
+        self.assertTrue(np.isnan(result.stats[2].rank_correlation))
+
+    def test_tied_ranks(self):
+        nets_ = [SQUARE_NET[:k] for k in range(3, 9)]
+        tiers = [Tier(_coarse_vertex_count, keep=1), Tier(_vertex_count)]
+        # coarse scores 2, 4, 4, 6, 6, 8: tied grains share the mean of their ranks,
+        # whichever order they come in
+        expected = np.corrcoef([0, 1.5, 1.5, 3.5, 3.5, 5], np.arange(6))[0, 1]
+        with MultiFidelityEvaluator(tiers, workers=2) as evaluator:
+            for order in (nets_, nets_[::-1]):
+                population = Grain2DBatch(order, 4, 10, InhibitedEnds.BOTH)
+                result = evaluator.evaluate(population)
+                self.assertAlmostEqual(expected, result.stats[0].rank_correlation)
+
+    def test_minimize(self):
+        population = [
+            Grain2D(4, 10, InhibitedEnds.BOTH, SQUARE_NET[:k]) for k in (3, 8)
+        ]
+        tiers = [Tier(_vertex_count, keep=0.5), Tier(_vertex_count)]
+        result = MultiFidelityEvaluator(tiers, maximize=False).evaluate(population)
+        np.testing.assert_array_equal([1, 0], result.tier)
+
+    def test_burnback_tiers(self):
+        population = Grain2DBatch(
+            [nets.star_net(40, arms=3 + i, jitter=0.05, seed=i) for i in range(6)],
+            2.5,
+            10,
+            InhibitedEnds.BOTH,
+        )
+        tiers = [
+            Tier(BurnbackFitness(_mean_perimeter_score, 40, 10, tolerance=0.01), 0.5),
+            Tier(BurnbackFitness(_mean_perimeter_score, 100, 20)),
+        ]
+        with MultiFidelityEvaluator(tiers, workers=2) as evaluator:
+            result = evaluator.evaluate(population)
+        fine = [
+            _mean_perimeter_score(population[i].burnback(100, 20))
+            for i in np.flatnonzero(result.tier == 1)
+        ]
+        np.testing.assert_allclose(fine, result.scores[result.tier == 1])
+        self.assertEqual(3, result.stats[0].promoted)
+
+    def test_invalid_tiers(self):
+        self.assertRaises(ValueError, MultiFidelityEvaluator, [])
+        self.assertRaises(ValueError, MultiFidelityEvaluator, [Tier(_vertex_count, 2)])
+        self.assertRaises(
+            ValueError, MultiFidelityEvaluator, [Tier(_vertex_count, 1, -1)]
+        )
+
+
+def _tapered_mesh(levels: int, n: int) -> Mesh:
+    """A loft of circles about (0, 0), of radius 0.3 + 0.05 z, at z = 0, 1, ..."""
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    rings = [
+        [(r * np.cos(a), r * np.sin(a), float(z)) for a in angles]
+        for z, r in enumerate(0.3 + 0.05 * np.arange(levels))
+    ]
+    mapping = {}
+    for z, ring in enumerate(rings):
+        for i, point in enumerate(ring):
+            mapping[point] = {ring[i - 1], ring[(i + 1) % n]}
+            mapping[point] |= {rings[k][i] for k in (z - 1, z + 1) if 0 <= k < levels}
+    return Mesh(mapping)
+
+
+class VoxelizeTest(unittest.TestCase):
+    def test_prism(self):
+        grain = Grain3D(
+            4, 10, InhibitedEnds.BOTH, net_to_mesh.net_to_3D_mesh(SQUARE_NET, 10)
+        )
+        grid = voxels.voxelize(grain, 40)
+        self.assertEqual((100, 40, 40), grid.occupancy.shape)
+        self.assertEqual((0.1, 0.1), (grid.cell_size, grid.slice_height))
+        expected = ~burnback.rasterize_port(SQUARE_NET, 4, 40) & (
+            burnback.regression_map(SQUARE_NET, 4, 40).inside
+        )
+        for occupancy in grid.occupancy:
+            np.testing.assert_array_equal(expected, occupancy)
+
+    def test_taper(self):
+        grain = Grain3D(2.5, 10, InhibitedEnds.BOTH, _tapered_mesh(11, 200))
+        grid = voxels.voxelize(grain, 128, 64)
+        inside = burnback.regression_map([], 2.5, 128).inside
+        z = (np.arange(64) + 0.5) * grid.slice_height
+        port = np.sum(inside & ~grid.occupancy, axis=(1, 2)) * grid.cell_size**2
+        np.testing.assert_allclose(np.pi * (0.3 + 0.05 * z) ** 2, port, rtol=0.02)
+
+    def test_chunks_and_memmap(self):
+        grain = Grain3D(2.5, 2, InhibitedEnds.BOTH, _tapered_mesh(3, 20))
+        expected = voxels.voxelize(grain, 32).occupancy
+        chunks = list(voxels.iter_voxels(grain, 32, chunk=7))
+        self.assertEqual(list(range(0, len(expected), 7)), [c[0] for c in chunks])
+        self.assertTrue(all(len(c[1]) <= 7 for c in chunks))
+        np.testing.assert_array_equal(expected, np.concatenate([c[1] for c in chunks]))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "voxels.npy")
+            grid = voxels.voxelize(grain, 32, chunk=5, path=path)
+            self.assertIsInstance(grid.occupancy, np.memmap)
+            np.testing.assert_array_equal(expected, np.load(path))
+            del grid
+
+    def test_invalid_grid(self):
+        grain = Grain3D(
+            4, 10, InhibitedEnds.BOTH, net_to_mesh.net_to_3D_mesh(SQUARE_NET, 10)
+        )
+        self.assertRaises(ValueError, voxels.voxelize, grain, 0)
+        self.assertRaises(ValueError, voxels.voxelize, grain, 10, 0)
+        self.assertRaises(ValueError, voxels.voxelize, grain, 10, chunk=0)
+
+
+class Burnback3DTest(unittest.TestCase):
+    TUBE: Net = [
+        (0.5 * np.cos(a), 0.5 * np.sin(a))
+        for a in np.linspace(0, 2 * np.pi, 200, endpoint=False)
+    ]
+
+    def test_extruded_ends(self):
+        mesh = net_to_mesh.net_to_3D_mesh(self.TUBE, 10)
+        initial = {}
+        for ends in InhibitedEnds:
+            grain = Grain3D(2.5, 10, ends, mesh)
+            regression = burnback3d.extruded_regression(grain, 200, 20)
+            initial[ends] = regression.burning_area[0]
+            self.assertAlmostEqual(np.pi * 10 * 0.25, regression.port_volume[0], 1)
+        face = np.pi * (1.25**2 - 0.5**2)
+        self.assertAlmostEqual(
+            face, initial[InhibitedEnds.TOP] - initial[InhibitedEnds.BOTH], 1
+        )
+        self.assertAlmostEqual(
+            initial[InhibitedEnds.TOP], initial[InhibitedEnds.BOTTOM]
+        )
+        self.assertAlmostEqual(
+            2 * face, initial[InhibitedEnds.NEITHER] - initial[InhibitedEnds.BOTH], 1
+        )
+
+    def test_voxels_match_extruded(self):
+        mesh = net_to_mesh.net_to_3D_mesh(self.TUBE, 4)
+        for ends in (InhibitedEnds.BOTH, InhibitedEnds.NEITHER):
+            grain = Grain3D(2.5, 4, ends, mesh)
+            fast = burnback3d.regression_3d(grain, 64, 10)
+            voxels = burnback3d.regression_3d(grain, 64, 10, method="voxel")
+            self.assertAlmostEqual(fast.web[-1], voxels.web[-1], 1)
+            np.testing.assert_allclose(fast.port_volume, voxels.port_volume, rtol=0.05)
+            np.testing.assert_allclose(
+                fast.burning_area[1:-1], voxels.burning_area[1:-1], rtol=0.1
+            )
+
+    def test_taper(self):
+        grain = Grain3D(2.5, 4, InhibitedEnds.BOTH, _tapered_mesh(5, 50))
+        self.assertRaises(ValueError, burnback3d.extruded_regression, grain)
+        with tempfile.TemporaryDirectory() as directory:
+            scratch = os.path.join(directory, "grain")
+            regression = burnback3d.regression_3d(grain, 48, 10, scratch=scratch)
+        self.assertTrue(np.all(np.diff(regression.port_volume) >= 0))
+        self.assertAlmostEqual(np.pi * 1.25**2 * 4, regression.port_volume[-1], 0)
+        self.assertRaises(ValueError, burnback3d.regression_3d, grain, method="bogus")
+
+
+class ArchiveTest(unittest.TestCase):
+    def test_round_trip(self):
+        mesh = net_to_mesh.net_to_3D_mesh(SQUARE_NET, 10)
+        population = [
+            Grain2D(4, 10, InhibitedEnds.TOP, SQUARE_NET),
+            Grain2D(3, 5, InhibitedEnds.NEITHER, TRIANGLE_NET),
+            Grain3D(4, 10, InhibitedEnds.BOTH, mesh),
+            Grain2D(4, 2, InhibitedEnds.BOTTOM, [(0.5, 0), (0, 0.5), (-0.5, 0)]),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "grains.arc")
+            with archive.ArchiveWriter(path) as writer:
+                writer.append(population, [1, 2, 3, 4])
+                writer.append(Grain2DBatch([SQUARE_NET], 5, 1, InhibitedEnds.BOTH))
+            stored = archive.Archive(path)
+            self.assertEqual(5, len(stored))
+            np.testing.assert_array_equal([2, 2, 3, 2, 2], stored.dims)
+            np.testing.assert_array_equal([1, 2, 3, 4, np.nan], stored.fitness)
+            np.testing.assert_array_equal([4, 3, 4, 4, 5], stored.outer_diameters)
+            for expected, actual in zip(population, stored):
+                self.assertIs(type(expected), type(actual))
+                self.assertEqual(expected.length, actual.length)
+                self.assertEqual(expected.inhibited_ends, actual.inhibited_ends)
+            self.assertEqual(SQUARE_NET, stored[0].net)
+            self.assertEqual(SQUARE_NET, stored[-1].net)
+            self.assertEqual(InhibitedEnds.BOTH, stored[-1].inhibited_ends)
+            actual = stored[2].mesh
+            np.testing.assert_array_equal(mesh.vertices, actual.vertices)
+            np.testing.assert_array_equal(mesh.indptr, actual.indptr)
+            np.testing.assert_array_equal(mesh.indices, actual.indices)
+            self.assertFalse(actual.vertices.flags.owndata)
+            self.assertRaises(ValueError, stored.net, 2)
+            self.assertRaises(IndexError, stored.__getitem__, 5)
+            batch = stored.batch()
+            self.assertEqual(4, len(batch))
+            self.assertEqual(TRIANGLE_NET, batch[1].net)
+            del stored, actual, batch
+
+    def test_append_and_truncation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "grains.arc")
+            with archive.ArchiveWriter(path, np.float32) as writer:
+                writer.append([Grain2D(4, 10, InhibitedEnds.TOP, SQUARE_NET)])
+            with archive.ArchiveWriter(path) as writer:
+                writer.append([Grain2D(3, 5, InhibitedEnds.TOP, TRIANGLE_NET)], [7])
+            size = os.path.getsize(path)
+            stored = archive.Archive(path)
+            self.assertEqual(np.float32, stored.dtype)
+            self.assertEqual(2, len(stored))
+            self.assertEqual(np.float32, stored.net(1).dtype)
+            del stored
+            # a block cut short while it was written is ignored
+            with open(path, "r+b") as f:
+                f.truncate(size - 8)
+            stored = archive.Archive(path)
+            self.assertEqual(1, len(stored))
+            self.assertEqual(SQUARE_NET, stored[0].net)
+            del stored
+            # and dropped before anything more is appended
+            with archive.ArchiveWriter(path) as writer:
+                writer.append([Grain2D(3, 5, InhibitedEnds.TOP, TRIANGLE_NET)], [8])
+            stored = archive.Archive(path)
+            np.testing.assert_array_equal([np.nan, 8], stored.fitness)
+            del stored
+
+    def test_float32(self):
+        # rounding to float32 moves the top of a mesh off its length, and points on the
+        # outer wall beyond it, which are snapped back when read
+        mesh = net_to_mesh.net_to_3D_mesh(TRIANGLE_NET, 5.1)
+        population = [
+            Grain3D(4, 5.1, InhibitedEnds.BOTH, mesh),
+            Grain2D(0.2, 1, InhibitedEnds.TOP, [(0.1, 0), (0, 0.1), (-0.1, 0)]),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "grains.arc")
+            with archive.ArchiveWriter(path, np.float32) as writer:
+                writer.append(population)
+                writer.append(
+                    Grain2DBatch([population[1].net], 0.2, 1, InhibitedEnds.TOP)
+                )
+            stored = archive.Archive(path)
+            self.assertEqual(5.1, stored[0].mesh.vertices[:, 2].max())
+            np.testing.assert_allclose(mesh.vertices, stored[0].mesh.vertices, 1e-6)
+            np.testing.assert_allclose(population[1].net, stored[1].net, 1e-6)
+            np.testing.assert_allclose(population[1].net, stored[2].net, 1e-6)
+            self.assertTrue(np.all(stored.batch().valid_mask()))
+            del stored
+
+    def test_invalid(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "grains.arc")
+            self.assertRaises(ValueError, archive.ArchiveWriter, path, np.int32)
+            with archive.ArchiveWriter(path) as writer:
+                grain = Grain2D(4, 10, InhibitedEnds.TOP, SQUARE_NET)
+                self.assertRaises(ValueError, writer.append, [grain], [1, 2])
+                self.assertRaises(ValueError, writer.append, [object()])
+                batch = Grain2DBatch([SQUARE_NET], 1, 10, InhibitedEnds.TOP)
+                self.assertRaises(ValueError, writer.append, batch)
+            other = os.path.join(directory, "other")
+            with open(other, "wb") as f:
+                f.write(b"not an archive of grains")
+            self.assertRaises(ValueError, archive.Archive, other)
+
+
+class CheckpointTest(unittest.TestCase):
+    def test_resume(self):
+        batch = Grain2DBatch([SQUARE_NET, TRIANGLE_NET], 4, 10, InhibitedEnds.TOP)
+        rng = np.random.default_rng(3)
+        cache = FitnessCache()
+        cache.put(batch[0], 1.0)
+        with tempfile.TemporaryDirectory() as directory:
+            with checkpoint.Checkpointer(directory) as checkpointer:
+                checkpointer.checkpoint(0, batch, [1, 2], rng, cache)
+                rng.random(5)
+                expected = rng.bit_generator.state
+                cache.put(batch[1], 2.0)
+                # a surviving grain is not archived again
+                survivors = batch.select([0, 0, 1])
+                checkpointer.checkpoint(1, survivors, [1, 1, 2], rng, cache).result()
+            self.assertEqual(
+                2, len(archive.Archive(os.path.join(directory, "grains.arc")))
+            )
+            restored = FitnessCache()
+            state = checkpoint.resume(directory, restored)
+            self.assertEqual(1, state.generation)
+            self.assertIsInstance(state.population, Grain2DBatch)
+            self.assertEqual(
+                [SQUARE_NET, SQUARE_NET, TRIANGLE_NET],
+                [grain.net for grain in state.population],
+            )
+            np.testing.assert_array_equal([1, 1, 2], state.fitness)
+            self.assertEqual(expected, state.rng.bit_generator.state)
+            np.testing.assert_array_equal(rng.random(3), state.rng.random(3))
+            self.assertEqual(cache.items(), restored.items())
+            first = checkpoint.resume(directory, generation=0)
+            self.assertEqual(2, len(first.population))
+            self.assertRaises(ValueError, checkpoint.resume, directory, generation=5)
+
+    def test_mixed_and_reopened(self):
+        mesh = net_to_mesh.net_to_3D_mesh(SQUARE_NET, 10)
+        population = [
+            Grain2D(4, 10, InhibitedEnds.TOP, SQUARE_NET),
+            Grain3D(4, 10, InhibitedEnds.BOTH, mesh),
+        ]
+        rng = np.random.Generator(np.random.MT19937(5))
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(checkpoint.resume(directory))
+            with checkpoint.Checkpointer(directory) as checkpointer:
+                checkpointer.checkpoint(0, population, [1, 2], rng)
+            # a line of the journal cut short by a crash is ignored, and dropped
+            with open(os.path.join(directory, "journal.jsonl"), "ab") as f:
+                f.write(b'{"generation": 1, "bat')
+            self.assertEqual(0, checkpoint.resume(directory).generation)
+            with checkpoint.Checkpointer(directory) as checkpointer:
+                population.append(Grain2D(3, 5, InhibitedEnds.BOTTOM, TRIANGLE_NET))
+                checkpointer.checkpoint(1, population, [1, 2, 3])
+            self.assertEqual(
+                3, len(archive.Archive(os.path.join(directory, "grains.arc")))
+            )
+            state = checkpoint.resume(directory)
+            self.assertEqual(1, state.generation)
+            self.assertIsNone(state.rng)
+            self.assertEqual(
+                [Grain2D, Grain3D, Grain2D], list(map(type, state.population))
+            )
+            np.testing.assert_array_equal(
+                mesh.indices, state.population[1].mesh.indices
+            )
+            self.assertEqual(TRIANGLE_NET, state.population[2].net)
+            state = checkpoint.resume(directory, generation=0)
+            self.assertEqual(rng.random(), state.rng.random())
+
+    def test_bit_generators(self):
+        grain = Grain2D(4, 10, InhibitedEnds.TOP, SQUARE_NET)
+        for name in ["PCG64", "PCG64DXSM", "MT19937", "Philox", "SFC64"]:
+            with self.subTest(name), tempfile.TemporaryDirectory() as directory:
+                rng = np.random.Generator(getattr(np.random, name)(7))
+                rng.random(3)
+                rng.integers(10, dtype=np.uint32)  # leaves half a draw buffered
+                with checkpoint.Checkpointer(directory) as checkpointer:
+                    checkpointer.checkpoint(0, [grain], [1], rng)
+                resumed = checkpoint.resume(directory).rng
+                self.assertIsInstance(resumed.bit_generator, getattr(np.random, name))
+                self.assertEqual(
+                    rng.integers(1 << 30, size=5, dtype=np.uint32).tolist(),
+                    resumed.integers(1 << 30, size=5, dtype=np.uint32).tolist(),
+                )
+                np.testing.assert_array_equal(rng.random(5), resumed.random(5))
+
+    def test_float32(self):
+        mesh = net_to_mesh.net_to_3D_mesh(SQUARE_NET, 5.1)
+        population = [Grain3D(4, 5.1, InhibitedEnds.BOTH, mesh)]
+        with tempfile.TemporaryDirectory() as directory:
+            with checkpoint.Checkpointer(directory, np.float32) as checkpointer:
+                checkpointer.checkpoint(0, population, [1])
+            grain = checkpoint.resume(directory).population[0]
+            self.assertEqual(5.1, grain.mesh.vertices[:, 2].max())
+
+    def test_invalid(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with checkpoint.Checkpointer(directory) as checkpointer:
+                grain = Grain2D(4, 10, InhibitedEnds.TOP, SQUARE_NET)
+                self.assertRaises(ValueError, checkpointer.checkpoint, 0, [grain], [])
+
+
+class InterningTest(unittest.TestCase):
+    def test_intern_points(self):
+        # noise straddling the edge of a cell of the grid does not split a vertex
+        points = np.array(
+            [[0, 0], [1, 0], [-1e-12, 1e-12], [4e-9 - 1e-12, 0], [4e-9 + 1e-12, 0]]
+        )
+        vertices, ids = interning.intern_points(points)
+        np.testing.assert_array_equal([0, 1, 0, 2, 2], ids)
+        np.testing.assert_array_equal(points[[0, 1, 3]], vertices)
+        _, ids = interning.intern_points(points, 0)
+        np.testing.assert_array_equal([0, 1, 2, 3, 4], ids)
+        _, ids = interning.intern_points(np.array([[0.0, 0.0], [-0.0, 0.0]]), 0)
+        np.testing.assert_array_equal([0, 0], ids)
+        _, ids = interning.intern_points(points, 1e-6)
+        np.testing.assert_array_equal([0, 1, 0, 0, 0], ids)
+        self.assertRaises(ValueError, interning.intern_points, points, -1)
+        self.assertRaises(ValueError, interning.intern_points, np.zeros(3))
+
+    def test_welded_mapping(self):
+        exact = net_to_mesh.net_to_2D_mesh(SQUARE_NET)
+        noisy = {
+            (x + 1e-13, y): {(u - 1e-13, v) for u, v in adjacent}
+            for (x, y), adjacent in exact.items()
+        }
+        self.assertRaises(ValueError, Mesh, noisy)
+        mesh = Mesh(noisy, tolerance=1e-9)
+        self.assertEqual(len(exact), len(mesh))
+        np.testing.assert_allclose(exact.vertices, mesh.vertices, atol=1e-12)
+        np.testing.assert_array_equal(
+            np.arange(len(exact)), mesh.find(exact.vertices[:, :2] - 1e-12)
+        )
+        np.testing.assert_array_equal([-1], mesh.find(np.array([[5.0, 5.0]])))
+        self.assertRaises(ValueError, mesh.find, exact.vertices)
+
+    def test_merge(self):
+        bottom = net_to_mesh.net_to_3D_mesh(SQUARE_NET, 1)
+        vertices = bottom.vertices + [0, 0, 1 + 1e-12]
+        top = Mesh.from_trusted(vertices, bottom.indptr, bottom.indices, 3)
+        merged = Mesh.merge([bottom, top])
+        self.assertEqual(3 * len(SQUARE_NET), len(merged))
+        middle = merged[(1.0, 0.0, 1.0)]
+        self.assertEqual(
+            {
+                (1.0, 1.0, 1.0),
+                (1.0, -1.0, 1.0),
+                (1.0, 0.0, 0.0),
+                (1.0, 0.0, 2.0 + 1e-12),
+            },
+            middle,
+        )
+        self.assertEqual(len(bottom), len(Mesh.merge([bottom, bottom])))
+        flat = net_to_mesh.net_to_2D_mesh(SQUARE_NET)
+        self.assertRaises(ValueError, Mesh.merge, [bottom, flat])
+        self.assertRaises(ValueError, Mesh.merge, [])
+
+
+class OpenMotorExporterTest(unittest.TestCase):
+    def test_cache(self):
+        grain = Grain2D(4, 10, InhibitedEnds.TOP, SQUARE_NET)
+        rotated = Grain2D(4, 10, InhibitedEnds.TOP, SQUARE_NET[3:] + SQUARE_NET[:3])
+        other = Grain2D(4, 10, InhibitedEnds.TOP, TRIANGLE_NET)
+        exporter = openmotor.OpenMotorExporter(map_dim=101)
+        with mock.patch.dict(sys.modules, _stand_in_motorlib()):
+            exported = exporter.export_batch([grain, rotated, other])
+            batch = Grain2DBatch([SQUARE_NET], 4, 10, InhibitedEnds.TOP)
+            self.assertIs(exported[0], exporter.export_batch(batch)[0])
+        self.assertIs(exported[0], exported[1])
+        self.assertIsNot(exported[0], exported[2])
+        self.assertEqual((2, 2), (len(exporter), exporter.hits))
+        # the maps computed on export are those of the simulation
+        maps = exported[0].maps[101]
+        exported[0].simulationSetup(101)
+        self.assertIs(maps[1], exported[0].regressionMap)
+        exporter.clear()
+        self.assertEqual(0, len(exporter))
+
+    def test_maps(self):
+        net = [(0.9, 0.9), (-0.9, 0.9), (-0.9, -0.9), (0.9, -0.9)]
+        core, regression = openmotor.openmotor_maps(net, 4, 5)
+        # samples at -2, -1, 0, 1 and 2 inches along each axis, with only (0, 0) in the port
+        expected = np.ones((5, 5), dtype=bool)
+        expected[2, 2] = False
+        np.testing.assert_array_equal(expected, core)
+        self.assertTrue(regression.mask[0, 0])
+        self.assertFalse(regression.mask[2, 0])
+        # two samples, of half the outer radius each, less half a sample to the surface
+        self.assertEqual(0.75, regression[2, 0])
+        self.assertRaises(ValueError, openmotor.openmotor_maps, net, 4, 1)
+
+    def test_reused_regression_map(self):
+        net = [(0.9, 0.9), (-0.9, 0.9), (-0.9, -0.9), (0.9, -0.9)]
+        computed = openmotor.openmotor_maps(net, 4, 5)
+        field = burnback.regression_map(net, 5, 5)
+        with mock.patch.object(openmotor, "regression_map", side_effect=AssertionError):
+            core, regression = openmotor.openmotor_maps(net, 4, 5, field)
+            grain = Grain2D(4, 10, InhibitedEnds.TOP, net)
+            with mock.patch.dict(sys.modules, _stand_in_motorlib()):
+                exported = openmotor.OpenMotorExporter(5).export(grain, field)
+                self.assertRaises(
+                    ValueError, openmotor.to_openMotor_grain, grain, None, field
+                )
+        np.testing.assert_array_equal(computed[0], core)
+        np.testing.assert_array_equal(computed[1].mask, regression.mask)
+        np.testing.assert_array_equal(computed[1].compressed(), regression.compressed())
+        np.testing.assert_array_equal(core, exported.maps[5][0])
+        # a map of the cells spanning the outer diameter, as of Grain2D.burnback
+        other = burnback.regression_map(net, 4, 5)
+        self.assertRaises(ValueError, openmotor.openmotor_maps, net, 4, 5, other)
+
+
+class BallisticsTest(unittest.TestCase):
+    PROPELLANT = ballistics.Propellant(
+        1841.0, 3.517e-05, 0.3205, 1.1361, 1600.0, 0.0399
+    )
+    NOZZLE = ballistics.Nozzle(0.6, 1.5)
+
+    def setUp(self):
+        bates = nets.star_net(64, 8, 0.5, 0.5)
+        self.bates = Grain2D(3.0, 5.0, InhibitedEnds.NEITHER, bates)
+        self.star = Grain2D(
+            3.0, 5.0, InhibitedEnds.BOTH, nets.star_net(20, 5, 0.4, 0.9)
+        )
+
+    def test_mass_balance(self):
+        # with a quasi-steady pressure, the exhaust through the throat is the propellant burnt
+        curves = {}
+        result = ballistics.simulate(
+            [[self.bates] * 4],
+            self.PROPELLANT,
+            self.NOZZLE,
+            resolution=128,
+            curves=curves,
+        )
+        curve = next(iter(curves.values()))
+        mass = 4 * np.trapezoid(curve.burning_area, curve.web) * 0.0254**3 * 1841.0
+        throat = np.pi * (0.6 * 0.0254) ** 2 / 4
+        c_star = ballistics.characteristic_velocity(self.PROPELLANT)
+        exhaust = np.sum(result.pressure * throat / c_star) * 1e-3
+        self.assertAlmostEqual(1, exhaust / mass, places=3)
+        self.assertAlmostEqual(result.burn_time[0], result.time[-1] + 1e-3)
+        self.assertGreater(result.total_impulse[0], 0)
+
+    def test_population(self):
+        # identical grains are burnt back once, and motors simulated together are
+        # simulated as they are alone
+        curves = {}
+        motors = [self.star, [self.bates, self.bates], [self.star, self.bates]]
+        together = ballistics.simulate(
+            motors, self.PROPELLANT, self.NOZZLE, resolution=64, curves=curves
+        )
+        self.assertEqual(2, len(curves))
+        for i, motor in enumerate(motors):
+            alone = ballistics.simulate(
+                [motor], self.PROPELLANT, self.NOZZLE, resolution=64, curves=curves
+            )
+            steps = alone.time.size
+            np.testing.assert_allclose(alone.pressure[0], together.pressure[i, :steps])
+            np.testing.assert_allclose(alone.thrust[0], together.thrust[i, :steps])
+            self.assertEqual(alone.burn_time[0], together.burn_time[i])
+            self.assertTrue(np.all(together.thrust[i, steps:] == 0))
+        batch = Grain2DBatch.from_grains([self.star, self.bates])
+        result = ballistics.simulate(
+            batch, self.PROPELLANT, self.NOZZLE, resolution=64, curves=curves
+        )
+        self.assertEqual((2,), result.total_impulse.shape)
+
+    def test_invalid(self):
+        simulate = ballistics.simulate
+        self.assertRaises(ValueError, simulate, [[]], self.PROPELLANT, self.NOZZLE)
+        nozzles = [self.NOZZLE] * 2
+        self.assertRaises(ValueError, simulate, [self.star], self.PROPELLANT, nozzles)
+        nozzle = ballistics.Nozzle(1.5, 0.6)
+        self.assertRaises(ValueError, simulate, [self.star], self.PROPELLANT, nozzle)
+        propellant = self.PROPELLANT._replace(n=1.0)
+        self.assertRaises(ValueError, simulate, [self.star], propellant, self.NOZZLE)
+        self.assertRaises(
+            ValueError, simulate, [self.star], self.PROPELLANT, self.NOZZLE, dt=0
+        )
+        # 2D grains are always rasterized
+        self.assertRaises(ValueError, ballistics.burn_curve, self.star, method="exact")
+
+
+class SpatialIndexTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.points = rng.normal(size=(400, 3))
+        self.queries = np.concatenate([rng.normal(size=(50, 3)), [[40.0, 0, 0]]])
+        self.distances = np.linalg.norm(
+            self.queries[:, None] - self.points[None], axis=2
+        )
+
+    def test_query(self):
+        index = spatial.SpatialIndex(self.points)
+        indices, distances = index.query(self.queries, 4)
+        np.testing.assert_allclose(np.sort(self.distances, axis=1)[:, :4], distances)
+        np.testing.assert_allclose(
+            np.take_along_axis(self.distances, indices, axis=1), distances
+        )
+        nearest, distance = index.nearest(self.points[:10] + 1e-6)
+        np.testing.assert_array_equal(np.arange(10), nearest)
+        self.assertRaises(ValueError, index.query, self.queries, 0)
+        self.assertRaises(ValueError, index.query, self.queries, 401)
+        self.assertRaises(ValueError, index.query, self.queries[:, :2])
+
+    def test_within(self):
+        for cell_size in (None, 0.05):
+            index = spatial.SpatialIndex(self.points, cell_size)
+            offsets, indices = index.within(self.queries, 0.5)
+            for i, distances in enumerate(self.distances):
+                found = indices[offsets[i] : offsets[i + 1]]
+                np.testing.assert_array_equal(
+                    np.flatnonzero(distances <= 0.5), np.sort(found)
+                )
+                self.assertTrue(np.all(np.diff(distances[found]) >= 0))
+        pairs = index.pairs(0.3)
+        i, j = np.nonzero(
+            np.triu(
+                np.linalg.norm(self.points[:, None] - self.points, axis=2) <= 0.3, 1
+            )
+        )
+        self.assertEqual(
+            set(zip(i.tolist(), j.tolist())), set(map(tuple, pairs.tolist()))
+        )
+        self.assertRaises(ValueError, index.within, self.queries, -1)
+        self.assertRaises(ValueError, spatial.SpatialIndex, self.points, 0)
+
+    def test_mesh(self):
+        grain = Grain3D(12, 10, InhibitedEnds.NEITHER, TRIANGULAR_PRISM_MESH)
+        index = grain.mesh.spatial_index
+        self.assertIs(index, grain.mesh.spatial_index)
+        nearest, _ = index.nearest(np.array([[2.1, -1.7, 9.9]]))
+        np.testing.assert_array_equal([2, -1.75, 10], grain.mesh.vertices[nearest[0]])
+        self.assertAlmostEqual(6 - np.hypot(2, 1.75), grain.wall_clearance())
+
+
+class PipelineTest(unittest.TestCase):
+    @staticmethod
+    def grain(net: Net) -> Grain2D:
+        return Grain2D(2, 1, InhibitedEnds.NEITHER, net)
+
+    def test_stages(self):
+        # invalid candidates are dropped where they are constructed, and the rest keep
+        # their order
+        radii = [0.5, 2.0, 0.6, 0.5, 0.7, 3.0, 0.6]
+        nets_ = (nets.star_net(12, 3, r / 2, r) for r in radii)
+        cache = FitnessCache()
+        stream = (
+            pipeline.Pipeline(nets_, maxsize=2)
+            .map(self.grain, name="construct")
+            .filter(lambda grain: grain.outer_diameter > 1, name="check")
+            .evaluate(lambda grain: max(x for x, _ in grain.net), cache, batch_size=3)
+        )
+        scored = list(stream)
+        np.testing.assert_allclose(
+            [0.5, 0.6, 0.5, 0.7, 0.6], [s.fitness for s in scored]
+        )
+        self.assertIsInstance(scored[0].grain, Grain2D)
+        self.assertEqual(2, cache.hits)
+        stats = {s.name: s for s in stream.stats()}
+        self.assertEqual(7, stats["source"].emitted)
+        self.assertEqual((7, 5, 2), stats["construct"][1:4])
+        self.assertEqual((5, 5, 0), stats["evaluate"][1:4])
+        self.assertLessEqual(stats["construct"].max_queue_depth, 2)
+        self.assertRaises(ValueError, list, stream)
+        self.assertRaises(ValueError, stream.map, self.grain)
+
+    def test_backpressure(self):
+        # a slow consumer holds the source back, rather than the whole source being read
+        produced = []
+
+        def source():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+
+        stream = pipeline.Pipeline(source(), maxsize=4).map(lambda i: i + 1)
+        items = iter(stream)
+        self.assertEqual(1, next(items))
+        time.sleep(0.2)
+        # two queues of four, and an item held by each of the two threads
+        self.assertLessEqual(len(produced), 12)
+        items.close()
+        self.assertLess(len(produced), 20)
+
+    def test_failure(self):
+        def fail(i):
+            if i == 3:
+                raise RuntimeError("stage failed")
+            return i
+
+        stream = pipeline.Pipeline(range(10)).map(fail)
+        with self.assertRaises(RuntimeError):
+            list(stream)
+        self.assertRaises(ValueError, pipeline.Pipeline, [], 0)
+
+
 if __name__ == "__main__":
     unittest.main()
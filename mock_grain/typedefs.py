@@ -1,5 +1,5 @@
 """Convenient type aliases for types used elsewhere in mock_grain"""
-from typing import List, Tuple, TypeVar
+from typing import List, Tuple, TypeVar, Union
 
 Point2D = Tuple[float, float]
 Point3D = Tuple[float, float, float]
@@ -13,3 +13,7 @@ Polygon = List[
 # polygons must have at least 3 points
 Net = Polygon
 # TODO: consider making nets or polygons classes: they definitely have check-able invariants
+# the invariants of nets can be checked with the functions of nets.py, e.g. is_valid_net
+# an edit of a net by Grain2D.apply_mutation: ("move", i, point), ("insert", i, point) or
+# ("delete", i)
+Edit = Union[Tuple[str, int, Point2D], Tuple[str, int]]
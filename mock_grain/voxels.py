@@ -0,0 +1,199 @@
+"""
+Voxelizing 3D grains: turning the port surface of a Grain3D mesh into a grid of the cells
+occupied by propellant, bounded by the outer diameter and length of the grain.
+
+Meshes are read as lofts of rings, as net_to_3D_mesh builds them: the edges between
+vertices of the same z-value form the rings of the port at that z-value, and edges between
+vertices of consecutive z-values join the rings. Between two z-values, each point of the
+lower ring moves linearly along its edge to the upper ring, or stays put if it has none.
+"""
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import instrumentation
+from .burnback import rasterize_port
+from .grains import Grain3D
+from .mesh import Mesh
+
+
+class Voxels(NamedTuple):
+    """The propellant occupancy grid of a 3D grain"""
+
+    # (slices, resolution, resolution) boolean grid, indexed [slice (z), row (y),
+    # column (x)], of the cells whose centers are propellant: inside the outer diameter
+    # and outside the port; the grid spans the outer diameter and the length of the grain
+    occupancy: np.ndarray
+    cell_size: float  # side length of a cell across the grain
+    slice_height: float  # height of a cell along the grain
+
+
+class Loft(NamedTuple):
+    """The rings of a mesh, by z-value, and how each vertex moves up to the next one"""
+
+    levels: np.ndarray  # sorted distinct z-values of the vertices
+    rings: List[List[np.ndarray]]  # vertex indices of each ring, at each z-value
+    xy: np.ndarray  # (N, 2) x and y of each vertex
+    up: np.ndarray  # (N,) vertex each vertex moves to at the next z-value, or itself
+
+
+def read_loft(mesh: Mesh) -> Loft:
+    """
+    Read a mesh as a loft of rings, as net_to_3D_mesh builds them
+
+    :param mesh: the mesh
+    :return: the rings of the mesh at each z-value, and how its vertices move up
+    """
+    vertices, indptr, indices = mesh.vertices, mesh.indptr, mesh.indices
+    levels, level = np.unique(vertices[:, 2], return_inverse=True)
+    rows = np.repeat(np.arange(len(vertices)), np.diff(indptr))
+    up = np.arange(len(vertices))
+    rising = level[indices] == level[rows] + 1
+    up[rows[rising]] = indices[rising]
+    # walk the edges within each z-value: every vertex on a ring has two such neighbors
+    flat = level[indices] == level[rows]
+    neighbors: List[List[int]] = [[] for _ in range(len(vertices))]
+    for u, v in zip(rows[flat].tolist(), indices[flat].tolist()):
+        neighbors[u].append(v)
+    rings: List[List[np.ndarray]] = [[] for _ in levels]
+    seen = np.zeros(len(vertices), dtype=bool)
+    for start in range(len(vertices)):
+        if seen[start] or len(neighbors[start]) != 2:
+            continue
+        ring = [start]
+        seen[start] = True
+        previous, current = start, neighbors[start][0]
+        while current != start and not seen[current] and len(neighbors[current]) == 2:
+            ring.append(current)
+            seen[current] = True
+            a, b = neighbors[current]
+            previous, current = current, (b if a == previous else a)
+        if len(ring) >= 3:
+            rings[level[start]].append(np.array(ring))
+    return Loft(levels, rings, vertices[:, :2], up)
+
+
+def _slice_port(
+    loft: Loft, span: int, t: float, outer_diameter: float, resolution: int
+) -> np.ndarray:
+    """Rasterize the port a fraction t of the way from one z-value of a loft to the next"""
+    port = np.zeros((resolution, resolution), dtype=bool)
+    for ring in loft.rings[span]:
+        points = loft.xy[ring] + t * (loft.xy[loft.up[ring]] - loft.xy[ring])
+        # by the even-odd rule, as for the points of a single net
+        port ^= rasterize_port(points, outer_diameter, resolution)
+    return port
+
+
+def is_prismatic(loft: Loft, span: int) -> bool:
+    """
+    :param loft: the loft
+    :param span: index of a z-value of the loft, below its last
+    :return: whether the port does not change between that z-value and the next
+    """
+    return all(
+        np.array_equal(loft.xy[ring], loft.xy[loft.up[ring]])
+        for ring in loft.rings[span]
+    )
+
+
+def _grid(grain: Grain3D, resolution: int, slices: Optional[int]) -> Tuple[float, int]:
+    if resolution < 1:
+        raise ValueError("Must have a positive resolution")
+    cell = grain.outer_diameter / resolution
+    if slices is None:
+        slices = max(1, round(grain.length / cell))
+    if slices < 1:
+        raise ValueError("Must have a positive number of slices")
+    return cell, slices
+
+
+def iter_voxels(
+    grain: Grain3D,
+    resolution: int = 256,
+    slices: Optional[int] = None,
+    chunk: int = 64,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Voxelize a 3D grain a chunk of slices at a time, so that only one chunk is ever held
+    in memory
+
+    :param grain: the grain to voxelize
+    :param resolution: number of cells along each side of every slice, spanning the outer
+                       diameter
+    :param slices: number of slices along the length of the grain, by default enough for
+                   cells about as tall as they are wide
+    :param chunk: greatest number of slices in a chunk
+    :return: the index of the first slice of each chunk, and the occupancy of its slices
+             as in Voxels, from the bottom of the grain up
+    :raises ValueError: if resolution, slices or chunk is not positive
+    """
+    cell, slices = _grid(grain, resolution, slices)
+    if chunk < 1:
+        raise ValueError("Must have a positive chunk size")
+    loft = read_loft(grain.mesh)
+    height = grain.length / slices
+    centers = (np.arange(resolution) + 0.5) * cell - grain.outer_diameter / 2
+    inside = (
+        centers[:, None] ** 2 + centers[None, :] ** 2 <= (grain.outer_diameter / 2) ** 2
+    )
+    z = (np.arange(slices) + 0.5) * height
+    span = np.clip(np.searchsorted(loft.levels, z, side="right") - 1, 0, None)
+    gaps = np.diff(loft.levels, append=np.inf)
+    t = np.clip((z - loft.levels[span]) / gaps[span], 0, 1)
+    # slices are in order of span, so the slice of the last span the port does not change
+    # over is rasterized once and kept until the next
+    last_span, last_slice = -1, None
+    for first in range(0, slices, chunk):
+        stop = min(first + chunk, slices)
+        occupancy = np.empty((stop - first, resolution, resolution), dtype=bool)
+        for k in range(first, stop):
+            s = int(span[k])
+            if s != last_span:
+                last_span, last_slice = s, None
+                if is_prismatic(loft, s):
+                    last_slice = inside & ~_slice_port(
+                        loft, s, 0.0, grain.outer_diameter, resolution
+                    )
+            if last_slice is not None:
+                occupancy[k - first] = last_slice
+            else:
+                occupancy[k - first] = inside & ~_slice_port(
+                    loft, s, t[k], grain.outer_diameter, resolution
+                )
+        yield first, occupancy
+
+
+@instrumentation.timed()
+def voxelize(
+    grain: Grain3D,
+    resolution: int = 256,
+    slices: Optional[int] = None,
+    chunk: int = 64,
+    path: Optional[str] = None,
+) -> Voxels:
+    """
+    Voxelize a 3D grain into a propellant occupancy grid
+
+    :param grain: the grain to voxelize
+    :param resolution: number of cells along each side of every slice, spanning the outer
+                       diameter
+    :param slices: number of slices along the length of the grain, by default enough for
+                   cells about as tall as they are wide
+    :param chunk: number of slices voxelized at a time
+    :param path: if provided, the occupancy grid is written to a memory-mapped .npy file
+                 at this path as it is voxelized, rather than held in memory
+    :return: the occupancy grid of the grain
+    :raises ValueError: if resolution, slices or chunk is not positive
+    """
+    cell, slices = _grid(grain, resolution, slices)
+    shape = (slices, resolution, resolution)
+    if path is None:
+        occupancy = np.empty(shape, dtype=bool)
+    else:
+        occupancy = np.lib.format.open_memmap(path, mode="w+", dtype=bool, shape=shape)
+    for first, part in iter_voxels(grain, resolution, slices, chunk):
+        occupancy[first : first + len(part)] = part
+    if path is not None:
+        occupancy.flush()
+    return Voxels(occupancy, cell, grain.length / slices)